@@ -1,32 +1,201 @@
+import asyncio
 import os
+import sys
+import threading
 import time
-from datetime import datetime
-from typing import Any, List
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Callable,
+    Coroutine,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Set,
+)
 
 from dotenv import load_dotenv
-from fireworks.client import Fireworks
-from sentence_transformers import CrossEncoder
+from pymongo.collection import Collection
 
+from utils.async_mongo_driver import AsyncMongoDriver
+from utils.chunk_data import count_tokens, get_chunk_id
+from utils.context_packing import pack_context, with_rerank_scores
+from utils.generate_embeddings import get_embedding_model
+from utils.local_index import LocalVectorIndex, SearchBackend
 from utils.mongo_driver import MongoDriver
+from utils.rerank import Reranker
+from utils.streaming import AnswerStream, AsyncAnswerStream, StreamStats
+from utils.tracing import traced, tracer, with_current_context
+
+if TYPE_CHECKING:
+    from fireworks.client import AsyncFireworks, Fireworks
 
 load_dotenv()
 
-# Initializing the Fireworks AI client and the model string
-fw_client = Fireworks()
+# The Fireworks AI model string
 model = "accounts/fireworks/models/llama-v3-8b-instruct"
 
-MONGODB_URI = os.getenv("MONGODB_URI")
-assert isinstance(MONGODB_URI, str)
-mongodb_driver = MongoDriver(MONGODB_URI)
-mongodb_client = mongodb_driver.client
-# Check the connection to the server
-pong = mongodb_client.admin.command("ping")
-if pong["ok"] == 1:
-    print("MongoDB connection successful")
-
 COLLECTION_NAME = "knowledge_base"
-history_collection = mongodb_driver.client[mongodb_driver.db_name]["chat_history"]
-history_collection.create_index("session_id")
+
+# Retrieved context is packed into at most this many tokens
+CONTEXT_TOKEN_BUDGET = 1500
+
+# Only the latest messages of a session that fit a token budget are sent to the LLM
+HISTORY_MAX_MESSAGES = 20
+HISTORY_TOKEN_BUDGET = 1500
+# Older messages are folded into the session summary this many at a time
+SUMMARY_BATCH_MESSAGES = 10
+HISTORY_PROJECTION = {"_id": 0, "role": 1, "content": 1, "timestamp": 1}
+
+# Chat history and answer cache writes scheduled off the critical path, see
+# `_run_in_background`
+background_tasks: Set[asyncio.Task] = set()
+# Session summaries are updated off the critical path, see `roll_up_in_background`
+_roll_up_executor = ThreadPoolExecutor(1, thread_name_prefix="roll-up")
+
+# Clients are created on first use rather than at import time, so that importing
+# this module is cheap; call `warm_up` to create them ahead of the first request
+_clients: Dict[str, Any] = {}
+_clients_lock = threading.RLock()
+
+
+def _get_client(name: str, create: Callable[[], Any]) -> Any:
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            # Another thread may have created the client while we were waiting
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = create()
+    return client
+
+
+def _create_fw_client() -> "Fireworks":
+    from fireworks.client import Fireworks
+
+    return Fireworks()
+
+
+def _create_async_fw_client() -> "AsyncFireworks":
+    from fireworks.client import AsyncFireworks
+
+    return AsyncFireworks()
+
+
+def _create_mongodb_driver() -> MongoDriver:
+    MONGODB_URI = os.getenv("MONGODB_URI")
+    assert isinstance(MONGODB_URI, str)
+    return MongoDriver(
+        MONGODB_URI, vector_encoding=os.getenv("VECTOR_ENCODING", "float64")
+    )
+
+
+def _create_history_collection() -> Collection:
+    driver = get_mongodb_driver()
+    collection = driver.client[driver.db_name]["chat_history"]
+    # Serves "latest messages of a session" queries without an in-memory sort
+    collection.create_index([("session_id", 1), ("timestamp", -1)])
+    return collection
+
+
+def _create_async_mongodb_driver() -> AsyncMongoDriver:
+    # asyncio client for the `*_async` answer functions, sharing the driver's caches
+    MONGODB_URI = os.getenv("MONGODB_URI")
+    assert isinstance(MONGODB_URI, str)
+    return AsyncMongoDriver(get_mongodb_driver(), MONGODB_URI)
+
+
+def _create_search_backend() -> SearchBackend:
+    # Retrieve from Atlas Vector Search, or from a local index when SEARCH_BACKEND=local
+    if os.getenv("SEARCH_BACKEND") == "local":
+        return LocalVectorIndex(
+            os.getenv("LOCAL_INDEX_DIR", ".local_index"),
+            mode=os.getenv("LOCAL_INDEX_MODE", "exact"),
+            rerank_limit=int(os.getenv("LOCAL_INDEX_RERANK_LIMIT", "20")),
+        )
+    return get_mongodb_driver()
+
+
+def get_fw_client() -> "Fireworks":
+    return _get_client("fw_client", _create_fw_client)
+
+
+def get_async_fw_client() -> "AsyncFireworks":
+    return _get_client("async_fw_client", _create_async_fw_client)
+
+
+def get_mongodb_driver() -> MongoDriver:
+    return _get_client("mongodb_driver", _create_mongodb_driver)
+
+
+def get_history_collection() -> Collection:
+    return _get_client("history_collection", _create_history_collection)
+
+
+def get_summary_collection() -> Collection:
+    # Rolled-up summaries of the messages that fell out of the history window
+    driver = get_mongodb_driver()
+    return driver.client[driver.db_name]["chat_summaries"]
+
+
+def get_async_mongodb_driver() -> AsyncMongoDriver:
+    return _get_client("async_mongodb_driver", _create_async_mongodb_driver)
+
+
+def get_async_history_collection():
+    driver = get_async_mongodb_driver()
+    return driver.client[driver.db_name]["chat_history"]
+
+
+def get_async_summary_collection():
+    driver = get_async_mongodb_driver()
+    return driver.client[driver.db_name]["chat_summaries"]
+
+
+def get_search_backend() -> SearchBackend:
+    return _get_client("search_backend", _create_search_backend)
+
+
+def warm_up(background: bool = True) -> Optional[threading.Thread]:
+    """
+    Create the clients and load the models before the first request needs them.
+
+    Args:
+        background (bool): Warm up in a daemon thread and return immediately.
+
+    Returns:
+        Optional[threading.Thread]: The warm-up thread, when run in the background.
+    """
+
+    def run() -> None:
+        # Check the connection to the server
+        pong = get_mongodb_driver().client.admin.command("ping")
+        if pong["ok"] == 1:
+            print("MongoDB connection successful")
+        get_history_collection()
+        get_search_backend()
+        get_fw_client()
+        get_embedding_model()
+        _ = reranker.model
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+# Cross-encoder used to re-rank retrieved documents, loaded once on first use
+reranker = Reranker(cache_size=10_000)
+
+# Latency of the most recent streamed answers, see `utils.streaming.summarize_stream_stats`
+stream_stats: Deque[StreamStats] = deque(maxlen=1000)
 
 
 # Define a function to create the user prompt for our RAG application
@@ -41,54 +210,91 @@ def create_prompt(user_query: str) -> str:
         str: The chat prompt string.
     """
     # Retrieve the most relevant documents for the `user_query` using the `vector_search` method
-    context = mongodb_driver.vector_search(COLLECTION_NAME, user_query)
-    # Join the retrieved documents into a single string, where each document is separated by two new lines ("\n\n")
-    context = "\n\n".join([doc.get("body") for doc in context])
+    context = get_search_backend().vector_search(COLLECTION_NAME, user_query)
+    # Pack the retrieved documents into a single string within the token budget, where each passage is separated by two new lines ("\n\n")
+    context = pack_context(context, CONTEXT_TOKEN_BUDGET)
     # Prompt consisting of the question and relevant context to answer it
     prompt = f"Answer the question based only on the following context. If the context is empty, say I DON'T KNOW\n\nContext:\n{context}\n\nQuestion:{user_query}"
     return prompt
 
 
 # Add a re-ranking step to the following function
-def create_prompt_2(user_query: str) -> str:
+def retrieve_context_2(user_query: str) -> List[Dict]:
     """
-    Create a chat prompt that includes the user query and retrieved context.
+    Retrieve documents relevant to the user query and re-rank them.
 
     Args:
         user_query (str): The user's query string.
 
     Returns:
-        str: The chat prompt string.
+        List[Dict]: The top re-ranked documents with their reranker `score`.
     """
-    rerank_model = CrossEncoder("mixedbread-ai/mxbai-rerank-xsmall-v1")
     # Retrieve the most relevant documents for the `user_query` using the `vector_search` function defined in Step 8
-    context = mongodb_driver.vector_search(COLLECTION_NAME, user_query)
+    # As many candidates as tuned for re-ranking are retrieved
+    context = get_search_backend().vector_search(
+        COLLECTION_NAME, user_query, rerank=True
+    )
     # Extract the "body" field from each document in `context`
     documents = [d.get("body") for d in context]
-    # Use the `rerank_model` instantiated above to re-rank `documents`
+    # Use the shared `reranker` to re-rank `documents`
     # Set the `top_k` argument to 5
-    reranked_documents = rerank_model.rank(
-        user_query, documents, return_documents=True, top_k=5
-    )
-    # Join the re-ranked documents into a single string, where each document is separated by two new lines ("\n\n")
-    context = "\n\n".join([d.get("text", "") for d in reranked_documents])  # type: ignore
-    # Prompt consisting of the question and relevant context to answer it
-    prompt = f"Answer the question based only on the following context. If the context is empty, say I DON'T KNOW\n\nContext:\n{context}\n\nQuestion:{user_query}"
+    with tracer.span("rerank", candidates=len(documents), top_k=5):
+        reranked_documents = reranker.rank(user_query, documents, top_k=5)
+    return with_rerank_scores(context, reranked_documents)
+
+
+@traced("create_prompt_2")
+def create_prompt_2(user_query: str, context: Optional[List[Dict]] = None) -> str:
+    """
+    Create a chat prompt that includes the user query and retrieved context.
+
+    Args:
+        user_query (str): The user's query string.
+        context (Optional[List[Dict]]): Re-ranked documents, retrieved if omitted.
+
+    Returns:
+        str: The chat prompt string.
+    """
+    if context is None:
+        context = retrieve_context_2(user_query)
+    # Pack the re-ranked documents into a single string within the token budget, where each passage is separated by two new lines ("\n\n")
+    with tracer.span("pack_context", documents=len(context)) as span:
+        packed_context = pack_context(context, CONTEXT_TOKEN_BUDGET)
+        # Prompt consisting of the question and relevant context to answer it
+        prompt = f"Answer the question based only on the following context. If the context is empty, say I DON'T KNOW\n\nContext:\n{packed_context}\n\nQuestion:{user_query}"
+        if span.recording:
+            span.set(prompt_tokens=count_tokens(prompt))
     return prompt
 
 
+def _answer_cache_key(user_query: str, context: List[Dict]) -> tuple:
+    # Answers are reused for similar queries over exactly the same chunks
+    query_embedding = get_mongodb_driver().get_query_embedding(user_query)
+    return COLLECTION_NAME, query_embedding, [get_chunk_id(d) for d in context]
+
+
 # Define a function to answer user queries using Fireworks' Chat Completion API
-def generate_answer(user_query: str) -> None:
+def generate_answer(user_query: str) -> str:
     """
-    Generate an answer to the user query.
+    Generate an answer to the user query, reusing a cached answer when possible.
 
     Args:
         user_query (str): The user's query string.
+
+    Returns:
+        str: The generated answer.
     """
-    # Use the `create_prompt` function above to create a chat prompt
-    prompt = create_prompt_2(user_query)
+    context = retrieve_context_2(user_query)
+    # Near-identical questions over the same retrieved chunks skip the LLM call
+    cache_key = _answer_cache_key(user_query, context)
+    answer = get_mongodb_driver().answer_cache.lookup(*cache_key)
+    if answer is not None:
+        return answer
+
+    # Use the `create_prompt_2` function above to create a chat prompt
+    prompt = create_prompt_2(user_query, context)
     # Use the `prompt` created above to populate the `content` field in the chat message
-    response: Any = fw_client.chat.completions.create(
+    response: Any = get_fw_client().chat.completions.create(
         model=model,
         messages=[
             {
@@ -97,7 +303,9 @@ def generate_answer(user_query: str) -> None:
             }
         ],
     )
-    return response.choices[0].message.content
+    answer = response.choices[0].message.content
+    get_mongodb_driver().answer_cache.store(*cache_key, answer)
+    return answer
 
 
 # Define a function to answer user queries in streaming mode using Fireworks' Chat Completion API
@@ -108,18 +316,38 @@ def generate_answer_2(user_query: str) -> None:
     Args:
         user_query (str): The user's query string.
     """
-    # Use the `create_prompt` function defined in Step 9 to create a chat prompt
-    prompt = create_prompt_2(user_query)
-    # Use the `prompt` created above to populate the `content` field in the chat message
-    # Set the `stream` parameter to True
-    response = fw_client.chat.completions.create(
-        model=model, messages=[{"role": "user", "content": prompt}], stream=True
-    )
+    # Use the `stream_answer` function to stream the answer
+    stream = stream_answer(user_query)
+    # Iterate through the `stream` and print the deltas as they are generated
+    for delta in stream:
+        print(delta, end="")
+    print(f"\n{stream.stats.as_dict()}")
+
+
+def _history_documents(session_id: str, messages: List[Dict]) -> List[Dict]:
+    # BSON dates have millisecond precision, so space the messages out to keep
+    # their order when sorting on `timestamp`
+    timestamp = datetime.now()
+    return [
+        {
+            "session_id": session_id,
+            "role": message["role"],
+            "content": message["content"],
+            "timestamp": timestamp + timedelta(milliseconds=i),
+        }
+        for i, message in enumerate(messages)
+    ]
+
+
+def store_chat_messages(session_id: str, messages: List[Dict]) -> None:
+    """
+    Store chat messages in a MongoDB collection with a single insert.
 
-    # Iterate through the `response` generator and print the results as they are generated
-    for chunk in response:
-        if chunk.choices[0].delta.content:
-            print(chunk.choices[0].delta.content, end="")
+    Args:
+        session_id (str): Session ID of the messages.
+        messages (List[Dict]): Messages as `{"role": <role>, "content": <content>}`.
+    """
+    get_history_collection().insert_many(_history_documents(session_id, messages))
 
 
 def store_chat_message(session_id: str, role: str, content: str) -> None:
@@ -131,91 +359,548 @@ def store_chat_message(session_id: str, role: str, content: str) -> None:
         role (str): Role for the message. One of `system`, `user` or `assistant`.
         content (str): Content of the message.
     """
-    # Create a message object with `session_id`, `role`, `content` and `timestamp` fields
-    # `timestamp` should be set the current timestamp
-    message = {
-        "session_id": session_id,
-        "role": role,
-        "content": content,
-        "timestamp": datetime.now(),
-    }
-    # Insert the `message` into the `history_collection` collection
-    history_collection.insert_one(message)
+    store_chat_messages(session_id, [{"role": role, "content": content}])
+
+
+def _fit_token_budget(recent_messages: List[Dict], token_budget: int) -> List[Dict]:
+    # Keep the newest messages that fit the budget, returned oldest first
+    kept = []
+    used = 0
+    for message in recent_messages:
+        used += count_tokens(message["content"])
+        if used > token_budget:
+            break
+        kept.append({"role": message["role"], "content": message["content"]})
+    return kept[::-1]
 
 
-def retrieve_session_history(session_id: str) -> List:
+def _unsent_history(session_id: str) -> Dict:
+    # Messages that are folded into the summary are never sent again
+    return {"session_id": session_id, "summarized": {"$ne": True}}
+
+
+def retrieve_session_history(
+    session_id: str,
+    max_messages: int = HISTORY_MAX_MESSAGES,
+    token_budget: int = HISTORY_TOKEN_BUDGET,
+) -> List:
     """
-    Retrieve chat message history for a particular session.
+    Retrieve the most recent chat messages of a session that fit a token budget.
 
     Args:
         session_id (str): Session ID to retrieve chat message history for.
+        max_messages (int): Maximum number of messages to retrieve.
+        token_budget (int): Maximum number of tokens across the returned messages.
 
     Returns:
-        List: List of chat messages.
+        List: List of chat messages, oldest first.
     """
-    # Query the `history_collection` collection for documents where the "session_id" field has the value of the input `session_id`
-    # Sort the results in increasing order of the values in `timestamp` field
-    cursor = history_collection.find({"session_id": session_id}).sort("timestamp", 1)
+    # Query the `chat_history` collection for the latest messages of the session,
+    # newest first, using the (session_id, timestamp) index
+    cursor = (
+        get_history_collection()
+        .find(_unsent_history(session_id), HISTORY_PROJECTION)
+        .sort("timestamp", -1)
+        .limit(max_messages)
+    )
+    return _fit_token_budget(list(cursor), token_budget)
 
-    if cursor:
-        # Iterate through the cursor and extract the `role` and `content` field from each entry
-        # Then format each entry as: {"role": <role_value>, "content": <content_value>}
-        messages = [{"role": msg["role"], "content": msg["content"]} for msg in cursor]
-    else:
-        # If cursor is empty, return an empty list
-        messages = []
 
-    return messages
+def retrieve_session_summary(session_id: str) -> Optional[str]:
+    """
+    Retrieve the summary of the messages that fell out of a session's history window.
 
+    Args:
+        session_id (str): Session ID to retrieve the summary for.
 
-def generate_answer_3(session_id: str, user_query: str) -> None:
+    Returns:
+        Optional[str]: The summary, or None if the session has none yet.
     """
-    Generate an answer to the user's query taking chat history into account.
+    summary = get_summary_collection().find_one({"_id": session_id})
+    return summary["summary"] if summary else None
+
+
+@traced("roll_up_history")
+def roll_up_session_history(session_id: str) -> None:
+    """
+    Fold the messages that won't be sent with the next turn into the summary.
+
+    A message isn't sent once it falls out of the history window or the token
+    budget. Nothing happens while every unsummarized message is still sent;
+    otherwise the oldest messages are folded, leaving room for at least
+    `SUMMARY_BATCH_MESSAGES` new ones, so the summarization call is amortized
+    over many turns.
+
+    Args:
+        session_id (str): Session ID to roll up.
+    """
+    # Unsummarized messages, newest first
+    messages = list(
+        get_history_collection()
+        .find(_unsent_history(session_id), HISTORY_PROJECTION)
+        .sort("timestamp", -1)
+    )
+    sent = len(_fit_token_budget(messages[:HISTORY_MAX_MESSAGES], HISTORY_TOKEN_BUDGET))
+    if sent == len(messages):
+        return
+    keep = min(sent, max(0, HISTORY_MAX_MESSAGES - SUMMARY_BATCH_MESSAGES))
+    older_messages = messages[keep:][::-1]
+
+    summary = get_summary_collection().find_one({"_id": session_id}) or {}
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in older_messages)
+    prompt = f"Update the summary of a conversation with the new messages below. Keep it under 200 words.\n\nSummary:\n{summary.get('summary', '')}\n\nNew messages:\n{transcript}"
+    response: Any = get_fw_client().chat.completions.create(
+        model=model, messages=[{"role": "user", "content": prompt}]
+    )
+    until = older_messages[-1]["timestamp"]
+    get_summary_collection().update_one(
+        {"_id": session_id},
+        {"$set": {"summary": response.choices[0].message.content, "until": until}},
+        upsert=True,
+    )
+    get_history_collection().update_many(
+        {"session_id": session_id, "timestamp": {"$lte": until}},
+        {"$set": {"summarized": True}},
+    )
+
+
+def _report_roll_up_error(future: Future) -> None:
+    error = future.exception()
+    if error is not None:
+        print(f"Failed to roll up session history: {error!r}", file=sys.stderr)
+
+
+def roll_up_in_background(session_id: str) -> Future:
+    """
+    Schedule `roll_up_session_history` off the request path.
+
+    Roll-ups run one at a time, so two turns of a session never summarize the
+    same messages twice.
+
+    Args:
+        session_id (str): Session ID to roll up.
+
+    Returns:
+        Future: Completes once the roll-up has finished.
+    """
+    # The roll-up joins the trace of the request that scheduled it
+    future = _roll_up_executor.submit(
+        with_current_context(roll_up_session_history), session_id
+    )
+    future.add_done_callback(_report_roll_up_error)
+    return future
+
+
+def _system_message(context: str, summary: Optional[str]) -> Dict:
+    content = f"Answer the question based only on the following context. If the context is empty, say I DON'T KNOW\n\nContext:\n{context}"
+    if summary:
+        content += f"\n\nSummary of the earlier conversation:\n{summary}"
+    return {"role": "system", "content": content}
+
+
+def session_messages(session_id: str, user_query: str, context: str) -> List[Dict]:
+    """
+    Build the chat messages for a new turn of a session: a system prompt with
+    the context and the summary of older turns, the recent history and the
+    user message.
 
     Args:
         session_id (str): Session ID to retrieve chat history for.
         user_query (str): The user's query string.
+        context (str): Packed context to answer the query from.
+
+    Returns:
+        List[Dict]: Messages to pass to the chat completion model.
     """
-    # Initialize list of messages to pass to the chat completion model
-    messages = []
+    # Create a system prompt containing the retrieved context and the summary of older turns
+    with tracer.span("session_summary"):
+        summary = retrieve_session_summary(session_id)
+    # Use the `retrieve_session_history` function to retrieve the recent message history from MongoDB for the session ID `session_id`
+    with tracer.span("session_history") as span:
+        message_history = retrieve_session_history(session_id)
+        span.set(messages=len(message_history))
+    # The role value for user messages must be "user"
+    return [
+        _system_message(context, summary),
+        *message_history,
+        {"role": "user", "content": user_query},
+    ]
 
+
+def store_session_turn(session_id: str, user_query: str, answer: str) -> None:
+    """
+    Store the user message and the generated answer in the session's history,
+    and fold older messages into the session summary in the background.
+
+    Args:
+        session_id (str): Session ID of the turn.
+        user_query (str): The user's query string.
+        answer (str): The generated answer.
+    """
+    # The role value for user messages is "user", and "assistant" for the generated answer
+    with tracer.span("store_history"):
+        store_chat_messages(
+            session_id,
+            [
+                {"role": "user", "content": user_query},
+                {"role": "assistant", "content": answer},
+            ],
+        )
+    # Summarizing older messages takes an LLM call, so it doesn't hold up the answer
+    roll_up_in_background(session_id)
+
+
+def answer_with_history(
+    session_id: str, user_query: str, retrieve: Callable[[str], List[Dict]]
+) -> str:
+    """
+    Answer the user's query taking chat history into account, and store the turn.
+
+    Args:
+        session_id (str): Session ID to retrieve chat history for.
+        user_query (str): The user's query string.
+        retrieve (Callable[[str], List[Dict]]): Retrieve the documents relevant
+            to the query, best first.
+
+    Returns:
+        str: The generated answer.
+    """
     # Retrieve documents relevant to the user query and convert them to a single string
-    context = mongodb_driver.vector_search(COLLECTION_NAME, user_query)
-    context = "\n\n".join([d.get("body", "") for d in context])
-    # Create a system prompt containing the retrieved context
-    system_message = {
-        "role": "system",
-        "content": f"Answer the question based only on the following context. If the context is empty, say I DON'T KNOW\n\nContext:\n{context}",
-    }
-    # Append the system prompt to the `messages` list
-    messages.append(system_message)
-
-    # Use the `retrieve_session_history` function to retrieve message history from MongoDB for the session ID `session_id`
-    # And add all messages in the message history to the `messages` list
-    message_history = retrieve_session_history(session_id)
-    messages.extend(message_history)
-
-    # Format the user message in the format {"role": <role_value>, "content": <content_value>}
-    # The role value for user messages must be "user"
-    # And append the user message to the `messages` list
-    user_message = {"role": "user", "content": user_query}
-    messages.append(user_message)
+    context = retrieve(user_query)
+    with tracer.span("pack_context", documents=len(context)):
+        context = pack_context(context, CONTEXT_TOKEN_BUDGET)
+    messages = session_messages(session_id, user_query, context)
 
     # Call the chat completions API
-    response = fw_client.chat.completions.create(model=model, messages=messages)
+    with tracer.span("llm", model=model) as span:
+        if span.recording:
+            span.set(prompt_tokens=sum(count_tokens(m["content"]) for m in messages))
+        response = get_fw_client().chat.completions.create(
+            model=model, messages=messages
+        )
 
     # Extract the answer from the API response
     answer = response.choices[0].message.content  # type: ignore
 
-    # Use the `store_chat_message` function to store the user message and also the generated answer in the message history collection
-    # The role value for user messages is "user", and "assistant" for the generated answer
-    store_chat_message(session_id, "user", user_query)
-    store_chat_message(session_id, "assistant", answer)
+    # Use the `store_session_turn` function to store the user message and also the generated answer in the message history collection
+    store_session_turn(session_id, user_query, answer)
+    return answer
+
+
+@traced("generate_answer_3")
+def generate_answer_3(session_id: str, user_query: str) -> str:
+    """
+    Generate an answer to the user's query taking chat history into account.
 
+    Args:
+        session_id (str): Session ID to retrieve chat history for.
+        user_query (str): The user's query string.
+
+    Returns:
+        str: The generated answer.
+    """
+    answer = answer_with_history(
+        session_id,
+        user_query,
+        lambda query: get_search_backend().vector_search(COLLECTION_NAME, query),
+    )
     print(answer)
+    return answer
+
+
+def stream_answer(user_query: str, session_id: Optional[str] = None) -> AnswerStream:
+    """
+    Stream the answer to the user query, yielding text deltas as they arrive.
+
+    Without a session the answer is based on the re-ranked context only and is
+    served from the answer cache when possible. With a session the recent chat
+    history is taken into account, and the user message and the assembled
+    answer are stored in the history once the stream finishes.
+
+    Args:
+        user_query (str): The user's query string.
+        session_id (Optional[str]): Session ID to retrieve and store chat history for.
+
+    Returns:
+        AnswerStream: Iterable of deltas; its `stats` hold the time to first
+        token, tokens per second and total latency once it is exhausted.
+    """
+    stats = StreamStats()
+    context = retrieve_context_2(user_query)
+
+    if session_id is None:
+        cache_key = _answer_cache_key(user_query, context)
+        answer = get_mongodb_driver().answer_cache.lookup(*cache_key)
+        if answer is not None:
+            return AnswerStream([answer], lambda _: stream_stats.append(stats), stats)
+        messages = [{"role": "user", "content": create_prompt_2(user_query, context)}]
+
+        def on_complete(answer: str) -> None:
+            stream_stats.append(stats)
+            get_mongodb_driver().answer_cache.store(*cache_key, answer)
+
+    else:
+        messages = session_messages(
+            session_id, user_query, pack_context(context, CONTEXT_TOKEN_BUDGET)
+        )
+
+        def on_complete(answer: str) -> None:
+            stream_stats.append(stats)
+            store_session_turn(session_id, user_query, answer)
+
+    # Set the `stream` parameter to True
+    response = get_fw_client().chat.completions.create(
+        model=model, messages=messages, stream=True
+    )
+    return AnswerStream(response, on_complete, stats)
+
+
+async def vector_search_async(user_query: str, rerank: bool = False) -> List:
+    """
+    Retrieve relevant documents for a user query without blocking the event loop.
+
+    Args:
+        user_query (str): The user's query string.
+        rerank (bool): Retrieve the tuned number of candidates to re-rank.
+
+    Returns:
+        List: A list of matching documents.
+    """
+    if get_search_backend() is get_mongodb_driver():
+        return await get_async_mongodb_driver().vector_search(
+            COLLECTION_NAME, user_query, rerank=rerank
+        )
+    return await asyncio.to_thread(
+        get_search_backend().vector_search, COLLECTION_NAME, user_query, rerank=rerank
+    )
+
+
+async def retrieve_context_2_async(user_query: str) -> List[Dict]:
+    """
+    Retrieve documents relevant to the user query and re-rank them.
+
+    Args:
+        user_query (str): The user's query string.
+
+    Returns:
+        List[Dict]: The top re-ranked documents with their reranker `score`.
+    """
+    context = await vector_search_async(user_query, rerank=True)
+    documents = [d.get("body") for d in context]
+    # The cross-encoder is CPU bound, so it runs in a worker thread
+    reranked_documents = await asyncio.to_thread(
+        reranker.rank, user_query, documents, 5
+    )
+    return with_rerank_scores(context, reranked_documents)
+
+
+async def create_prompt_2_async(user_query: str) -> str:
+    """
+    Create a chat prompt that includes the user query and re-ranked context.
+
+    Args:
+        user_query (str): The user's query string.
+
+    Returns:
+        str: The chat prompt string.
+    """
+    return create_prompt_2(user_query, await retrieve_context_2_async(user_query))
+
+
+async def generate_answer_async(user_query: str) -> str:
+    """
+    Generate an answer to the user query.
+
+    Args:
+        user_query (str): The user's query string.
+
+    Returns:
+        str: The generated answer.
+    """
+    prompt = await create_prompt_2_async(user_query)
+    response: Any = await get_async_fw_client().chat.completions.acreate(
+        model=model, messages=[{"role": "user", "content": prompt}], stream=False
+    )
+    return response.choices[0].message.content
+
+
+async def retrieve_session_history_async(
+    session_id: str,
+    max_messages: int = HISTORY_MAX_MESSAGES,
+    token_budget: int = HISTORY_TOKEN_BUDGET,
+) -> List:
+    """
+    Retrieve the most recent chat messages of a session that fit a token budget.
+
+    Args:
+        session_id (str): Session ID to retrieve chat message history for.
+        max_messages (int): Maximum number of messages to retrieve.
+        token_budget (int): Maximum number of tokens across the returned messages.
+
+    Returns:
+        List: List of chat messages, oldest first.
+    """
+    cursor = (
+        get_async_history_collection()
+        .find(_unsent_history(session_id), HISTORY_PROJECTION)
+        .sort("timestamp", -1)
+        .limit(max_messages)
+    )
+    return _fit_token_budget(await cursor.to_list(), token_budget)
+
+
+async def retrieve_session_summary_async(session_id: str) -> Optional[str]:
+    summary = await get_async_summary_collection().find_one({"_id": session_id})
+    return summary["summary"] if summary else None
+
+
+async def store_chat_messages_async(session_id: str, messages: List[Dict]) -> None:
+    """
+    Store chat messages in a MongoDB collection with a single insert, then fold
+    older messages into the session summary if needed.
+
+    Args:
+        session_id (str): Session ID of the messages.
+        messages (List[Dict]): Messages as `{"role": <role>, "content": <content>}`.
+    """
+    await get_async_history_collection().insert_many(
+        _history_documents(session_id, messages)
+    )
+    await asyncio.wrap_future(roll_up_in_background(session_id))
+
+
+def _run_in_background(coroutine: Coroutine) -> None:
+    # Keep a reference to the task so it isn't garbage collected before it finishes
+    task = asyncio.create_task(coroutine)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+def _store_in_background(session_id: str, messages: List[Dict]) -> None:
+    _run_in_background(store_chat_messages_async(session_id, messages))
+
+
+async def _cached_stream(answer: str) -> AsyncIterator[str]:
+    yield answer
+
+
+async def wait_for_background_writes() -> None:
+    """
+    Wait for pending chat history and answer cache writes, e.g. before shutting down.
+    """
+    if background_tasks:
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+
+
+async def generate_answer_3_async(session_id: str, user_query: str) -> str:
+    """
+    Generate an answer to the user's query taking chat history into account.
+
+    Retrieval and the history lookup run concurrently, and the new messages
+    are written to the history after the answer is returned.
+
+    Args:
+        session_id (str): Session ID to retrieve chat history for.
+        user_query (str): The user's query string.
+
+    Returns:
+        str: The generated answer.
+    """
+    context, message_history, summary = await asyncio.gather(
+        vector_search_async(user_query),
+        retrieve_session_history_async(session_id),
+        retrieve_session_summary_async(session_id),
+    )
+    context = pack_context(context, CONTEXT_TOKEN_BUDGET)
+    messages = [
+        _system_message(context, summary),
+        *message_history,
+        {"role": "user", "content": user_query},
+    ]
+
+    response: Any = await get_async_fw_client().chat.completions.acreate(
+        model=model, messages=messages, stream=False
+    )
+    answer = response.choices[0].message.content
+
+    _store_in_background(
+        session_id,
+        [
+            {"role": "user", "content": user_query},
+            {"role": "assistant", "content": answer},
+        ],
+    )
+    return answer
+
+
+async def stream_answer_async(
+    user_query: str, session_id: Optional[str] = None
+) -> AsyncAnswerStream:
+    """
+    Stream the answer to the user query, yielding text deltas as they arrive.
+
+    Like `stream_answer`, but retrieval, the history lookup and the completion
+    don't block the event loop, and the messages and the answers to cache are
+    stored in the background.
+
+    Args:
+        user_query (str): The user's query string.
+        session_id (Optional[str]): Session ID to retrieve and store chat history for.
+
+    Returns:
+        AsyncAnswerStream: Async iterable of deltas; its `stats` are complete
+        once it is exhausted.
+    """
+    stats = StreamStats()
+    if session_id is None:
+        context = await retrieve_context_2_async(user_query)
+        # Served from the answer cache when possible, like `stream_answer`
+        cache_key = await asyncio.to_thread(_answer_cache_key, user_query, context)
+        answer = await asyncio.to_thread(
+            get_mongodb_driver().answer_cache.lookup, *cache_key
+        )
+        if answer is not None:
+            return AsyncAnswerStream(
+                _cached_stream(answer), lambda _: stream_stats.append(stats), stats
+            )
+        messages = [{"role": "user", "content": create_prompt_2(user_query, context)}]
+    else:
+        context, message_history, summary = await asyncio.gather(
+            retrieve_context_2_async(user_query),
+            retrieve_session_history_async(session_id),
+            retrieve_session_summary_async(session_id),
+        )
+        messages = [
+            _system_message(pack_context(context, CONTEXT_TOKEN_BUDGET), summary),
+            *message_history,
+            {"role": "user", "content": user_query},
+        ]
+
+    def on_complete(answer: str) -> None:
+        stream_stats.append(stats)
+        if session_id is None:
+            _run_in_background(
+                asyncio.to_thread(
+                    get_mongodb_driver().answer_cache.store, *cache_key, answer
+                )
+            )
+        else:
+            _store_in_background(
+                session_id,
+                [
+                    {"role": "user", "content": user_query},
+                    {"role": "assistant", "content": answer},
+                ],
+            )
+
+    response: Any = get_async_fw_client().chat.completions.acreate(
+        model=model, messages=messages, stream=True
+    )
+    return AsyncAnswerStream(response, on_complete, stats)
 
 
 if __name__ == "__main__":
+    warm_up(background=False)
     # Run the `generate_answer` function with a user query
     # user_query_1 = "What is MongoDB Atlas Search?"
     # answer_1 = generate_answer(user_query_1)
@@ -0,0 +1,323 @@
+"""
+Offline benchmark of ingest throughput and query latency.
+
+Runs without network access: MongoDB is replaced by mongomock, which
+`MongoDriver` writes to and searches with its production pipelines, the
+LLM by a fake chat client, and the embedding model and cross-encoder by
+deterministic stubs (unless `--real-models` is passed and the models are in
+the local Hugging Face cache). Vector search latency is measured through both
+`MongoDriver` and a `LocalVectorIndex`; `--search-backend` selects the one
+that the answer stages use.
+tiktoken's encoding must be in its local cache as well.
+
+Usage, from the `src` directory:
+
+    python benchmark.py --docs 500 --queries 200 --output benchmark.json
+
+Results are written as JSON so that runs can be compared for regressions.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from utils.mongomock_search import VectorSearchMongoClient
+
+# Vocabulary of the synthetic corpus, grouped by topic so retrieval is meaningful
+TOPICS = {
+    "search": "atlas search index analyzer mapping facet autocomplete score query",
+    "vector": "vector embedding similarity cosine dimensions candidates limit ann",
+    "triggers": "trigger event function database change stream scheduled realm",
+    "backup": "backup snapshot restore cluster retention point time recovery",
+    "security": "role user authentication network access encryption audit ldap",
+}
+FILLER = "the a of to and in is for with on that this by as are be can".split()
+
+
+class StubEmbeddingModel:
+    """
+    Deterministic stand-in for `SentenceTransformer`: hashed bag of words.
+    """
+
+    def __init__(self, dimensions: int) -> None:
+        self.dimensions = dimensions
+
+    def encode(self, texts: List[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        embeddings = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                h = zlib.crc32(word.encode("utf-8"))
+                embeddings[row, h % self.dimensions] += 1.0 if h & 1 << 31 else -1.0
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.where(norms == 0, 1, norms)
+
+
+class StubCrossEncoder:
+    """
+    Deterministic stand-in for `CrossEncoder`: word overlap of query and passage.
+    """
+
+    def predict(self, pairs: List[tuple], batch_size: int = 32, **kwargs) -> list:
+        scores = []
+        for query, passage in pairs:
+            query_words = set(query.lower().split())
+            passage_words = set(passage.lower().split())
+            scores.append(len(query_words & passage_words) / (len(query_words) or 1))
+        return scores
+
+
+class FakeChatClient:
+    """
+    Stand-in for the Fireworks client that answers instantly.
+    """
+
+    def __init__(self) -> None:
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model: str, messages: List[Dict], stream: bool = False, **_):
+        answer = f"Answer to: {messages[-1]['content'][:80]}"
+        if stream:
+            return iter(
+                SimpleNamespace(
+                    choices=[SimpleNamespace(delta=SimpleNamespace(content=word))]
+                )
+                for word in answer.split(" ")
+            )
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=answer))]
+        )
+
+
+def make_corpus(n_docs: int, words_per_doc: int, seed: int = 0) -> List[Dict]:
+    """
+    Build a synthetic corpus with the fields of the MongoDB docs dataset.
+    """
+    rng = random.Random(seed)
+    topics = list(TOPICS)
+    docs = []
+    for i in range(n_docs):
+        topic = topics[i % len(topics)]
+        vocabulary = TOPICS[topic].split()
+        words = [
+            rng.choice(vocabulary) if rng.random() < 0.4 else rng.choice(FILLER)
+            for _ in range(words_per_doc)
+        ]
+        sentences = [
+            " ".join(words[j : j + 12]).capitalize() + "."
+            for j in range(0, len(words), 12)
+        ]
+        docs.append(
+            {
+                "sfid": f"doc-{i}",
+                "title": f"{topic.title()} article {i}",
+                "body": "\n\n".join(
+                    " ".join(sentences[j : j + 5]) for j in range(0, len(sentences), 5)
+                ),
+                "metadata": {"contentType": topic},
+                "updated": f"2024-{i % 12 + 1:02d}-01",
+            }
+        )
+    return docs
+
+
+def make_queries(docs: List[Dict], n_queries: int, seed: int = 1) -> List[str]:
+    # Distinct queries taken from the corpus, so that no cache answers them all
+    rng = random.Random(seed)
+    queries = []
+    for i in range(n_queries):
+        words = rng.choice(docs)["body"].split()
+        start = rng.randrange(max(1, len(words) - 8))
+        queries.append(f"{i} " + " ".join(words[start : start + 8]))
+    return queries
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    milliseconds = np.asarray(samples) * 1000
+    return {
+        "p50": float(np.percentile(milliseconds, 50)),
+        "p95": float(np.percentile(milliseconds, 95)),
+        "p99": float(np.percentile(milliseconds, 99)),
+        "mean": float(milliseconds.mean()),
+        "n": len(samples),
+    }
+
+
+def time_calls(fn: Callable[[str], Any], queries: List[str]) -> Dict[str, float]:
+    samples = []
+    for query in queries:
+        start_time = time.perf_counter()
+        fn(query)
+        samples.append(time.perf_counter() - start_time)
+    return percentiles(samples)
+
+
+def install_fakes(real_models: bool, search_backend: str = "mongo") -> None:
+    """
+    Replace the database, LLM and (optionally) model clients before `app` is imported.
+    """
+    import fireworks.client
+
+    import utils.async_mongo_driver
+    import utils.generate_embeddings
+    import utils.mongo_driver
+
+    os.environ["MONGODB_URI"] = "mongodb://benchmark"
+    os.environ.setdefault("FIREWORKS_API_KEY", "benchmark")
+    os.environ["SEARCH_BACKEND"] = search_backend
+    utils.mongo_driver.MongoClient = VectorSearchMongoClient
+    utils.async_mongo_driver.AsyncMongoClient = VectorSearchMongoClient
+    fireworks.client.Fireworks = FakeChatClient
+    fireworks.client.AsyncFireworks = FakeChatClient
+    if not real_models:
+        utils.generate_embeddings._embedding_model = StubEmbeddingModel(
+            utils.generate_embeddings.EMBEDDING_DIMENSIONS
+        )
+
+
+def run_benchmark(
+    n_docs: int,
+    n_queries: int,
+    words_per_doc: int,
+    real_models: bool,
+    search_backend: str = "mongo",
+) -> Dict:
+    """
+    Measure ingest throughput and query latency end to end.
+
+    Args:
+        n_docs (int): Number of synthetic documents to ingest.
+        n_queries (int): Number of queries per latency measurement.
+        words_per_doc (int): Length of each synthetic document.
+        real_models (bool): Use the real embedding model and cross-encoder.
+        search_backend (str): Retrieval of the answer stages, "mongo" for
+            `MongoDriver` against the in-memory database or "local".
+
+    Returns:
+        Dict: Throughput and latency results.
+    """
+    index_dir = tempfile.mkdtemp(prefix="rag-benchmark-")
+    os.environ["LOCAL_INDEX_DIR"] = index_dir
+    install_fakes(real_models, search_backend)
+
+    import app
+    from utils.chunk_data import get_chunks
+    from utils.generate_embeddings import embed_many
+    from utils.ingest_pipeline import run_ingest_pipeline
+    from utils.local_index import LocalVectorIndex
+
+    if not real_models:
+        app.reranker._model = StubCrossEncoder()
+    docs = make_corpus(n_docs, words_per_doc)
+    queries = make_queries(docs, n_queries)
+    results: Dict[str, Any] = {"throughput": {}, "latency_ms": {}}
+
+    # Chunking
+    start_time = time.perf_counter()
+    chunks = [chunk for doc in docs for chunk in get_chunks(doc, "body")]
+    elapsed = time.perf_counter() - start_time
+    results["throughput"]["chunks_per_second"] = len(chunks) / elapsed
+
+    # Embedding
+    texts = [chunk["body"] for chunk in chunks]
+    start_time = time.perf_counter()
+    embed_many(texts)
+    elapsed = time.perf_counter() - start_time
+    results["throughput"]["embeddings_per_second"] = len(texts) / elapsed
+
+    # Ingest through the streaming pipeline and the driver's write path, as
+    # `main.py` does, into the in-memory database
+    driver = app.get_mongodb_driver()
+    collection = driver.client[driver.db_name][app.COLLECTION_NAME]
+    start_time = time.perf_counter()
+    ingested = run_ingest_pipeline(
+        docs,
+        lambda batch: driver.upsert_batch(app.COLLECTION_NAME, batch),
+        write_parents=lambda parents: driver.upsert_batch(
+            driver.parent_collection_name, parents
+        ),
+    )
+    elapsed = time.perf_counter() - start_time
+    results["throughput"]["ingest_docs_per_second"] = len(docs) / elapsed
+    results["throughput"]["ingest_chunks_per_second"] = ingested / elapsed
+
+    # The local index is built from the ingested chunks
+    local_index = app.get_search_backend()
+    if not isinstance(local_index, LocalVectorIndex):
+        local_index = LocalVectorIndex(index_dir)
+    start_time = time.perf_counter()
+    local_index.build(app.COLLECTION_NAME, collection.find())
+    results["throughput"]["index_build_seconds"] = time.perf_counter() - start_time
+
+    # Query latency; each stage gets its own queries so earlier calls don't warm
+    # the caches of later ones
+    def generate_answer_3(query: str) -> None:
+        with contextlib.redirect_stdout(io.StringIO()):
+            app.generate_answer_3("benchmark", query)
+
+    for name, fn in (
+        (
+            "vector_search_mongo",
+            lambda q: driver.vector_search(app.COLLECTION_NAME, q),
+        ),
+        (
+            "vector_search_local",
+            lambda q: local_index.vector_search(app.COLLECTION_NAME, q),
+        ),
+        ("create_prompt_2", app.create_prompt_2),
+        ("generate_answer_3", generate_answer_3),
+    ):
+        stage_queries = [f"{name} {query}" for query in queries]
+        # One warm-up call keeps one-off model loading out of the percentiles
+        fn(f"warm up {name}")
+        results["latency_ms"][name] = time_calls(fn, stage_queries)
+
+    results["config"] = {
+        "docs": n_docs,
+        "chunks": len(chunks),
+        "queries": n_queries,
+        "words_per_doc": words_per_doc,
+        "models": "real" if real_models else "stub",
+        "search_backend": search_backend,
+    }
+    results["environment"] = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--docs", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--words-per-doc", type=int, default=600)
+    parser.add_argument("--real-models", action="store_true")
+    parser.add_argument("--search-backend", choices=["mongo", "local"], default="mongo")
+    parser.add_argument("--output", default="benchmark.json")
+    args = parser.parse_args()
+
+    results = run_benchmark(
+        args.docs,
+        args.queries,
+        args.words_per_doc,
+        args.real_models,
+        args.search_backend,
+    )
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,29 @@
+import os
+
+from dotenv import load_dotenv
+
+from utils.local_index import LocalVectorIndex
+from utils.mongo_driver import MongoDriver
+
+load_dotenv()
+
+
+def build_local_index():
+    MONGODB_URI = os.getenv("MONGODB_URI")
+    assert isinstance(MONGODB_URI, str)
+    mongodb_driver = MongoDriver(
+        MONGODB_URI, vector_encoding=os.getenv("VECTOR_ENCODING", "float64")
+    )
+
+    COLLECTION_NAME = "knowledge_base"
+    LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", ".local_index")
+
+    # Snapshot the stored chunks and their embeddings into a local vector index
+    local_index = LocalVectorIndex(LOCAL_INDEX_DIR)
+    cursor = mongodb_driver.client[mongodb_driver.db_name][COLLECTION_NAME].find({})
+    count = local_index.build(COLLECTION_NAME, cursor)
+    print(f"Indexed {count} documents from {COLLECTION_NAME} into {LOCAL_INDEX_DIR}")
+
+
+if __name__ == "__main__":
+    build_local_index()
@@ -0,0 +1,86 @@
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List
+
+# Modules that must import quickly, e.g. for autoscaled workers and CLI tools
+MODULES = ["app", "utils.mongo_driver"]
+# Dependencies that are only loaded on first use and must never load at import time
+LAZY_DEPENDENCIES = [
+    "torch",
+    "sentence_transformers",
+    "transformers",
+    "langchain",
+    "fireworks",
+    "datasets",
+    "pandas",
+]
+
+
+def measure_import(module: str) -> Dict:
+    """
+    Import a module in a fresh interpreter and measure what it costs.
+
+    Args:
+        module (str): Module to import.
+
+    Returns:
+        Dict: Cumulative import time in milliseconds and the lazy dependencies
+        that were loaded.
+    """
+    code = (
+        f"import json, sys; import {module}; "
+        f"print(json.dumps([m for m in {LAZY_DEPENDENCIES!r} if m in sys.modules]))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        # Modules are imported the way the scripts in this directory import them
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    # Lines look like "import time:  self [us] | cumulative | imported package",
+    # and top-level imports are the ones that are not indented
+    cumulative_us = 0
+    for line in result.stderr.splitlines():
+        fields = line.split("|")
+        if line.startswith("import time:") and len(fields) == 3:
+            if fields[2].strip() == module and not fields[2].startswith("  "):
+                cumulative_us = int(fields[1])
+    return {
+        "import_ms": cumulative_us / 1000,
+        "loaded": json.loads(result.stdout.strip().splitlines()[-1]),
+    }
+
+
+def check_import_time(budget_ms: float, runs: int = 3) -> List[str]:
+    """
+    Check every module in `MODULES` against the import-time budget.
+
+    Args:
+        budget_ms (float): Maximum import time of each module, in milliseconds.
+        runs (int): Number of measurements, the fastest one counts.
+
+    Returns:
+        List[str]: Description of every violation.
+    """
+    violations = []
+    for module in MODULES:
+        measurements = [measure_import(module) for _ in range(runs)]
+        import_ms = min(m["import_ms"] for m in measurements)
+        loaded = measurements[0]["loaded"]
+        print(f"{module}: {import_ms:.0f} ms (budget {budget_ms:.0f} ms)")
+        if import_ms > budget_ms:
+            violations.append(f"{module} takes {import_ms:.0f} ms to import")
+        if loaded:
+            violations.append(f"{module} loads {', '.join(loaded)} at import time")
+    return violations
+
+
+if __name__ == "__main__":
+    violations = check_import_time(float(os.getenv("IMPORT_TIME_BUDGET_MS", "500")))
+    for violation in violations:
+        print(f"FAIL: {violation}")
+    sys.exit(1 if violations else 0)
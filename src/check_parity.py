@@ -0,0 +1,110 @@
+import argparse
+import json
+import sys
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from utils.chunk_data import get_chunks
+from utils.generate_embeddings import EMBEDDING_MODEL_NAME
+from utils.inference_backend import (
+    INFERENCE_BACKENDS,
+    embedding_parity,
+    load_cross_encoder,
+    load_sentence_transformer,
+    rerank_parity,
+    rerank_scores,
+)
+from utils.load_dataset import load_dataset
+from utils.rerank import RERANK_MODEL_NAME
+from utils.search_tuning import exact_top_k
+
+
+def median_ms(fn: Callable, inputs: List) -> float:
+    # Per-call latency, as seen by a single request
+    samples = []
+    for item in inputs:
+        start_time = time.perf_counter()
+        fn(item)
+        samples.append(time.perf_counter() - start_time)
+    return float(np.median(samples) * 1000)
+
+
+def check_parity(args) -> Dict:
+    # Chunk the dataset and use the opening words of a sample of chunks as queries
+    texts = [
+        chunk["body"] for doc in load_dataset() for chunk in get_chunks(doc, "body")
+    ]
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(texts), size=min(args.queries, len(texts)), replace=False)
+    queries = [" ".join(texts[i].split()[:30]) for i in sample]
+
+    # The fp32 PyTorch models are the reference
+    reference_embedder = load_sentence_transformer(EMBEDDING_MODEL_NAME, "torch")
+    embedder = load_sentence_transformer(EMBEDDING_MODEL_NAME, args.backend)
+    reference_reranker = load_cross_encoder(RERANK_MODEL_NAME, "torch")
+    reranker = load_cross_encoder(RERANK_MODEL_NAME, args.backend)
+
+    reference_embeddings = reference_embedder.encode(texts)
+    embeddings = embedder.encode(texts)
+
+    # Rerank the exact nearest chunks of each query, like the application does
+    query_embeddings = reference_embedder.encode(queries)
+    candidates = exact_top_k(reference_embeddings, query_embeddings, args.candidates)
+    requests = [
+        (query, [texts[i] for i in row]) for query, row in zip(queries, candidates)
+    ]
+
+    return {
+        "backend": args.backend,
+        "texts": len(texts),
+        "queries": len(queries),
+        "embedding": {
+            **embedding_parity(reference_embeddings, embeddings),
+            "reference_latency_ms": median_ms(
+                lambda q: reference_embedder.encode([q]), queries
+            ),
+            "latency_ms": median_ms(lambda q: embedder.encode([q]), queries),
+        },
+        "rerank": {
+            **rerank_parity(
+                rerank_scores(reference_reranker, requests),
+                rerank_scores(reranker, requests),
+                top_k=args.top_k,
+            ),
+            "reference_latency_ms": median_ms(
+                lambda r: rerank_scores(reference_reranker, [r]), requests
+            ),
+            "latency_ms": median_ms(lambda r: rerank_scores(reranker, [r]), requests),
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare an inference backend with the fp32 PyTorch models"
+    )
+    parser.add_argument("--backend", choices=INFERENCE_BACKENDS, default="onnx-int8")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--candidates", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--max-drift", type=float, default=0.01)
+    parser.add_argument("--min-top-1-agreement", type=float, default=0.9)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    report = check_parity(args)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    violations = []
+    if report["embedding"]["cosine_drift_mean"] > args.max_drift:
+        violations.append("mean cosine drift of the embeddings is above --max-drift")
+    if report["rerank"]["top_1_agreement"] < args.min_top_1_agreement:
+        violations.append("top-1 rerank agreement is below --min-top-1-agreement")
+    for violation in violations:
+        print(f"FAIL: {violation}")
+    sys.exit(1 if violations else 0)
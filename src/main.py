@@ -1,57 +1,99 @@
 import json
 import os
+import sys
+from itertools import chain
+from typing import Callable, Dict, Iterator, Sequence
 
+import numpy as np
 from dotenv import load_dotenv
-from tqdm import tqdm
 
-from utils.chunk_data import get_chunks
-from utils.generate_embeddings import get_embedding
+from utils.embedding_pool import EmbeddingPool
+from utils.generate_embeddings import embed_many
+from utils.ingest_pipeline import IngestCheckpoint, run_ingest_pipeline
 from utils.load_dataset import load_dataset
 from utils.mongo_driver import MongoDriver
 
 load_dotenv()
 
+COLLECTION_NAME = "knowledge_base"
+ATLAS_VECTOR_SEARCH_INDEX_NAME = "vector_index"
+CHECKPOINT_PATH = os.getenv("INGEST_CHECKPOINT", ".ingest_checkpoint.json")
+
 
 def main():
     # Initialize a MongoDB Python client
     MONGODB_URI = os.getenv("MONGODB_URI")
     assert isinstance(MONGODB_URI, str)
-    mongodb_driver = MongoDriver(MONGODB_URI)
+    mongodb_driver = MongoDriver(
+        MONGODB_URI, vector_encoding=os.getenv("VECTOR_ENCODING", "float64")
+    )
     mongodb_client = mongodb_driver.client
     # Check the connection to the server
     pong = mongodb_client.admin.command("ping")
     if pong["ok"] == 1:
         print("MongoDB connection successful")
 
+    # Stream the documents so that they are chunked as they are read
     docs = load_dataset()
-    # Check the number of documents in the dataset
-    print(f"Number of documents: {len(docs)}")
-    # Preview a document
-    print(f"preview: {json.dumps(docs[0], indent=2)}")
-    split_docs = []
-    # Iterate through `docs`, use the `get_chunks` function to chunk up the documents based on the "body" field, and add the list of chunked documents to `split_docs` initialized above.
-    for doc in docs:
-        chunks = get_chunks(doc, "body")
-        split_docs.extend(chunks)
-
-    # Check that the length of the list of chunked documents is greater than the length of `docs`
-    print(f"Length of split_docs: {len(split_docs)}")
-
-    # Preview one of the items in split_docs- ensure that it is a Python dictionary
-    print(f"preview doc: {json.dumps(split_docs[0], indent=2)}")
-
-    embedded_docs = []
-    for doc in tqdm(split_docs):
-        doc["embedding"] = get_embedding(doc["body"])
-        embedded_docs.append(doc)
-
-    # Check that the length of `embedded_docs` is the same as that of `split_docs`
-    print(f"Length of embedded_docs: {len(embedded_docs)}")
-
-    COLLECTION_NAME = "knowledge_base"
-    ATLAS_VECTOR_SEARCH_INDEX_NAME = "vector_index"
-    # Ingest data into MongoDB
-    mongodb_driver.ingest_data(COLLECTION_NAME, embedded_docs)
+    # Preview a document, then put it back in front of the stream
+    first_doc = next(docs, None)
+    if first_doc is None:
+        sys.exit("The dataset is empty, nothing to ingest")
+    print(f"preview: {json.dumps(first_doc, indent=2, default=str)}")
+    docs = chain([first_doc], docs)
+
+    # Spread embedding over `EMBED_WORKERS` processes on multi-core ingest hosts
+    embed_workers = int(os.getenv("EMBED_WORKERS", "0"))
+    if embed_workers > 1:
+        # Stop the worker processes however ingestion ends
+        with EmbeddingPool(embed_workers) as embed_pool:
+            # Large enough batches to keep every worker busy
+            ingest(
+                mongodb_driver, docs, embed_pool, embed_workers * embed_pool.batch_size
+            )
+    else:
+        ingest(mongodb_driver, docs, embed_many, 256)
+
+
+def ingest(
+    mongodb_driver: MongoDriver,
+    docs: Iterator[Dict],
+    embed_fn: Callable[[Sequence[str]], np.ndarray],
+    embed_batch_size: int,
+) -> None:
+    """
+    Ingest the documents into `COLLECTION_NAME`, incrementally when
+    `INGEST_MODE=incremental` and otherwise in full, resuming from a checkpoint.
+    """
+    # Only re-embed new or changed chunks and keep serving queries during the refresh
+    if os.getenv("INGEST_MODE") == "incremental":
+        stats = mongodb_driver.sync_data(COLLECTION_NAME, docs, embed_fn=embed_fn)
+        print(f"Synced the {COLLECTION_NAME} collection: {stats}")
+        return
+
+    # Resume an interrupted run from its checkpoint, otherwise start from an empty collection
+    checkpoint = IngestCheckpoint(CHECKPOINT_PATH)
+    if checkpoint.next_doc == 0:
+        mongodb_driver.clear_collection(COLLECTION_NAME)
+        mongodb_driver.clear_collection(mongodb_driver.parent_collection_name)
+    else:
+        print(f"Resuming ingestion from document {checkpoint.next_doc}")
+
+    # Chunk, embed and write the documents in bounded batches
+    # Parent articles are stored once, and chunks only reference them
+    ingested = run_ingest_pipeline(
+        docs,
+        lambda batch: mongodb_driver.upsert_batch(COLLECTION_NAME, batch),
+        checkpoint=checkpoint,
+        write_parents=lambda parents: mongodb_driver.upsert_batch(
+            mongodb_driver.parent_collection_name, parents
+        ),
+        embed_batch_size=embed_batch_size,
+        chunk_workers=int(os.getenv("CHUNK_WORKERS", os.cpu_count() or 1)),
+        embed_fn=embed_fn,
+    )
+    checkpoint.clear()
+    print(f"Ingested {ingested} chunks into the {COLLECTION_NAME} collection.")
 
     # Create a vector search index
     mongodb_driver.create_vector_search_index(
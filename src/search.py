@@ -5,6 +5,7 @@ from dotenv import load_dotenv
 
 from utils.generate_embeddings import get_embedding
 from utils.mongo_driver import MongoDriver
+from utils.vector_encoding import encode_vector
 
 load_dotenv()
 
@@ -12,7 +13,9 @@ load_dotenv()
 def search():
     MONGODB_URI = os.getenv("MONGODB_URI")
     assert isinstance(MONGODB_URI, str)
-    mongodb_driver = MongoDriver(MONGODB_URI)
+    mongodb_driver = MongoDriver(
+        MONGODB_URI, vector_encoding=os.getenv("VECTOR_ENCODING", "float64")
+    )
     mongodb_client = mongodb_driver.client
     # Check the connection to the server
     pong = mongodb_client.admin.command("ping")
@@ -21,11 +24,12 @@ def search():
 
     COLLECTION_NAME = "knowledge_base"
 
-    # Run vector search queries
+    # Run vector search queries, embedded in one batch and searched concurrently
     user_query_1 = "What is MongoDB Atlas Search?"
     user_query_2 = "What are triggers in MongoDB Atlas?"
-    result_1 = mongodb_driver.vector_search(COLLECTION_NAME, user_query_1)
-    result_2 = mongodb_driver.vector_search(COLLECTION_NAME, user_query_2)
+    result_1, result_2 = mongodb_driver.vector_search_many(
+        COLLECTION_NAME, [user_query_1, user_query_2]
+    )
 
     print(user_query_1, json.dumps(result_1, indent=2))
     print(user_query_2, json.dumps(result_2, indent=2))
@@ -36,15 +40,20 @@ def search():
     # Embed the user query
     query_embedding = get_embedding(user_query_1)
     # Modify the $vectorSearch stage of the aggregation pipeline defined previously to include a filter for documents where the `metadata.contentType` field has the value "Video"
+    # Use the numCandidates and limit tuned for this filter shape, see `tune_search.py`
+    filter = {"metadata.contentType": "Video"}
+    settings = mongodb_driver.get_search_settings(COLLECTION_NAME, filter)
     pipeline = [
         {
             "$vectorSearch": {
-                "index": mongodb_driver.vector_search_index_name,
+                "index": mongodb_driver.get_index_name(COLLECTION_NAME),
                 "path": "embedding",
-                "queryVector": query_embedding,
-                "numCandidates": 150,
-                "limit": 5,
-                "filter": {"metadata.contentType": "Video"},
+                "queryVector": encode_vector(
+                    query_embedding, mongodb_driver.vector_encoding
+                ),
+                "numCandidates": settings["num_candidates"],
+                "limit": settings["limit"],
+                "filter": filter,
             }
         },
         {"$project": {"_id": 0, "body": 1, "score": {"$meta": "vectorSearchScore"}}},
@@ -63,20 +72,24 @@ def search():
     # the `metadata.contentType` field has the value "Tutorial"
     # AND
     # the `updated` field is greater than or equal to "2024-05-19"
+    filter_2 = {
+        "$and": [
+            {"metadata.contentType": "Tutorial"},
+            {"updated": {"$gte": "2024-05-19"}},
+        ]
+    }
+    settings_2 = mongodb_driver.get_search_settings(COLLECTION_NAME, filter_2)
     pipeline_2 = [
         {
             "$vectorSearch": {
-                "index": mongodb_driver.vector_search_index_name,
+                "index": mongodb_driver.get_index_name(COLLECTION_NAME),
                 "path": "embedding",
-                "queryVector": query_embedding,
-                "numCandidates": 150,
-                "limit": 5,
-                "filter": {
-                    "$and": [
-                        {"metadata.contentType": "Tutorial"},
-                        {"updated": {"$gte": "2024-05-19"}},
-                    ]
-                },
+                "queryVector": encode_vector(
+                    query_embedding, mongodb_driver.vector_encoding
+                ),
+                "numCandidates": settings_2["num_candidates"],
+                "limit": settings_2["limit"],
+                "filter": filter_2,
             }
         },
         {
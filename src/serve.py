@@ -0,0 +1,149 @@
+import json
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+from dotenv import load_dotenv
+
+import app
+from utils.context_packing import with_rerank_scores
+from utils.generate_embeddings import embed_many
+from utils.micro_batcher import MicroBatcher
+from utils.tracing import InMemorySink, tracer
+
+load_dotenv()
+
+MAX_BATCH_SIZE = int(os.getenv("SERVE_MAX_BATCH_SIZE", "32"))
+MAX_WAIT_MS = float(os.getenv("SERVE_MAX_WAIT_MS", "5"))
+
+# Queries arriving within `MAX_WAIT_MS` of each other share one `encode` call...
+embed_batcher = MicroBatcher(
+    lambda texts: [embedding.tolist() for embedding in embed_many(texts)],
+    max_batch_size=MAX_BATCH_SIZE,
+    max_wait_ms=MAX_WAIT_MS,
+    name="embed-batcher",
+)
+# ...and one cross-encoder `predict` call
+rerank_batcher = MicroBatcher(
+    lambda requests: app.reranker.rank_many(requests, top_k=5),
+    max_batch_size=MAX_BATCH_SIZE,
+    max_wait_ms=MAX_WAIT_MS,
+    name="rerank-batcher",
+)
+
+
+def retrieve_context_batched(user_query: str) -> List[Dict]:
+    """
+    Retrieve and re-rank documents like `app.retrieve_context_2`, batching the
+    model calls with those of concurrent requests.
+
+    Args:
+        user_query (str): The user's query string.
+
+    Returns:
+        List[Dict]: The top re-ranked documents with their reranker `score`.
+    """
+    context = app.get_search_backend().vector_search(
+        app.COLLECTION_NAME, user_query, rerank=True
+    )
+    documents: List[str] = [d.get("body") for d in context]
+    reranked_documents = rerank_batcher((user_query, documents))
+    return with_rerank_scores(context, reranked_documents)
+
+
+def create_prompt_batched(user_query: str) -> str:
+    """
+    Create a chat prompt like `app.create_prompt_2`, batching the model calls
+    with those of concurrent requests.
+
+    Args:
+        user_query (str): The user's query string.
+
+    Returns:
+        str: The chat prompt string.
+    """
+    return app.create_prompt_2(user_query, retrieve_context_batched(user_query))
+
+
+def answer(user_query: str) -> str:
+    prompt = create_prompt_batched(user_query)
+    response: Any = app.get_fw_client().chat.completions.create(
+        model=app.model, messages=[{"role": "user", "content": prompt}]
+    )
+    return response.choices[0].message.content
+
+
+def answer_with_history(session_id: str, user_query: str) -> str:
+    # Like `app.generate_answer_3`, but re-ranked through the batchers and
+    # without printing the answer
+    return app.answer_with_history(session_id, user_query, retrieve_context_batched)
+
+
+def metrics() -> dict:
+    result = {
+        "embed_batcher": embed_batcher.metrics(),
+        "rerank_batcher": rerank_batcher.metrics(),
+        "reranker_last_latency": app.reranker.last_latency,
+    }
+    # Per-stage latencies when running with TRACING=memory
+    if isinstance(tracer.sink, InMemorySink):
+        result["stages"] = tracer.sink.summary()
+    return result
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    # POST /answer {"query": ..., "session_id": ...} and GET /metrics
+
+    def _send_json(self, status: int, body: Any) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self) -> None:
+        if self.path == "/metrics":
+            self._send_json(200, metrics())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        if self.path != "/answer":
+            self._send_json(404, {"error": "not found"})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length))
+            user_query = request["query"]
+        except (ValueError, KeyError, TypeError):
+            self._send_json(400, {"error": "expected a JSON body with a `query`"})
+            return
+
+        session_id = request.get("session_id")
+        try:
+            if session_id:
+                # Chat history is taken into account, see `app.generate_answer_3`
+                result = answer_with_history(session_id, user_query)
+            else:
+                result = answer(user_query)
+        except Exception as e:
+            # Answer rather than dropping the connection, e.g. when the LLM is down
+            self.log_error("Failed to answer %r: %r", user_query, e)
+            self._send_json(500, {"error": "failed to answer the query"})
+            return
+        self._send_json(200, {"answer": result})
+
+
+def serve():
+    app.get_search_backend().embed_query = embed_batcher
+    # Connect and load the models while the server starts accepting requests
+    app.warm_up()
+    port = int(os.getenv("PORT", "8000"))
+    server = ThreadingHTTPServer(("", port), RequestHandler)
+    print(f"Serving on port {port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,16 @@
+import argparse
+
+from utils.load_dataset import save_snapshot
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Save the dataset as local Parquet files for offline ingestion"
+    )
+    parser.add_argument("path", help="Directory to write the snapshot to")
+    parser.add_argument("--limit", type=int, help="Maximum number of records")
+    parser.add_argument("--rows-per-file", type=int, default=10_000)
+    args = parser.parse_args()
+
+    saved = save_snapshot(args.path, args.limit, args.rows_per_file)
+    # Ingest it with DATASET_SNAPSHOT=<path>
+    print(f"Saved {saved} records to {args.path}")
@@ -0,0 +1,79 @@
+import argparse
+import json
+import os
+
+from dotenv import load_dotenv
+
+from utils.generate_embeddings import embed_many
+from utils.mongo_driver import MongoDriver
+from utils.search_tuning import tune_vector_search
+from utils.vector_encoding import encode_vector
+
+load_dotenv()
+
+
+def tune_search(args):
+    MONGODB_URI = os.getenv("MONGODB_URI")
+    assert isinstance(MONGODB_URI, str)
+    mongodb_driver = MongoDriver(
+        MONGODB_URI, vector_encoding=os.getenv("VECTOR_ENCODING", "float64")
+    )
+    collection = mongodb_driver.client[mongodb_driver.db_name][args.collection]
+    filter = json.loads(args.filter) if args.filter else None
+
+    # Use the given queries, or the opening words of a sample of stored chunks
+    if args.queries:
+        with open(args.queries) as f:
+            queries = json.load(f)
+    else:
+        sample = collection.aggregate(
+            [{"$sample": {"size": args.sample}}, {"$project": {"body": 1}}]
+        )
+        queries = [" ".join(doc["body"].split()[:30]) for doc in sample]
+
+    query_embeddings = embed_many(queries)
+    query_vectors = [
+        encode_vector(embedding, mongodb_driver.vector_encoding)
+        for embedding in query_embeddings
+    ]
+    result = tune_vector_search(
+        collection,
+        mongodb_driver.get_index_name(args.collection),
+        query_embeddings,
+        query_vectors,
+        filter=filter,
+        k=args.k,
+        target_recall=args.target_recall,
+    )
+
+    for row in result["sweep"]:
+        print(
+            f"numCandidates={row['num_candidates']:>5} limit={row['limit']:>3} "
+            f"recall@{args.k}={row['recall']:.3f} "
+            f"p50={row['latency_p50_ms']:.1f}ms p95={row['latency_p95_ms']:.1f}ms"
+        )
+    print(f"Chosen: {result['chosen']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {"queries": len(queries), "filter": filter, **result}, f, indent=2
+            )
+    # Saved settings are used by `MongoDriver.vector_search` for this filter shape
+    if args.save:
+        mongodb_driver.save_search_settings(args.collection, filter, result["chosen"])
+        print(f"Saved the settings for {args.collection}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Tune numCandidates and limit of $vectorSearch against exact search"
+    )
+    parser.add_argument("--collection", default="knowledge_base")
+    parser.add_argument("--queries", help="JSON file with a list of queries")
+    parser.add_argument("--sample", type=int, default=50)
+    parser.add_argument("--filter", help='e.g. {"metadata.contentType": "Video"}')
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--output")
+    parser.add_argument("--save", action="store_true")
+    tune_search(parser.parse_args())
@@ -0,0 +1,138 @@
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from pymongo.collection import Collection
+
+
+class AnswerCache:
+    """
+    Generated answers stored in MongoDB and reused for near-identical questions.
+
+    An entry is keyed by the set of chunks the answer was generated from and
+    by the query embedding: a lookup only considers answers built from exactly
+    the same chunks, and returns one whose query is at least
+    `similarity_threshold` cosine-similar. Entries expire after `ttl` seconds
+    through a TTL index, and are deleted as soon as one of their chunks changes.
+    """
+
+    collection: Collection
+    similarity_threshold: float
+    ttl: int
+    hits: int
+    misses: int
+
+    def __init__(
+        self,
+        collection: Collection,
+        similarity_threshold: float = 0.95,
+        ttl: int = 24 * 3600,
+    ) -> None:
+        self.collection = collection
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._indexes_created = False
+        self._lock = threading.Lock()
+
+    def _create_indexes(self) -> None:
+        # Created on first use so that constructing the cache needs no round trip
+        if self._indexes_created:
+            return
+        with self._lock:
+            if not self._indexes_created:
+                self.collection.create_index("created_at", expireAfterSeconds=self.ttl)
+                self.collection.create_index([("source", 1), ("chunk_ids", 1)])
+                self._indexes_created = True
+
+    def lookup(
+        self, source: str, query_embedding: List[float], chunk_ids: Iterable[str]
+    ) -> Optional[str]:
+        """
+        Find a cached answer for a query over a set of retrieved chunks.
+
+        Args:
+            source (str): Collection the chunks were retrieved from.
+            query_embedding (List[float]): Embedding of the user query.
+            chunk_ids (Iterable[str]): IDs of the retrieved chunks.
+
+        Returns:
+            Optional[str]: The cached answer, or None on a miss.
+        """
+        self._create_indexes()
+        entries = list(
+            self.collection.find(
+                {"source": source, "chunk_ids": sorted(set(chunk_ids))},
+                {"query_embedding": 1, "answer": 1},
+            )
+        )
+        if entries:
+            query = np.asarray(query_embedding, dtype=np.float32)
+            cached = np.asarray(
+                [entry["query_embedding"] for entry in entries], dtype=np.float32
+            )
+            norms = np.linalg.norm(cached, axis=1) * (np.linalg.norm(query) or 1.0)
+            similarities = cached @ query / np.where(norms == 0, 1, norms)
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.similarity_threshold:
+                with self._lock:
+                    self.hits += 1
+                return entries[best]["answer"]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(
+        self,
+        source: str,
+        query_embedding: List[float],
+        chunk_ids: Iterable[str],
+        answer: str,
+    ) -> None:
+        """
+        Cache an answer generated for a query over a set of retrieved chunks.
+
+        Args:
+            source (str): Collection the chunks were retrieved from.
+            query_embedding (List[float]): Embedding of the user query.
+            chunk_ids (Iterable[str]): IDs of the chunks the answer is based on.
+            answer (str): The generated answer.
+        """
+        self._create_indexes()
+        self.collection.insert_one(
+            {
+                "source": source,
+                "chunk_ids": sorted(set(chunk_ids)),
+                "query_embedding": [float(x) for x in query_embedding],
+                "answer": answer,
+                "created_at": datetime.now(timezone.utc),
+            }
+        )
+
+    def invalidate(self, source: str, chunk_ids: Optional[Iterable[str]] = None) -> int:
+        """
+        Delete the answers based on any of the given chunks.
+
+        Args:
+            source (str): Collection the chunks belong to.
+            chunk_ids (Optional[Iterable[str]]): Changed chunks. All answers over
+                `source` are deleted when omitted.
+
+        Returns:
+            int: Number of deleted answers.
+        """
+        filter: Dict = {"source": source}
+        if chunk_ids is not None:
+            filter["chunk_ids"] = {"$in": list(chunk_ids)}
+        return self.collection.delete_many(filter).deleted_count
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,91 @@
+import asyncio
+from typing import Dict, Optional
+
+from pymongo import AsyncMongoClient
+
+from utils.mongo_driver import MongoDriver
+from utils.search_tuning import filter_shape, search_settings_for
+
+
+class AsyncMongoDriver:
+    """
+    asyncio counterpart of `MongoDriver.vector_search`.
+
+    Shares the synchronous driver's configuration and caches, so both can
+    serve queries against the same collections side by side.
+    """
+
+    driver: MongoDriver
+    client: AsyncMongoClient
+
+    def __init__(
+        self, driver: MongoDriver, uri: str, appname="devrel.workshop.rag"
+    ) -> None:
+        self.driver = driver
+        self.client = AsyncMongoClient(uri, appname=appname)
+
+    @property
+    def db_name(self) -> str:
+        return self.driver.db_name
+
+    async def vector_search(
+        self,
+        collection_name: str,
+        user_query: str,
+        filter: Optional[Dict] = None,
+        include_parent: bool = False,
+        rerank: bool = False,
+    ) -> list:
+        """
+        Retrieve relevant documents for a user query using vector search.
+
+        Args:
+            collection_name (str): Collection to search.
+            user_query (str): The user's query string.
+            filter (Optional[Dict]): Pre-filter on fields indexed as `filter` fields.
+            include_parent (bool): Join each result's parent article as `parent`.
+            rerank (bool): Return the tuned number of candidates to re-rank rather
+                than the default top-k.
+
+        Returns:
+            list: A list of matching documents.
+        """
+        # The collection version is cached, so this only blocks every few seconds
+        version = self.driver.collection_versions.get(collection_name)
+        if version is None:
+            version = await asyncio.to_thread(
+                self.driver.get_collection_version, collection_name
+            )
+        cache_key = self.driver.vector_search_cache_key(
+            collection_name, user_query, filter, include_parent, rerank, version
+        )
+        cached = self.driver.result_cache.get(cache_key)
+        if cached is not None:
+            return [dict(doc) for doc in cached]
+
+        # Run the embedding model off the event loop
+        query_embedding = await asyncio.to_thread(
+            self.driver.get_query_embedding, user_query
+        )
+        # The live index name is cached, so this only blocks every few seconds
+        index_name = self.driver.index_aliases.get(collection_name)
+        if index_name is None:
+            index_name = await asyncio.to_thread(
+                self.driver.get_index_name, collection_name
+            )
+        settings = self.driver.search_settings.get(
+            (collection_name, filter_shape(filter))
+        )
+        if settings is None:
+            settings = await asyncio.to_thread(
+                self.driver.get_search_settings, collection_name, filter, rerank
+            )
+        else:
+            settings = search_settings_for(settings, rerank)
+        pipeline = self.driver.vector_search_pipeline(
+            query_embedding, filter, include_parent, index_name=index_name, **settings
+        )
+        cursor = await self.client[self.db_name][collection_name].aggregate(pipeline)
+        results = await cursor.to_list()
+        self.driver.result_cache.put(cache_key, results)
+        return [dict(doc) for doc in results]
@@ -1,24 +1,145 @@
-from typing import Dict, List
+import hashlib
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import TYPE_CHECKING, Deque, Dict, Iterable, Iterator, List, Optional
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import tiktoken
+
+from utils.generate_embeddings import embedding_model_key
+
+if TYPE_CHECKING:
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+# Field that uniquely identifies an article in the source dataset
+PARENT_ID_FIELD = "sfid"
+# Parent fields copied onto every chunk because the vector index filters on them
+FILTER_FIELDS = ["metadata.contentType", "updated"]
+# Model whose tokenizer measures chunk sizes
+TOKENIZER_MODEL_NAME = "gpt-4"
+
+# Built once per process, see `get_text_splitter` and `get_encoder`
+_text_splitter: Optional["RecursiveCharacterTextSplitter"] = None
+_encoder: Optional[tiktoken.Encoding] = None
 
 
 # https://python.langchain.com/docs/how_to/split_by_token/
 # For text data, you typically want to keep 1-2 paragraphs (~200 tokens) in a single chunk
 # Chunk overlap of 15-20% of the chunk size is recommended
 def create_text_splitter():
+    # Imported here because langchain takes most of a second to import
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
     # Separators to split on
     separators = ["\n\n", "\n", " ", "", "#", "##", "###"]
     text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-        model_name="gpt-4", separators=separators, chunk_size=200, chunk_overlap=30
+        model_name=TOKENIZER_MODEL_NAME,
+        separators=separators,
+        chunk_size=200,
+        chunk_overlap=30,
     )
     return text_splitter
 
 
+def get_text_splitter() -> "RecursiveCharacterTextSplitter":
+    global _text_splitter
+    if _text_splitter is None:
+        _text_splitter = create_text_splitter()
+    return _text_splitter
+
+
+def get_encoder() -> tiktoken.Encoding:
+    global _encoder
+    if _encoder is None:
+        _encoder = tiktoken.encoding_for_model(TOKENIZER_MODEL_NAME)
+    return _encoder
+
+
+def count_tokens(text: str) -> int:
+    return len(get_encoder().encode(text, disallowed_special=()))
+
+
+def get_parent_id(doc: Dict) -> str:
+    """
+    Return a stable identifier for a source document.
+
+    Args:
+        doc (Dict): Source document.
+
+    Returns:
+        str: The document's `PARENT_ID_FIELD`, or a hash of its title if it has none.
+    """
+    if doc.get(PARENT_ID_FIELD):
+        return str(doc[PARENT_ID_FIELD])
+    return hashlib.sha256(str(doc.get("title", "")).encode("utf-8")).hexdigest()
+
+
+def get_chunk_id(chunk: Dict, text_field: str = "body") -> str:
+    """
+    Return the `_id` that `get_chunks` gives a chunk, for chunks returned by search.
+
+    Args:
+        chunk (Dict): Chunk with `parent_id` and `chunk_index`.
+        text_field (str): Text field of the chunk, hashed when it has no position.
+
+    Returns:
+        str: The chunk's ID, `<parent_id>:<chunk_index>`.
+    """
+    if chunk.get("parent_id") is not None:
+        return f"{chunk['parent_id']}:{chunk.get('chunk_index') or 0}"
+    return hashlib.sha256(str(chunk.get(text_field, "")).encode("utf-8")).hexdigest()
+
+
+def get_content_hash(text: str, model_name: Optional[str] = None) -> str:
+    """
+    Hash a chunk's text together with the embedding model that embeds it, so
+    that changing either one, or the model's inference backend, marks the
+    chunk for re-embedding.
+    """
+    model_name = model_name or embedding_model_key()
+    return hashlib.sha256(f"{model_name}\n{text}".encode("utf-8")).hexdigest()
+
+
+def get_parent(doc: Dict, text_field: str) -> Dict:
+    """
+    Build the parent article record that chunks reference by `parent_id`.
+
+    Args:
+        doc (Dict): Source document.
+        text_field (str): Text field that is stored in the chunks instead.
+
+    Returns:
+        Dict: The document's fields other than `text_field`, keyed by its parent ID.
+    """
+    parent = {key: value for key, value in doc.items() if key != text_field}
+    parent["_id"] = get_parent_id(doc)
+    return parent
+
+
+def _copy_filter_fields(doc: Dict, target: Dict) -> None:
+    for path in FILTER_FIELDS:
+        *parents, leaf = path.split(".")
+        source = doc
+        for part in parents:
+            source = source.get(part) if isinstance(source, dict) else None
+        if not isinstance(source, dict) or leaf not in source:
+            continue
+        destination = target
+        for part in parents:
+            destination = destination.setdefault(part, {})
+        destination[leaf] = source[leaf]
+
+
 def get_chunks(doc: Dict, text_field: str) -> List[Dict]:
     """
     Chunk up a document.
 
+    Chunks only reference their parent article by `parent_id` and carry the
+    parent's `FILTER_FIELDS`; the rest of the parent lives in its own record,
+    see `get_parent`.
+
     Args:
         doc (Dict): Parent document to generate chunks from.
         text_field (str): Text field to chunk.
@@ -29,17 +150,92 @@ def get_chunks(doc: Dict, text_field: str) -> List[Dict]:
     # Extract the field to chunk from `doc`
     text = doc[text_field]
     # NOTE: `text` is a string
-    text_splitter = create_text_splitter()
+    text_splitter = get_text_splitter()
     chunks = text_splitter.split_text(text)
 
     # Iterate through `chunks` and for each chunk:
-    # 1. Create a shallow copy of `doc`, call it `temp`
-    # 2. Set the `text_field` field in `temp` to the content of the chunk
-    # 3. Append `temp` to `chunked_data`
+    # 1. Create a document `temp` with a stable ID from its parent and position
+    # 2. Set the `text_field` field in `temp` to the content of the chunk, with its
+    #    character offsets in the parent text
+    # 3. Copy the parent's filter fields into `temp`
+    # 4. Record a content hash, and the chunk's token count so later stages don't
+    #    re-tokenize it
+    # 5. Append `temp` to `chunked_data`
+    parent_id = get_parent_id(doc)
     chunked_data = []
-    for chunk in chunks:
-        temp = doc.copy()
-        temp[text_field] = chunk
+    start = -1
+    for position, chunk in enumerate(chunks):
+        # Chunks overlap, so each one starts after the start of the previous one
+        start = text.find(chunk, start + 1)
+        temp = {
+            "_id": f"{parent_id}:{position}",
+            "parent_id": parent_id,
+            "chunk_index": position,
+            text_field: chunk,
+            "start": start,
+            "end": start + len(chunk) if start >= 0 else -1,
+        }
+        _copy_filter_fields(doc, temp)
+        temp["content_hash"] = get_content_hash(chunk)
+        temp["token_count"] = count_tokens(chunk)
         chunked_data.append(temp)
 
     return chunked_data
+
+
+def _init_chunk_worker() -> None:
+    # Build the splitter and tokenizer once per worker, not once per document
+    get_text_splitter()
+    get_encoder()
+
+
+def _chunk_batch(docs: List[Dict], text_field: str) -> List[List[Dict]]:
+    return [get_chunks(doc, text_field) for doc in docs]
+
+
+def chunk_documents(
+    docs: Iterable[Dict],
+    text_field: str,
+    workers: Optional[int] = None,
+    batch_size: int = 16,
+) -> Iterator[List[Dict]]:
+    """
+    Chunk documents over a pool of worker processes.
+
+    Documents are sent to the workers in batches and at most two batches per
+    worker are in flight, so the input is consumed lazily.
+
+    Args:
+        docs (Iterable[Dict]): Parent documents to generate chunks from.
+        text_field (str): Text field to chunk.
+        workers (Optional[int]): Number of worker processes. Defaults to the CPU count.
+        batch_size (int): Number of documents sent to a worker at a time.
+
+    Returns:
+        Iterator[List[Dict]]: The chunks of each document, in input order.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for doc in docs:
+            yield get_chunks(doc, text_field)
+        return
+
+    iterator = iter(docs)
+    # Workers are spawned rather than forked, since this runs next to the
+    # ingestion threads and forking a multi-threaded process can deadlock
+    with ProcessPoolExecutor(
+        workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_chunk_worker,
+    ) as executor:
+        pending: Deque[Future] = deque()
+        while True:
+            while len(pending) < 2 * workers:
+                batch = list(islice(iterator, batch_size))
+                if not batch:
+                    break
+                pending.append(executor.submit(_chunk_batch, batch, text_field))
+            if not pending:
+                return
+            # Waiting on the oldest batch first keeps the output order deterministic
+            yield from pending.popleft().result()
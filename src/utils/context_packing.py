@@ -0,0 +1,130 @@
+import heapq
+from itertools import count, groupby
+from typing import Dict, List
+
+from utils.chunk_data import count_tokens
+
+
+def merge_chunks(first: Dict, second: Dict, text_field: str = "body") -> str:
+    """
+    Join two consecutive chunks of the same document without repeating their overlap.
+
+    Args:
+        first (Dict): Earlier chunk.
+        second (Dict): Chunk that directly follows `first` in its document.
+        text_field (str): Text field of the chunks.
+
+    Returns:
+        str: Text of both chunks with the overlapping span included once.
+    """
+    a, b = first[text_field], second[text_field]
+    # Character offsets in the parent document tell exactly how much overlaps
+    a_end, b_start = first.get("end"), second.get("start")
+    if a_end is not None and b_start is not None and 0 <= b_start <= a_end:
+        return a + b[a_end - b_start :]
+    # Otherwise look for the longest suffix of `a` that starts `b`
+    for size in range(min(len(a), len(b)), 0, -1):
+        if a.endswith(b[:size]):
+            return a + b[size:]
+    return f"{a}\n{b}"
+
+
+def pack_context(docs: List[Dict], token_budget: int, text_field: str = "body") -> str:
+    """
+    Build a prompt context from retrieved chunks within a token budget.
+
+    Adjacent chunks of the same document are merged into one passage with
+    their overlap removed, duplicate passages are dropped, and passages are
+    added in score order for as long as they fit `token_budget`. A merged
+    passage that doesn't fit is split back into its chunks, which then compete
+    on their own scores.
+
+    Args:
+        docs (List[Dict]): Retrieved chunks with a `score`, and `parent_id`,
+            `chunk_index` and `token_count` when known.
+        token_budget (int): Maximum number of tokens in the context.
+        text_field (str): Text field of the chunks.
+
+    Returns:
+        str: Passages separated by two new lines, best first.
+    """
+    passages = []
+    with_position = [d for d in docs if d.get("parent_id") is not None]
+    without_position = [d for d in docs if d.get("parent_id") is None]
+
+    def position(doc: Dict) -> tuple:
+        return (doc["parent_id"], doc.get("chunk_index") or 0)
+
+    for _, group in groupby(
+        sorted(with_position, key=position), key=lambda d: d["parent_id"]
+    ):
+        run: List[Dict] = []
+        for doc in group:
+            if run and doc.get("chunk_index") == run[-1].get("chunk_index"):
+                continue
+            if run and doc.get("chunk_index") != (run[-1].get("chunk_index") or 0) + 1:
+                passages.append(_merge_run(run, text_field))
+                run = []
+            run.append(doc)
+        passages.append(_merge_run(run, text_field))
+    passages.extend(_single_chunk(d, text_field) for d in without_position)
+
+    # Best score first, ties in the order the passages were built
+    order = count()
+    queue = [
+        (-score, next(order), text, tokens, run)
+        for score, text, tokens, run in passages
+    ]
+    heapq.heapify(queue)
+    context = []
+    seen = set()
+    used = 0
+    while queue:
+        _, _, text, tokens, run = heapq.heappop(queue)
+        if not text or text in seen:
+            continue
+        # Skip passages that don't fit, a smaller one further down may still fit
+        if used + tokens > token_budget:
+            for doc in run:
+                score, text, tokens, _ = _single_chunk(doc, text_field)
+                heapq.heappush(queue, (-score, next(order), text, tokens, []))
+            continue
+        context.append(text)
+        seen.add(text)
+        used += tokens
+    return "\n\n".join(context)
+
+
+def _single_chunk(doc: Dict, text_field: str) -> tuple:
+    # Chunks stored by `get_chunks` carry their token count
+    text = doc.get(text_field) or ""
+    tokens = doc.get("token_count")
+    tokens = count_tokens(text) if tokens is None else tokens
+    return doc.get("score", 0.0), text, tokens, []
+
+
+def _merge_run(run: List[Dict], text_field: str) -> tuple:
+    if len(run) == 1:
+        return _single_chunk(run[0], text_field)
+    # A passage scores as well as its best chunk
+    merged = dict(run[0])
+    for doc in run[1:]:
+        merged[text_field] = merge_chunks(merged, doc, text_field)
+        merged["end"] = doc.get("end")
+    text = merged[text_field]
+    # The chunks are kept in case the merged passage doesn't fit
+    return max(d.get("score", 0.0) for d in run), text, count_tokens(text), run
+
+
+def with_rerank_scores(docs: List[Dict], reranked: List[Dict]) -> List[Dict]:
+    """
+    Keep the re-ranked documents, scored by the reranker instead of vector search.
+
+    Args:
+        docs (List[Dict]): Retrieved documents that were re-ranked.
+        reranked (List[Dict]): Output of `Reranker.rank` on those documents.
+
+    Returns:
+        List[Dict]: The top re-ranked documents with their reranker `score`.
+    """
+    return [{**docs[d["corpus_id"]], "score": d["score"]} for d in reranked]
@@ -0,0 +1,194 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+
+def get_cache_key(model_name: str, text: str) -> bytes:
+    return hashlib.sha256(f"{model_name}\n{text}".encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache shared by every process that opens the same directory.
+
+    Vectors live in a fixed-size memory-mapped float32 matrix, so a hit is a
+    row read with nothing to deserialize. A SQLite index maps each
+    (model name, text hash) key to its row and last access time, and the
+    least recently used rows are reused once the cache is full.
+    """
+
+    directory: str
+    dimensions: int
+    max_entries: int
+
+    def __init__(
+        self, directory: str, dimensions: int, max_entries: int = 250_000
+    ) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._db = sqlite3.connect(
+            os.path.join(directory, "index.sqlite3"),
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # The SQLite connection is shared by the threads of this process
+        self._lock = threading.Lock()
+
+        # The first process to open the directory decides its layout
+        self._db.execute("BEGIN IMMEDIATE")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries"
+            " (key BLOB PRIMARY KEY, slot INTEGER UNIQUE, last_used REAL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)"
+        )
+        self._db.execute(
+            "INSERT OR IGNORE INTO meta VALUES ('dimensions', ?), ('max_entries', ?)",
+            (dimensions, max_entries),
+        )
+        meta = dict(self._db.execute("SELECT name, value FROM meta"))
+        self.dimensions = meta["dimensions"]
+        self.max_entries = meta["max_entries"]
+
+        vectors_path = os.path.join(directory, "vectors.f32")
+        keys_path = os.path.join(directory, "keys.u64")
+        mode = "r+" if os.path.exists(vectors_path) else "w+"
+        self._vectors = np.memmap(
+            vectors_path,
+            dtype=np.float32,
+            mode=mode,
+            shape=(self.max_entries, self.dimensions),
+        )
+        # Each row also stores a digest of its key, so a reader can tell that a
+        # row was reused by another process between the index lookup and the read
+        self._keys = np.memmap(
+            keys_path, dtype=np.uint64, mode=mode, shape=(self.max_entries,)
+        )
+        self._db.execute("COMMIT")
+
+    @staticmethod
+    def _digest(key: bytes) -> int:
+        return int.from_bytes(key[:8], "little")
+
+    def _lookup_slots(self, keys: List[bytes]) -> Dict[bytes, int]:
+        slots: Dict[bytes, int] = {}
+        # Stay below SQLite's limit on the number of bound parameters
+        for start in range(0, len(keys), 500):
+            part = keys[start : start + 500]
+            rows = self._db.execute(
+                "SELECT key, slot FROM entries WHERE key IN"
+                f" ({','.join('?' * len(part))})",
+                part,
+            )
+            slots.update(rows)
+        return slots
+
+    def get_many(
+        self, model_name: str, texts: Sequence[str]
+    ) -> Tuple[np.ndarray, List[int]]:
+        """
+        Look up cached embeddings.
+
+        Args:
+            model_name (str): Name of the model that produced the embeddings.
+            texts (Sequence[str]): Texts to look up.
+
+        Returns:
+            Tuple[np.ndarray, List[int]]: Float32 matrix with a row per text, and
+            the positions of the texts that were not cached (their rows are zero).
+        """
+        keys = [get_cache_key(model_name, text) for text in texts]
+        embeddings = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        with self._lock:
+            slots = self._lookup_slots(keys)
+
+        hits = []
+        missing = []
+        for i, key in enumerate(keys):
+            slot = slots.get(key)
+            if slot is not None:
+                embeddings[i] = self._vectors[slot]
+                # Check the digest after copying, in case the row was being rewritten
+                if self._keys[slot] == self._digest(key):
+                    hits.append(key)
+                    continue
+            missing.append(i)
+
+        if hits:
+            now = time.time()
+            with self._lock:
+                self._db.executemany(
+                    "UPDATE entries SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in hits],
+                )
+        return embeddings, missing
+
+    def put_many(
+        self, model_name: str, texts: Sequence[str], embeddings: np.ndarray
+    ) -> None:
+        """
+        Store embeddings, evicting the least recently used entries if the cache is full.
+
+        Args:
+            model_name (str): Name of the model that produced the embeddings.
+            texts (Sequence[str]): Texts that were embedded.
+            embeddings (np.ndarray): One embedding row per text.
+        """
+        entries = {
+            get_cache_key(model_name, text): embedding
+            for text, embedding in zip(texts, embeddings)
+        }
+        now = time.time()
+        with self._lock:
+            self._put_entries(entries, now)
+
+    def _put_entries(self, entries: Dict[bytes, np.ndarray], now: float) -> None:
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            # Entries already stored by this or another process are left as they are
+            existing = self._lookup_slots(list(entries))
+            new_keys = [key for key in entries if key not in existing]
+            new_keys = new_keys[: self.max_entries]
+
+            # Rows are filled in order, so the entry count is also the next free row.
+            # Once every row is used, evict the least recently used entries.
+            (used,) = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()
+            free = min(len(new_keys), self.max_entries - used)
+            slots = list(range(used, used + free))
+            if len(slots) < len(new_keys):
+                evicted = self._db.execute(
+                    "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?",
+                    (len(new_keys) - len(slots),),
+                ).fetchall()
+                self._db.executemany(
+                    "DELETE FROM entries WHERE key = ?", [(key,) for key, _ in evicted]
+                )
+                slots.extend(slot for _, slot in evicted)
+
+            for key, slot in zip(new_keys, slots):
+                # Invalidate the row before overwriting it so concurrent readers miss
+                self._keys[slot] = 0
+                self._vectors[slot] = entries[key]
+                self._keys[slot] = self._digest(key)
+            self._vectors.flush()
+            self._keys.flush()
+
+            self._db.executemany(
+                "INSERT INTO entries VALUES (?, ?, ?)",
+                [(key, slot, now) for key, slot in zip(new_keys, slots)],
+            )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
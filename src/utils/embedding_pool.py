@@ -0,0 +1,164 @@
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from utils.generate_embeddings import (
+    EMBEDDING_DIMENSIONS,
+    EMBEDDING_MODEL_NAME,
+    _encode,
+    embed_many,
+    get_embedding_model,
+)
+from utils.inference_backend import export_quantized_onnx_model, get_inference_backend
+
+
+def _init_embedding_worker(threads: int, worker_counter, pin_cores: bool) -> None:
+    # The thread pools of torch are sized when it is first imported, so the
+    # limits must be set before the model is loaded
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    import torch
+
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+
+    # Give each worker its own cores so that workers don't compete for them
+    if pin_cores and hasattr(os, "sched_setaffinity"):
+        with worker_counter.get_lock():
+            index = worker_counter.value
+            worker_counter.value += 1
+        cores = sorted(os.sched_getaffinity(0))
+        own_cores = cores[index * threads : (index + 1) * threads]
+        if len(own_cores) == threads:
+            os.sched_setaffinity(0, own_cores)
+
+    # Load the model once per worker, not once per batch
+    get_embedding_model()
+
+
+def _embed_into(
+    shm_name: str, total_rows: int, start: int, texts: List[str], batch_size: int
+) -> int:
+    embeddings = _encode(texts, batch_size)
+    # Write the embeddings straight into the caller's shared memory block,
+    # so that only the row count is pickled back
+    shm = SharedMemory(name=shm_name)
+    try:
+        out = np.ndarray(
+            (total_rows, EMBEDDING_DIMENSIONS), dtype=np.float32, buffer=shm.buf
+        )
+        out[start : start + len(texts)] = embeddings
+        # The view must be released before the block can be closed
+        del out
+    finally:
+        shm.close()
+    return len(texts)
+
+
+class EmbeddingPool:
+    """
+    Embeds texts over a pool of worker processes, each with its own copy of the
+    embedding model and its own share of the CPU cores.
+
+    One `encode` call only keeps a few cores busy on CPU-only hosts, while
+    independent workers with a few threads each scale with the core count.
+    An instance can be passed as `embed_fn` to the ingestion functions.
+    """
+
+    workers: int
+    threads_per_worker: int
+    batch_size: int
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        threads_per_worker: Optional[int] = None,
+        batch_size: int = 64,
+        pin_cores: bool = True,
+    ) -> None:
+        """
+        Start the worker processes.
+
+        Args:
+            workers (Optional[int]): Number of worker processes. Defaults to the
+                CPU count divided by `threads_per_worker`.
+            threads_per_worker (Optional[int]): Torch threads of each worker.
+                Defaults to an even share of the CPU count.
+            batch_size (int): Number of texts encoded per forward pass in a worker.
+            pin_cores (bool): Pin each worker to its own cores, where supported.
+        """
+        cpu_count = os.cpu_count() or 1
+        if workers is None:
+            workers = max(1, cpu_count // (threads_per_worker or 1))
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or max(1, cpu_count // workers)
+        self.batch_size = batch_size
+        # Export the quantized model once here, rather than in every worker
+        if get_inference_backend() == "onnx-int8":
+            export_quantized_onnx_model(EMBEDDING_MODEL_NAME)
+        # Workers are spawned rather than forked, since forking a process that
+        # has already started the thread pools of torch can deadlock
+        context = multiprocessing.get_context("spawn")
+        self._executor = ProcessPoolExecutor(
+            workers,
+            mp_context=context,
+            initializer=_init_embedding_worker,
+            initargs=(self.threads_per_worker, context.Value("i", 0), pin_cores),
+        )
+
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Generate embeddings for many pieces of text, using the embedding cache.
+
+        Args:
+            texts (Sequence[str]): Texts to embed.
+
+        Returns:
+            np.ndarray: C-contiguous float32 matrix of shape (len(texts), dimensions).
+        """
+        return embed_many(texts, self.batch_size, encode=self._encode)
+
+    def _encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        # Split the texts evenly over the workers, in pieces of whole forward passes
+        passes = math.ceil(len(texts) / batch_size)
+        piece_size = math.ceil(passes / self.workers) * batch_size
+
+        shm = SharedMemory(create=True, size=len(texts) * EMBEDDING_DIMENSIONS * 4)
+        try:
+            futures = [
+                self._executor.submit(
+                    _embed_into,
+                    shm.name,
+                    len(texts),
+                    start,
+                    texts[start : start + piece_size],
+                    batch_size,
+                )
+                for start in range(0, len(texts), piece_size)
+            ]
+            # Let every worker finish with the block before it is unlinked
+            wait(futures)
+            for future in futures:
+                future.result()
+            # Each piece was written at its own offset, so the rows are in input order
+            embeddings = np.ndarray(
+                (len(texts), EMBEDDING_DIMENSIONS), dtype=np.float32, buffer=shm.buf
+            ).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+        return embeddings
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+    def __enter__(self) -> "EmbeddingPool":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
@@ -1,12 +1,76 @@
-from typing import List
+import os
+import threading
+from typing import TYPE_CHECKING, Callable, List, Optional, Sequence
 
-from sentence_transformers import SentenceTransformer
+import numpy as np
+
+from utils.embedding_cache import EmbeddingCache
+from utils.inference_backend import get_inference_backend, load_sentence_transformer
+from utils.tracing import tracer
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+EMBEDDING_MODEL_NAME = "thenlper/gte-small"
+EMBEDDING_DIMENSIONS = 384
+
+# The embedding model is shared by every caller in the process
+_embedding_model: Optional["SentenceTransformer"] = None
+_embedding_model_lock = threading.Lock()
+_embedding_cache: Optional[EmbeddingCache] = None
 
 
 # Load the `gte-small` model using the Sentence Transformers library
 # https://huggingface.co/thenlper/gte-small#usage
-def create_embedding_model():
-    return SentenceTransformer("thenlper/gte-small")
+def create_embedding_model() -> "SentenceTransformer":
+    # Run it on the inference backend selected by `INFERENCE_BACKEND`
+    return load_sentence_transformer(EMBEDDING_MODEL_NAME, get_inference_backend())
+
+
+def embedding_model_key() -> str:
+    """
+    Identify the embeddings that the configured model and backend produce, so
+    that cached and stored embeddings from another backend are not mixed in.
+    """
+    backend = get_inference_backend()
+    if backend == "torch":
+        return EMBEDDING_MODEL_NAME
+    return f"{EMBEDDING_MODEL_NAME}@{backend}"
+
+
+def get_embedding_model() -> "SentenceTransformer":
+    """
+    Return the process-wide embedding model, loading it on first use.
+
+    Returns:
+        SentenceTransformer: The shared embedding model.
+    """
+    global _embedding_model
+    if _embedding_model is None:
+        with _embedding_model_lock:
+            # Another thread may have loaded the model while we were waiting
+            if _embedding_model is None:
+                _embedding_model = create_embedding_model()
+    return _embedding_model
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Return the on-disk embedding cache configured by `EMBEDDING_CACHE_DIR`, if any.
+
+    Returns:
+        Optional[EmbeddingCache]: The shared cache, or None if caching is disabled.
+    """
+    global _embedding_cache
+    cache_dir = os.getenv("EMBEDDING_CACHE_DIR")
+    if cache_dir and _embedding_cache is None:
+        with _embedding_model_lock:
+            if _embedding_cache is None:
+                max_entries = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "250000"))
+                _embedding_cache = EmbeddingCache(
+                    cache_dir, EMBEDDING_DIMENSIONS, max_entries
+                )
+    return _embedding_cache
 
 
 def get_embedding(text: str) -> List[float]:
@@ -19,6 +83,48 @@ def get_embedding(text: str) -> List[float]:
     Returns:
         List[float]: Embedding of the text as a list.
     """
-    embedding_model = create_embedding_model()
-    embedding = embedding_model.encode(text)
-    return embedding.tolist()
+    return embed_many([text])[0].tolist()
+
+
+def embed_many(
+    texts: Sequence[str],
+    batch_size: int = 256,
+    encode: Optional[Callable[[List[str], int], np.ndarray]] = None,
+) -> np.ndarray:
+    """
+    Generate embeddings for many pieces of text in batched forward passes.
+
+    Args:
+        texts (Sequence[str]): Texts to embed.
+        batch_size (int): Number of texts encoded per forward pass.
+        encode (Optional[Callable[[List[str], int], np.ndarray]]): Runs the model
+            on texts that are not cached. Defaults to the in-process model.
+
+    Returns:
+        np.ndarray: C-contiguous float32 matrix of shape (len(texts), dimensions).
+    """
+    if len(texts) == 0:
+        return np.empty((0, EMBEDDING_DIMENSIONS), dtype=np.float32)
+    encode = encode or _encode
+
+    with tracer.span("embed_many", batch_size=len(texts)) as span:
+        # Only run the model on texts that are not in the on-disk cache
+        cache = get_embedding_cache()
+        if cache is None:
+            return encode(list(texts), batch_size)
+        model_key = embedding_model_key()
+        embeddings, missing = cache.get_many(model_key, texts)
+        span.set(encoded=len(missing))
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            encoded = encode(missing_texts, batch_size)
+            embeddings[missing] = encoded
+            cache.put_many(model_key, missing_texts, encoded)
+        return embeddings
+
+
+def _encode(texts: List[str], batch_size: int) -> np.ndarray:
+    embeddings = get_embedding_model().encode(
+        texts, batch_size=batch_size, convert_to_numpy=True
+    )
+    return np.ascontiguousarray(embeddings, dtype=np.float32)
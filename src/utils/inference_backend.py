@@ -0,0 +1,223 @@
+import os
+import shutil
+import tempfile
+from typing import TYPE_CHECKING, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from sentence_transformers import CrossEncoder, SentenceTransformer
+
+# "torch" is the stock fp32 model, "int8" quantizes its Linear layers with
+# PyTorch, "onnx" runs an exported ONNX graph and "onnx-int8" a quantized one
+INFERENCE_BACKENDS = ("torch", "int8", "onnx", "onnx-int8")
+
+
+def get_inference_backend() -> str:
+    """
+    Return the inference backend selected by `INFERENCE_BACKEND`, "torch" by default.
+    """
+    backend = os.getenv("INFERENCE_BACKEND", "torch")
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(
+            f"Unknown inference backend {backend!r}, expected one of {INFERENCE_BACKENDS}"
+        )
+    return backend
+
+
+def _onnx_model_kwargs() -> Dict:
+    # Honour the thread limit of embedding pool workers, which ONNX Runtime
+    # would otherwise ignore and size its thread pool to every core
+    threads = os.getenv("OMP_NUM_THREADS")
+    if not threads:
+        return {}
+    import onnxruntime
+
+    session_options = onnxruntime.SessionOptions()
+    session_options.intra_op_num_threads = int(threads)
+    session_options.inter_op_num_threads = 1
+    return {"session_options": session_options}
+
+
+def load_sentence_transformer(model_name: str, backend: str) -> "SentenceTransformer":
+    """
+    Load a Sentence Transformers model for the given inference backend.
+
+    The ONNX backends need the `onnx` extra (`uv sync --extra onnx`). The
+    quantized ONNX graph is exported once into `ONNX_MODEL_DIR` and loaded
+    from there afterwards. `ONNX_QUANTIZATION` selects the instruction set it
+    is quantized for: "avx512_vnni" (default), "avx512", "avx2" or "arm64".
+
+    Args:
+        model_name (str): Name of the model on the Hugging Face Hub.
+        backend (str): One of `INFERENCE_BACKENDS`.
+
+    Returns:
+        SentenceTransformer: The loaded model.
+    """
+    # Imported here so that importing this module doesn't load torch
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+    if backend == "int8":
+        return quantize_dynamic(SentenceTransformer(model_name))
+    if backend == "onnx":
+        return SentenceTransformer(
+            model_name, backend="onnx", model_kwargs=_onnx_model_kwargs()
+        )
+
+    model_dir, file_name = export_quantized_onnx_model(model_name)
+    return SentenceTransformer(
+        model_dir,
+        backend="onnx",
+        model_kwargs={"file_name": file_name, **_onnx_model_kwargs()},
+    )
+
+
+def export_quantized_onnx_model(model_name: str) -> Tuple[str, str]:
+    """
+    Export the quantized ONNX graph of a model, unless it was exported before.
+
+    The export is written to a temporary directory and moved into place with
+    an atomic rename, so processes exporting at the same time, such as the
+    workers of an embedding pool, never load a half-written model.
+
+    Args:
+        model_name (str): Name of the model on the Hugging Face Hub.
+
+    Returns:
+        Tuple[str, str]: The model directory, and the graph's file within it.
+    """
+    # https://sbert.net/docs/sentence_transformer/usage/efficiency.html#quantizing-onnx-models
+    quantization = os.getenv("ONNX_QUANTIZATION", "avx512_vnni")
+    model_dir = os.path.join(os.getenv("ONNX_MODEL_DIR", ".onnx_models"), model_name)
+    file_name = f"onnx/model_qint8_{quantization}.onnx"
+    if os.path.exists(os.path.join(model_dir, file_name)):
+        return model_dir, file_name
+
+    from sentence_transformers import (
+        SentenceTransformer,
+        export_dynamic_quantized_onnx_model,
+    )
+
+    os.makedirs(os.path.dirname(model_dir) or ".", exist_ok=True)
+    export_dir = tempfile.mkdtemp(dir=os.path.dirname(model_dir) or ".")
+    try:
+        model = SentenceTransformer(model_name, backend="onnx")
+        model.save(export_dir)
+        export_dynamic_quantized_onnx_model(model, quantization, export_dir)
+        try:
+            # Publishes the whole model directory at once...
+            os.rename(export_dir, model_dir)
+        except OSError:
+            # ...or, if another process published it first or it holds another
+            # quantization, just the graph
+            os.makedirs(os.path.join(model_dir, "onnx"), exist_ok=True)
+            os.replace(
+                os.path.join(export_dir, file_name), os.path.join(model_dir, file_name)
+            )
+    finally:
+        shutil.rmtree(export_dir, ignore_errors=True)
+    return model_dir, file_name
+
+
+def load_cross_encoder(model_name: str, backend: str) -> "CrossEncoder":
+    """
+    Load a cross-encoder for the given inference backend.
+
+    `CrossEncoder` has no ONNX backend in sentence-transformers 3.3, so "onnx"
+    runs the stock model and "onnx-int8" the PyTorch-quantized one.
+
+    Args:
+        model_name (str): Name of the model on the Hugging Face Hub.
+        backend (str): One of `INFERENCE_BACKENDS`.
+
+    Returns:
+        CrossEncoder: The loaded model.
+    """
+    from sentence_transformers import CrossEncoder
+
+    model = CrossEncoder(model_name)
+    if backend.endswith("int8"):
+        model.model = quantize_dynamic(model.model)
+    return model
+
+
+def quantize_dynamic(model):
+    """
+    Quantize the weights of a model's Linear layers to int8, on CPU.
+
+    Activations are quantized on the fly, so no calibration data is needed.
+    """
+    import torch
+
+    return torch.quantization.quantize_dynamic(
+        model.to("cpu"), {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def embedding_parity(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """
+    Compare the embeddings of a backend with the fp32 reference, row by row.
+
+    Args:
+        reference (np.ndarray): Reference embeddings, one per row.
+        candidate (np.ndarray): Embeddings of the same texts from another backend.
+
+    Returns:
+        Dict[str, float]: Mean, p99 and max cosine drift, `1 - cosine similarity`.
+    """
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    drift = 1 - np.sum(reference * candidate, axis=1)
+    return {
+        "cosine_drift_mean": float(drift.mean()),
+        "cosine_drift_p99": float(np.percentile(drift, 99)),
+        "cosine_drift_max": float(drift.max()),
+    }
+
+
+def rerank_parity(
+    reference: Sequence[Sequence[float]],
+    candidate: Sequence[Sequence[float]],
+    top_k: int = 5,
+) -> Dict[str, float]:
+    """
+    Compare the rerank orders of a backend with the fp32 reference.
+
+    Args:
+        reference (Sequence[Sequence[float]]): Reference scores of each query's
+            documents.
+        candidate (Sequence[Sequence[float]]): Scores of the same pairs from
+            another backend.
+        top_k (int): Number of documents the application keeps per query.
+
+    Returns:
+        Dict[str, float]: Fraction of queries with the same top document,
+        fraction with the same top-k in the same order, and mean top-k overlap.
+    """
+    same_top_1, same_top_k, overlaps = [], [], []
+    for ref_scores, scores in zip(reference, candidate):
+        ref_order = list(np.argsort(ref_scores)[::-1][:top_k])
+        order = list(np.argsort(scores)[::-1][:top_k])
+        same_top_1.append(ref_order[0] == order[0])
+        same_top_k.append(ref_order == order)
+        overlaps.append(len(set(ref_order) & set(order)) / len(ref_order))
+    return {
+        "top_1_agreement": float(np.mean(same_top_1)),
+        "top_k_order_agreement": float(np.mean(same_top_k)),
+        "top_k_overlap": float(np.mean(overlaps)),
+    }
+
+
+def rerank_scores(
+    model: "CrossEncoder", requests: List[Tuple[str, List[str]]]
+) -> List[List[float]]:
+    """
+    Score the documents of each (query, documents) request with a cross-encoder.
+    """
+    return [
+        [float(s) for s in model.predict([(query, doc) for doc in documents])]
+        for query, documents in requests
+    ]
@@ -0,0 +1,216 @@
+import json
+import os
+import queue
+import threading
+from collections import deque
+from itertools import islice
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from utils.chunk_data import chunk_documents, get_chunk_id, get_parent
+from utils.generate_embeddings import embed_many
+from utils.tracing import with_current_context
+
+# Marks the end of a stage's output
+_DONE = object()
+
+
+class IngestCheckpoint:
+    """
+    Records how many source documents have been fully written so that an
+    interrupted ingestion can resume where it stopped.
+    """
+
+    path: str
+    next_doc: int
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.next_doc = 0
+        if os.path.exists(path):
+            with open(path) as f:
+                self.next_doc = json.load(f)["next_doc"]
+
+    def save(self, next_doc: int) -> None:
+        # Write to a temporary file first so a crash never leaves a torn checkpoint
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"next_doc": next_doc}, f)
+        os.replace(tmp_path, self.path)
+        self.next_doc = next_doc
+
+    def clear(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.next_doc = 0
+
+
+def put_until_stopped(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """
+    Put an item on a bounded queue between threads, blocking while it is full.
+
+    Gives up once `stop` is set, e.g. because another stage has failed or the
+    consumer has stopped reading, and returns whether the item was queued.
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q: queue.Queue, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def iter_batches(items: Iterable, batch_size: int) -> Iterable[Tuple]:
+    """
+    Split an iterable into tuples of at most `batch_size` items.
+    """
+    iterator = iter(items)
+    while batch := tuple(islice(iterator, batch_size)):
+        yield batch
+
+
+def run_ingest_pipeline(
+    docs: Iterable[Dict],
+    write_batch: Callable[[List[Dict]], None],
+    checkpoint: Optional[IngestCheckpoint] = None,
+    write_parents: Optional[Callable[[List[Dict]], None]] = None,
+    text_field: str = "body",
+    embed_batch_size: int = 256,
+    write_batch_size: int = 1000,
+    queue_size: int = 8,
+    chunk_workers: Optional[int] = None,
+    embed_fn: Callable[[List[str]], np.ndarray] = embed_many,
+) -> int:
+    """
+    Chunk, embed and write documents as a streaming pipeline.
+
+    Chunking, embedding and writing run in their own threads connected by
+    bounded queues, so memory stays flat regardless of corpus size and
+    embedding overlaps with database writes. Embedding batches always end on
+    a document boundary, which lets the checkpoint record whole documents.
+
+    The checkpoint is saved once every chunk of a batch is written, so after
+    a crash the documents of the last batch are written again. Every chunk
+    has a deterministic `_id` and `write_batch` must upsert by it, e.g. with
+    `MongoDriver.upsert_batch`, so that nothing is duplicated on resume.
+
+    Args:
+        docs (Iterable[Dict]): Source documents, in a stable order across runs.
+        write_batch (Callable[[List[Dict]], None]): Idempotently writes a batch of
+            embedded chunks, replacing any chunk with the same `_id`.
+        checkpoint (Optional[IngestCheckpoint]): Checkpoint to resume from and update.
+        write_parents (Optional[Callable[[List[Dict]], None]]): Writes the parent
+            article records of a batch, before its chunks are written.
+        text_field (str): Text field to chunk and embed.
+        embed_batch_size (int): Minimum number of chunks per embedding batch.
+        write_batch_size (int): Maximum number of chunks per `write_batch` call.
+        queue_size (int): Maximum number of items buffered between two stages.
+        chunk_workers (Optional[int]): Number of chunking processes.
+        embed_fn (Callable[[List[str]], np.ndarray]): Batched embedding function.
+
+    Returns:
+        int: Number of chunks written.
+    """
+    start_doc = checkpoint.next_doc if checkpoint else 0
+    chunk_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    write_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors: List[BaseException] = []
+
+    def chunk_stage() -> None:
+        try:
+            # Keep each document's parent record until its chunks come back
+            parents: deque = deque()
+
+            def source() -> Iterable[Dict]:
+                # Skip documents that were fully written by a previous run
+                for doc in islice(docs, start_doc, None):
+                    parents.append(get_parent(doc, text_field))
+                    yield doc
+
+            chunked = chunk_documents(source(), text_field, workers=chunk_workers)
+            for doc_index, chunks in enumerate(chunked, start_doc):
+                item = (doc_index, parents.popleft(), chunks)
+                if not put_until_stopped(chunk_queue, item, stop):
+                    return
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            put_until_stopped(chunk_queue, _DONE, stop)
+
+    def embed_stage() -> None:
+        def flush(last_doc: int, parents: List[Dict], pending: List[Dict]) -> bool:
+            embeddings = embed_fn([chunk[text_field] for chunk in pending])
+            # Writers encode the float32 rows into their storage format
+            for chunk, embedding in zip(pending, embeddings):
+                chunk["embedding"] = embedding
+                # A stable `_id` lets a resumed run overwrite what it already wrote
+                chunk.setdefault("_id", get_chunk_id(chunk, text_field))
+            return put_until_stopped(write_queue, (last_doc, parents, pending), stop)
+
+        try:
+            parents: List[Dict] = []
+            pending: List[Dict] = []
+            last_doc = start_doc - 1
+            while (item := _get(chunk_queue, stop)) is not _DONE:
+                last_doc, parent, chunks = item
+                parents.append(parent)
+                pending.extend(chunks)
+                if len(pending) >= embed_batch_size:
+                    if not flush(last_doc, parents, pending):
+                        return
+                    parents, pending = [], []
+            if parents and not stop.is_set():
+                flush(last_doc, parents, pending)
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            put_until_stopped(write_queue, _DONE, stop)
+
+    # The stages run in the caller's context, so their spans join its trace
+    threads = [
+        threading.Thread(
+            target=with_current_context(chunk_stage), name="ingest-chunk", daemon=True
+        ),
+        threading.Thread(
+            target=with_current_context(embed_stage), name="ingest-embed", daemon=True
+        ),
+    ]
+    for thread in threads:
+        thread.start()
+
+    # Write batches on the calling thread as they come out of the embedding stage
+    written = 0
+    try:
+        while (item := _get(write_queue, stop)) is not _DONE:
+            last_doc, parents, batch = item
+            if write_parents:
+                write_parents(parents)
+            for part in iter_batches(batch, write_batch_size):
+                write_batch(list(part))
+                written += len(part)
+            if checkpoint:
+                checkpoint.save(last_doc + 1)
+    except BaseException as e:
+        errors.append(e)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+    return written
@@ -1,13 +1,180 @@
-import pandas as pd
-from datasets import IterableDataset
-from datasets import load_dataset as load
+import glob
+import os
+import queue
+import threading
+from itertools import islice
+from typing import Callable, Dict, Iterator, List, Optional
+
+from utils.ingest_pipeline import put_until_stopped
+
+DATASET_NAME = "mongodb/devcenter-articles"
+SNAPSHOT_EXTENSIONS = (".parquet", ".arrow")
+
+# Marks the end of a shard
+_DONE = object()
 
 
 # Load the dataset
-def load_dataset():
-    data = load("mongodb/devcenter-articles", split="train", streaming=True)
+def load_dataset(
+    limit: Optional[int] = None,
+    snapshot: Optional[str] = None,
+    workers: Optional[int] = None,
+    prefetch: int = 256,
+) -> Iterator[Dict]:
+    """
+    Stream the records of the dataset, reading several shards in parallel.
+
+    Records are yielded lazily and in the same order on every run, so memory
+    stays flat regardless of the corpus size and ingestion can resume from a
+    checkpoint.
+
+    Args:
+        limit (Optional[int]): Maximum number of records. Defaults to
+            `DATASET_LIMIT`, or 20; 0 reads the whole split.
+        snapshot (Optional[str]): Directory or glob of local Parquet/Arrow files
+            to read instead of the Hugging Face Hub. Defaults to `DATASET_SNAPSHOT`.
+        workers (Optional[int]): Number of shards read ahead in parallel.
+            Defaults to `DATASET_WORKERS`, or 4.
+        prefetch (int): Maximum number of records buffered per shard.
+
+    Returns:
+        Iterator[Dict]: The records of the `train` split.
+    """
+    if limit is None:
+        limit = int(os.getenv("DATASET_LIMIT", "20"))
+    snapshot = snapshot or os.getenv("DATASET_SNAPSHOT")
+    workers = workers or int(os.getenv("DATASET_WORKERS", "4"))
+
+    shards = snapshot_shards(snapshot) if snapshot else hub_shards()
+    records = read_shards(shards, workers, prefetch)
+    try:
+        yield from islice(records, limit) if limit > 0 else records
+    finally:
+        # Stop reading ahead once the limit is reached or the caller stops early
+        records.close()
+
+
+def hub_shards() -> List[Callable[[], Iterator[Dict]]]:
+    """
+    Split the streaming `train` split of the dataset into its shards.
+    """
+    # Imported here so that reading a local snapshot doesn't need `datasets`
+    from datasets import IterableDataset
+    from datasets import load_dataset as load
+
+    data = load(DATASET_NAME, split="train", streaming=True)
     assert isinstance(data, IterableDataset)
-    data_head = list(data.take(20))
-    docs = pd.DataFrame(data_head).to_dict("records")
+    # Reading the shards one after another returns the records in their original order
+    return [
+        lambda index=index: iter(data.shard(data.num_shards, index))
+        for index in range(data.num_shards)
+    ]
+
+
+def snapshot_shards(path: str) -> List[Callable[[], Iterator[Dict]]]:
+    """
+    List the files of a local snapshot, one shard per file in name order.
+    """
+    if os.path.isdir(path):
+        path = os.path.join(path, "*")
+    files = sorted(f for f in glob.glob(path) if f.endswith(SNAPSHOT_EXTENSIONS))
+    if not files:
+        raise FileNotFoundError(f"No Parquet or Arrow files match {path}")
+    return [lambda file=file: _read_file(file) for file in files]
+
+
+def _read_file(path: str, batch_size: int = 1024) -> Iterator[Dict]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Decode one record batch at a time rather than the whole file
+    if path.endswith(".parquet"):
+        batches = pq.ParquetFile(path).iter_batches(batch_size)
+    else:
+        # `datasets` saves Arrow streams, other tools Arrow IPC files
+        try:
+            batches = iter(pa.ipc.open_stream(path))
+        except pa.ArrowInvalid:
+            reader = pa.ipc.open_file(path)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    for batch in batches:
+        yield from batch.to_pylist()
+
+
+def read_shards(
+    shards: List[Callable[[], Iterator[Dict]]], workers: int, prefetch: int = 256
+) -> Iterator[Dict]:
+    """
+    Read shards on background threads and yield their records in shard order.
+
+    At most `workers` shards are read ahead, each into a queue of at most
+    `prefetch` records. Closing the iterator stops the readers.
+
+    Args:
+        shards (List[Callable[[], Iterator[Dict]]]): Open each shard's records.
+        workers (int): Number of shards read in parallel.
+        prefetch (int): Maximum number of records buffered per shard.
+
+    Returns:
+        Iterator[Dict]: The records of every shard, in order.
+    """
+    stop = threading.Event()
+
+    def read(shard: Callable[[], Iterator[Dict]], q: queue.Queue) -> None:
+        try:
+            for record in shard():
+                if not put_until_stopped(q, record, stop):
+                    return
+            put_until_stopped(q, _DONE, stop)
+        except BaseException as e:
+            put_until_stopped(q, e, stop)
+
+    def start(shard: Callable[[], Iterator[Dict]]) -> queue.Queue:
+        q: queue.Queue = queue.Queue(maxsize=prefetch)
+        threading.Thread(target=read, args=(shard, q), daemon=True).start()
+        return q
+
+    pending = [start(shard) for shard in shards[:workers]]
+    remaining = iter(shards[workers:])
+    try:
+        while pending:
+            q = pending.pop(0)
+            while (record := q.get()) is not _DONE:
+                if isinstance(record, BaseException):
+                    raise record
+                yield record
+            # Start the next shard as soon as one is finished
+            if (shard := next(remaining, None)) is not None:
+                pending.append(start(shard))
+    finally:
+        stop.set()
+
+
+def save_snapshot(
+    path: str, limit: Optional[int] = None, rows_per_file: int = 10_000
+) -> int:
+    """
+    Save the dataset from the Hub as numbered Parquet files, for
+    `load_dataset(snapshot=path)`.
+
+    Args:
+        path (str): Directory to write the files to.
+        limit (Optional[int]): Maximum number of records, or None for the whole split.
+        rows_per_file (int): Number of records per file.
+
+    Returns:
+        int: Number of records saved.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
 
-    return docs
+    os.makedirs(path, exist_ok=True)
+    saved = 0
+    records = read_shards(hub_shards(), int(os.getenv("DATASET_WORKERS", "4")))
+    if limit:
+        records = islice(records, limit)
+    while batch := list(islice(records, rows_per_file)):
+        file = os.path.join(path, f"part-{saved // rows_per_file:05d}.parquet")
+        pq.write_table(pa.Table.from_pylist(batch), file)
+        saved += len(batch)
+    return saved
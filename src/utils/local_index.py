@@ -0,0 +1,325 @@
+import json
+import os
+from typing import Any, Callable, Dict, Iterable, List, Optional, Protocol
+
+import numpy as np
+
+from utils.generate_embeddings import EMBEDDING_DIMENSIONS, get_embedding
+from utils.tracing import tracer
+from utils.vector_encoding import decode_vector
+
+
+class SearchBackend(Protocol):
+    """
+    Retrieval contract shared by `MongoDriver` and `LocalVectorIndex`.
+    """
+
+    def vector_search(
+        self,
+        collection_name: str,
+        user_query: str,
+        filter: Optional[Dict] = None,
+        rerank: bool = False,
+    ) -> List[Dict]: ...
+
+
+def get_field(doc: Dict, path: str) -> Any:
+    # Resolve a dotted path such as "metadata.contentType"
+    value: Any = doc
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def matches_filter(doc: Dict, filter: Dict) -> bool:
+    """
+    Evaluate the subset of MQL that `$vectorSearch` filters support against a document.
+
+    Args:
+        doc (Dict): Document to test.
+        filter (Dict): Filter using `$and`, `$or`, `$not`, and `$eq`, `$ne`,
+            `$gt`, `$gte`, `$lt`, `$lte`, `$in` or `$nin` on dotted paths.
+
+    Returns:
+        bool: Whether the document matches.
+    """
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(doc, f) for f in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(doc, f) for f in condition):
+                return False
+        elif key == "$not":
+            if matches_filter(doc, condition):
+                return False
+        else:
+            value = get_field(doc, key)
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for op, operand in condition.items():
+                if not _compare(value, op, operand):
+                    return False
+    return True
+
+
+def _compare(value: Any, op: str, operand: Any) -> bool:
+    if op == "$eq":
+        return value == operand
+    if op == "$ne":
+        return value != operand
+    if op == "$in":
+        return value in operand
+    if op == "$nin":
+        return value not in operand
+    if value is None:
+        return False
+    try:
+        if op == "$gt":
+            return value > operand
+        if op == "$gte":
+            return value >= operand
+        if op == "$lt":
+            return value < operand
+        if op == "$lte":
+            return value <= operand
+    except TypeError:
+        # Like MQL, values of different types never compare
+        return False
+    raise ValueError(f"Unsupported filter operator: {op}")
+
+
+class LocalVectorIndex:
+    """
+    In-process vector search over a memory-mapped float32 matrix of embeddings.
+
+    `mode="exact"` scores every stored vector with one matrix-vector product.
+    `mode="ivf"` clusters the vectors into inverted lists at build time and
+    only scores the `n_probe` lists closest to the query, for larger corpora.
+
+    Searches return `limit` documents, or `rerank_limit` candidates when their
+    results will be re-ranked, like the tuned settings of `MongoDriver`.
+    """
+
+    directory: str
+    mode: str
+    n_probe: int
+    limit: int
+    rerank_limit: int
+
+    def __init__(
+        self,
+        directory: str,
+        mode: str = "exact",
+        n_probe: int = 8,
+        limit: int = 5,
+        rerank_limit: int = 20,
+        fields: Optional[List[str]] = None,
+    ) -> None:
+        if mode not in ("exact", "ivf"):
+            raise ValueError(f"Unknown search mode: {mode}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.mode = mode
+        self.n_probe = n_probe
+        self.limit = limit
+        self.rerank_limit = rerank_limit
+        # Fields returned with each result, like the $project stage in MongoDriver
+        self.fields = fields or [
+            "body",
+            "parent_id",
+            "chunk_index",
+            "start",
+            "end",
+            "token_count",
+        ]
+        self._collections: Dict[str, Dict] = {}
+        # Embeds a single query; can be swapped for a batching wrapper when serving
+        self.embed_query: Callable[[str], List[float]] = get_embedding
+
+    def _path(self, collection_name: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{collection_name}.{suffix}")
+
+    def build(
+        self, collection_name: str, docs: Iterable[Dict], n_lists: Optional[int] = None
+    ) -> int:
+        """
+        Write the index for a collection from documents that carry an `embedding`.
+
+        Args:
+            collection_name (str): Name to store the index under.
+            docs (Iterable[Dict]): Documents, e.g. a cursor over the Mongo collection.
+            n_lists (Optional[int]): Number of IVF lists. Defaults to sqrt(#docs).
+
+        Returns:
+            int: Number of indexed documents.
+        """
+        count = 0
+        # Stream vectors and documents to disk so building never holds the corpus
+        with (
+            open(self._path(collection_name, "f32"), "wb") as vectors_file,
+            open(self._path(collection_name, "jsonl"), "w") as docs_file,
+        ):
+            for doc in docs:
+                doc = dict(doc)
+                vector = decode_vector(doc.pop("embedding"))
+                # Normalize once so that cosine similarity is a dot product
+                vector /= np.linalg.norm(vector) or 1.0
+                vectors_file.write(vector.tobytes())
+                docs_file.write(json.dumps(doc, default=str) + "\n")
+                count += 1
+
+        ivf_path = self._path(collection_name, "ivf.npz")
+        if os.path.exists(ivf_path):
+            os.remove(ivf_path)
+        if count:
+            vectors = self._open_vectors(collection_name)
+            n_lists = n_lists or max(1, int(np.sqrt(count)))
+            centroids, assignments = _kmeans(vectors, n_lists)
+            np.savez(
+                ivf_path,
+                centroids=centroids,
+                assignments=assignments,
+            )
+        self._collections.pop(collection_name, None)
+        return count
+
+    def _open_vectors(self, collection_name: str) -> np.ndarray:
+        path = self._path(collection_name, "f32")
+        if os.path.getsize(path) == 0:
+            return np.empty((0, EMBEDDING_DIMENSIONS), dtype=np.float32)
+        vectors = np.memmap(path, dtype=np.float32, mode="r")
+        return vectors.reshape(-1, EMBEDDING_DIMENSIONS)
+
+    def _load(self, collection_name: str) -> Dict:
+        if collection_name not in self._collections:
+            with open(self._path(collection_name, "jsonl")) as f:
+                docs = [json.loads(line) for line in f]
+            collection = {"vectors": self._open_vectors(collection_name), "docs": docs}
+            ivf_path = self._path(collection_name, "ivf.npz")
+            if os.path.exists(ivf_path):
+                ivf = np.load(ivf_path)
+                assignments = ivf["assignments"]
+                collection["centroids"] = ivf["centroids"]
+                collection["lists"] = [
+                    np.flatnonzero(assignments == i)
+                    for i in range(len(ivf["centroids"]))
+                ]
+            collection["masks"] = {}
+            self._collections[collection_name] = collection
+        return self._collections[collection_name]
+
+    def _filter_mask(self, collection: Dict, filter: Dict) -> np.ndarray:
+        # Filter masks are computed once per filter shape and reused
+        key = json.dumps(filter, sort_keys=True, default=str)
+        if key not in collection["masks"]:
+            collection["masks"][key] = np.fromiter(
+                (matches_filter(doc, filter) for doc in collection["docs"]),
+                dtype=bool,
+                count=len(collection["docs"]),
+            )
+        return collection["masks"][key]
+
+    def search_vector(
+        self,
+        collection_name: str,
+        query_vector: np.ndarray,
+        filter: Optional[Dict] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict]:
+        """
+        Retrieve the documents closest to a query vector.
+
+        Args:
+            collection_name (str): Indexed collection to search.
+            query_vector (np.ndarray): Query embedding.
+            filter (Optional[Dict]): MQL filter on document fields.
+            limit (Optional[int]): Number of documents to return.
+
+        Returns:
+            List[Dict]: Matching documents with a `score` in [0, 1], best first.
+        """
+        collection = self._load(collection_name)
+        limit = limit or self.limit
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        if self.mode == "ivf" and "centroids" in collection:
+            probes = np.argsort(collection["centroids"] @ query)[::-1][: self.n_probe]
+            candidates = np.sort(
+                np.concatenate([collection["lists"][i] for i in probes])
+            )
+        else:
+            candidates = np.arange(len(collection["docs"]))
+        if filter:
+            candidates = candidates[self._filter_mask(collection, filter)[candidates]]
+        if len(candidates) == 0:
+            return []
+
+        similarities = collection["vectors"][candidates] @ query
+        k = min(limit, len(candidates))
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+
+        results = []
+        for i in top:
+            doc = collection["docs"][candidates[i]]
+            result = {field: get_field(doc, field) for field in self.fields}
+            # Same scale as Atlas' cosine vectorSearchScore
+            result["score"] = float((1 + similarities[i]) / 2)
+            results.append(result)
+        return results
+
+    def vector_search(
+        self,
+        collection_name: str,
+        user_query: str,
+        filter: Optional[Dict] = None,
+        rerank: bool = False,
+    ) -> List[Dict]:
+        """
+        Retrieve relevant documents for a user query using the local index.
+
+        Args:
+            collection_name (str): Indexed collection to search.
+            user_query (str): The user's query string.
+            filter (Optional[Dict]): MQL filter on document fields.
+            rerank (bool): Whether the results will be re-ranked, in which case
+                `rerank_limit` candidates are returned instead of `limit`.
+
+        Returns:
+            List[Dict]: A list of matching documents.
+        """
+        with tracer.span("vector_search", collection=collection_name, backend="local"):
+            with tracer.span("embed_query"):
+                query_vector = np.asarray(
+                    self.embed_query(user_query), dtype=np.float32
+                )
+            limit = self.rerank_limit if rerank else self.limit
+            return self.search_vector(collection_name, query_vector, filter, limit)
+
+
+def _kmeans(
+    vectors: np.ndarray, n_clusters: int, iterations: int = 10, sample_size=50_000
+) -> tuple:
+    # Spherical k-means trained on a sample, then every vector is assigned
+    rng = np.random.default_rng(0)
+    n_clusters = min(n_clusters, len(vectors))
+    sample_ids = rng.choice(len(vectors), min(sample_size, len(vectors)), replace=False)
+    sample = np.asarray(vectors[np.sort(sample_ids)])
+    centroids = sample[rng.choice(len(sample), n_clusters, replace=False)]
+    for _ in range(iterations):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        for i in range(n_clusters):
+            members = sample[labels == i]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[i] = centroid / (np.linalg.norm(centroid) or 1.0)
+
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), 65_536):
+        block = np.asarray(vectors[start : start + 65_536])
+        assignments[start : start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return centroids, assignments
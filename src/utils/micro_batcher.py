@@ -0,0 +1,115 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from contextvars import copy_context
+from typing import Any, Callable, Dict, List, Optional
+
+
+class MicroBatcher:
+    """
+    Groups items submitted from many threads into batches for one function call.
+
+    A background thread waits for the first item, then keeps collecting until
+    it has `max_batch_size` items or `max_wait_ms` milliseconds have passed,
+    and calls `process_batch` once for the whole batch. The call runs in the
+    context of the batch's first submitter, so its spans join that trace.
+    """
+
+    max_batch_size: int
+    max_wait_ms: float
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        name: str = "micro-batcher",
+    ) -> None:
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue: queue.Queue = queue.Queue()
+        self._batch_sizes: Counter = Counter()
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._stop_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        future: Future = Future()
+        with self._stop_lock:
+            if self._stopped:
+                future.set_exception(RuntimeError(f"{self._thread.name} has stopped"))
+            else:
+                self._queue.put((item, future, copy_context()))
+        return future
+
+    def __call__(self, item: Any, timeout: Optional[float] = None) -> Any:
+        # Block the calling thread until the item's batch has been processed
+        return self.submit(item).result(timeout)
+
+    def _run(self) -> None:
+        try:
+            self._process_batches()
+        finally:
+            # Fail whatever is still queued once the thread stops
+            with self._stop_lock:
+                self._stopped = True
+            while True:
+                try:
+                    _, future, _ = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                future.set_exception(RuntimeError(f"{self._thread.name} has stopped"))
+
+    def _process_batches(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            with self._lock:
+                self._batch_sizes[len(batch)] += 1
+            items = [item for item, _, _ in batch]
+            context = batch[0][2]
+            try:
+                results = list(context.run(self.process_batch, items))
+                if len(results) != len(batch):
+                    raise RuntimeError(
+                        f"{self._thread.name} got {len(results)} results "
+                        f"for a batch of {len(batch)}"
+                    )
+            except BaseException as e:
+                # Never leave a caller waiting, even if the thread is going down
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                if not isinstance(e, Exception):
+                    raise
+                continue
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+    def metrics(self) -> Dict:
+        """
+        Return the current queue depth and the distribution of batch sizes.
+        """
+        with self._lock:
+            batches = sum(self._batch_sizes.values())
+            items = sum(size * count for size, count in self._batch_sizes.items())
+            return {
+                "queue_depth": self._queue.qsize(),
+                "batches": batches,
+                "items": items,
+                "mean_batch_size": items / batches if batches else 0.0,
+                "batch_sizes": dict(sorted(self._batch_sizes.items())),
+            }
@@ -1,14 +1,60 @@
+import json
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
 
-from pymongo import MongoClient
+import numpy as np
+from pymongo import DeleteMany, MongoClient, ReplaceOne, UpdateOne
 
-from utils.generate_embeddings import get_embedding
+from utils.answer_cache import AnswerCache
+from utils.chunk_data import FILTER_FIELDS, get_chunks, get_parent
+from utils.generate_embeddings import embed_many, get_embedding
+from utils.ingest_pipeline import iter_batches
+from utils.local_index import get_field
+from utils.query_cache import TTLCache
+from utils.search_index import (
+    vector_index_definition,
+    versioned_index_name,
+    wait_for_index,
+)
+from utils.search_tuning import (
+    DEFAULT_SEARCH_SETTINGS,
+    filter_shape,
+    search_settings_for,
+)
+from utils.tracing import tracer
+from utils.vector_encoding import VECTOR_ENCODINGS, encode_vector
+
+# Records which vector search index serves each collection
+INDEX_ALIAS_COLLECTION = "search_index_aliases"
+# Tuned numCandidates and limit per collection and filter shape
+SEARCH_SETTINGS_COLLECTION = "search_settings"
+# Version of each collection's contents, bumped by every write
+COLLECTION_VERSION_COLLECTION = "collection_versions"
+
+
+def filter_fields_update(chunk: Dict) -> Dict:
+    """
+    Build an update that sets a stored chunk's `FILTER_FIELDS` to those of `chunk`.
+    """
+    values = {path: get_field(chunk, path) for path in FILTER_FIELDS}
+    update: Dict = {}
+    if present := {path: v for path, v in values.items() if v is not None}:
+        update["$set"] = present
+    if missing := {path: "" for path, v in values.items() if v is None}:
+        update["$unset"] = missing
+    return update
 
 
 class MongoDriver:
     client: MongoClient
     db_name: str
     vector_search_index_name: str
+    parent_collection_name: str
+    vector_encoding: str
+    vector_index_base_name: str
+    answer_cache: AnswerCache
 
     def __init__(
         self,
@@ -16,140 +62,599 @@ class MongoDriver:
         appname="devrel.workshop.rag",
         db_name="mongodb_rag_lab",
         vector_search_index_name="vector_index",
+        parent_collection_name="articles",
+        vector_encoding="float64",
+        answer_cache_collection_name="answer_cache",
     ) -> None:
+        if vector_encoding not in VECTOR_ENCODINGS:
+            raise ValueError(f"Unknown vector encoding: {vector_encoding}")
         self.client = MongoClient(uri, appname=appname)
         self.db_name = db_name
+        # Index used until a collection has an index deployed by
+        # `deploy_vector_search_index`, and the prefix of deployed index names
         self.vector_search_index_name = vector_search_index_name
+        self.vector_index_base_name = vector_search_index_name
+        # Chunks reference their parent article in this collection by `parent_id`
+        self.parent_collection_name = parent_collection_name
+        # Storage format of the `embedding` field, see `utils.vector_encoding`
+        self.vector_encoding = vector_encoding
+        # Top-k results per (collection, version, query), and query embeddings per query
+        self.result_cache = TTLCache(max_entries=1024, ttl=300)
+        # Collection versions, see `get_collection_version`
+        self.collection_versions = TTLCache(max_entries=64, ttl=5)
+        self.query_embedding_cache = TTLCache(max_entries=4096, ttl=3600)
+        # Live vector search index per collection, see `get_index_name`
+        self.index_aliases = TTLCache(max_entries=64, ttl=30)
+        # numCandidates and limit per (collection, filter shape), see `get_search_settings`
+        self.search_settings = TTLCache(max_entries=256, ttl=300)
+        # Embeds a single query; can be swapped for a batching wrapper when serving
+        self.embed_query: Callable[[str], List[float]] = get_embedding
+        # Generated answers, deleted whenever one of their source chunks changes
+        self.answer_cache = AnswerCache(
+            self.client[db_name][answer_cache_collection_name]
+        )
+
+    def invalidate_cache(self, collection_name: str) -> None:
+        """
+        Mark cached search results of a collection as stale, in every process.
+
+        Results are cached under the collection's version, so bumping it in
+        the `collection_versions` collection stops other processes, e.g. the
+        servers while `main.py` ingests, from reusing their cached results
+        once they re-read the version, within `collection_versions.ttl` seconds.
+        """
+        self.client[self.db_name][COLLECTION_VERSION_COLLECTION].update_one(
+            {"_id": collection_name}, {"$inc": {"version": 1}}, upsert=True
+        )
+        self.collection_versions.invalidate(lambda key: key == collection_name)
+        self.result_cache.invalidate(lambda key: key[0] == collection_name)
+
+    def get_collection_version(self, collection_name: str) -> int:
+        """
+        Return the version of a collection's contents, re-read at most every
+        `collection_versions.ttl` seconds.
+        """
+        version = self.collection_versions.get(collection_name)
+        if version is None:
+            record = self.client[self.db_name][COLLECTION_VERSION_COLLECTION].find_one(
+                {"_id": collection_name}
+            )
+            version = record["version"] if record else 0
+            self.collection_versions.put(collection_name, version)
+        return version
+
+    def invalidate_answers(
+        self, collection_name: str, chunk_ids: Optional[List[str]] = None
+    ) -> None:
+        # Answers are only generated from chunks, never from parent records
+        if collection_name != self.parent_collection_name:
+            self.answer_cache.invalidate(collection_name, chunk_ids)
+
+    def cache_stats(self) -> dict:
+        return {
+            "results": self.result_cache.stats(),
+            "query_embeddings": self.query_embedding_cache.stats(),
+            "answers": self.answer_cache.stats(),
+        }
+
+    def encode_embeddings(self, docs: list) -> list:
+        # Convert each document's `embedding` to the configured storage format
+        return [
+            {**doc, "embedding": encode_vector(doc["embedding"], self.vector_encoding)}
+            if "embedding" in doc
+            else doc
+            for doc in docs
+        ]
 
     def ingest_data(self, collection_name: str, embedded_docs: list) -> None:
+        embedded_docs = self.encode_embeddings(embedded_docs)
         collection = self.client[self.db_name][collection_name]
         collection.delete_many({})
         collection.insert_many(embedded_docs)
+        self.invalidate_cache(collection_name)
+        self.invalidate_answers(collection_name)
         print(
             f"Ingested {collection.count_documents({})} documents into the {collection_name} collection."
         )
 
+    def clear_collection(self, collection_name: str) -> None:
+        self.client[self.db_name][collection_name].delete_many({})
+        self.invalidate_cache(collection_name)
+        self.invalidate_answers(collection_name)
+
+    def upsert_batch(self, collection_name: str, docs: list) -> None:
+        docs = self.encode_embeddings(docs)
+        # Replacing by `_id` makes re-writing a batch after an interruption harmless
+        requests = [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in docs]
+        self.client[self.db_name][collection_name].bulk_write(requests, ordered=False)
+        self.invalidate_cache(collection_name)
+        self.invalidate_answers(collection_name, [doc["_id"] for doc in docs])
+
+    def sync_data(
+        self,
+        collection_name: str,
+        docs: Iterable[Dict],
+        text_field: str = "body",
+        batch_size: int = 100,
+        embed_fn: Callable[[List[str]], np.ndarray] = embed_many,
+    ) -> Dict[str, int]:
+        """
+        Incrementally bring a collection of chunks in line with the source documents.
+
+        Only chunks whose content hash changed are embedded and upserted,
+        chunks whose parent's `FILTER_FIELDS` changed get the new values, and
+        chunks whose source document or position no longer exists are deleted.
+        Parent article records are kept in sync the same way. The collection
+        stays queryable throughout.
+
+        Args:
+            collection_name (str): Collection holding the chunks.
+            docs (Iterable[Dict]): All source documents.
+            text_field (str): Text field to chunk and embed.
+            batch_size (int): Number of source documents processed per round trip.
+            embed_fn (Callable[[List[str]], np.ndarray]): Batched embedding function.
+
+        Returns:
+            Dict[str, int]: Number of chunks `unchanged`, `upserted`, `refiltered`
+            and `deleted`.
+        """
+        collection = self.client[self.db_name][collection_name]
+        parent_collection = self.client[self.db_name][self.parent_collection_name]
+        stats = {"unchanged": 0, "upserted": 0, "refiltered": 0, "deleted": 0}
+        # Every parent record written by this run is stamped with its ID, so
+        # the documents that are gone can be found without remembering the rest
+        sync_run = uuid.uuid4().hex
+
+        for batch in iter_batches(docs, batch_size):
+            parents = [
+                {**get_parent(doc, text_field), "sync_run": sync_run} for doc in batch
+            ]
+            parent_ids = [parent["_id"] for parent in parents]
+            # Parent records are small, so they are always rewritten
+            self.upsert_batch(self.parent_collection_name, parents)
+            chunks = [chunk for doc in batch for chunk in get_chunks(doc, text_field)]
+
+            # Compare against the hashes and filter fields already stored for these chunks
+            stored = {
+                d["_id"]: d
+                for d in collection.find(
+                    {"_id": {"$in": [chunk["_id"] for chunk in chunks]}},
+                    {"content_hash": 1, **{path: 1 for path in FILTER_FIELDS}},
+                )
+            }
+            changed = [
+                c
+                for c in chunks
+                if stored.get(c["_id"], {}).get("content_hash") != c["content_hash"]
+            ]
+            changed_ids = {c["_id"] for c in changed}
+            # Chunks whose parent's filter fields changed keep their embedding,
+            # but filtered searches must see the new values
+            refiltered = [
+                c
+                for c in chunks
+                if c["_id"] not in changed_ids
+                and any(
+                    get_field(c, path) != get_field(stored[c["_id"]], path)
+                    for path in FILTER_FIELDS
+                )
+            ]
+            stats["unchanged"] += len(chunks) - len(changed) - len(refiltered)
+
+            requests: list = [
+                UpdateOne({"_id": chunk["_id"]}, filter_fields_update(chunk))
+                for chunk in refiltered
+            ]
+            if changed:
+                embeddings = embed_fn([chunk[text_field] for chunk in changed])
+                for chunk, embedding in zip(changed, embeddings):
+                    chunk["embedding"] = encode_vector(embedding, self.vector_encoding)
+                    requests.append(
+                        ReplaceOne({"_id": chunk["_id"]}, chunk, upsert=True)
+                    )
+            # Drop trailing chunks of documents that now split into fewer chunks
+            requests.append(
+                DeleteMany(
+                    {
+                        "parent_id": {"$in": parent_ids},
+                        "_id": {"$nin": [chunk["_id"] for chunk in chunks]},
+                    }
+                )
+            )
+            result = collection.bulk_write(requests, ordered=False)
+            # Deleted chunks can't be retrieved again, so only changed chunks
+            # can make a cached answer stale
+            if changed:
+                self.invalidate_answers(
+                    collection_name, [chunk["_id"] for chunk in changed]
+                )
+            stats["upserted"] += len(changed)
+            stats["refiltered"] += len(refiltered)
+            stats["deleted"] += result.deleted_count
+
+        # Drop chunks and parent records whose source document is gone, streaming
+        # the stale parent IDs so that memory stays flat however large the corpus
+        stale = {"sync_run": {"$ne": sync_run}}
+        stale_ids = (
+            parent["_id"] for parent in parent_collection.find(stale, {"_id": 1})
+        )
+        for ids in iter_batches(stale_ids, 1000):
+            result = collection.delete_many({"parent_id": {"$in": list(ids)}})
+            stats["deleted"] += result.deleted_count
+        parent_collection.delete_many(stale)
+        self.invalidate_cache(collection_name)
+        return stats
+
+    def get_index_name(self, collection_name: str) -> str:
+        """
+        Return the vector search index that currently serves a collection.
+
+        The live index is recorded in the `search_index_aliases` collection so
+        that every process switches to a rebuilt index, and is re-read at most
+        every `index_aliases.ttl` seconds.
+        """
+        index_name = self.index_aliases.get(collection_name)
+        if index_name is None:
+            alias = self.client[self.db_name][INDEX_ALIAS_COLLECTION].find_one(
+                {"_id": collection_name}
+            )
+            index_name = alias["index"] if alias else self.vector_search_index_name
+            self.index_aliases.put(collection_name, index_name)
+        return index_name
+
+    def get_search_settings(
+        self, collection_name: str, filter: Optional[Dict] = None, rerank: bool = False
+    ) -> Dict:
+        """
+        Return the `$vectorSearch` settings tuned for a collection and filter shape.
+
+        Args:
+            collection_name (str): Collection to search.
+            filter (Optional[Dict]): Pre-filter of the search.
+            rerank (bool): Whether the results will be re-ranked, see
+                `search_settings_for`.
+
+        Returns:
+            Dict: `num_candidates` and `limit`, the defaults if none were tuned.
+        """
+        key = (collection_name, filter_shape(filter))
+        settings = self.search_settings.get(key)
+        if settings is None:
+            saved = self.client[self.db_name][SEARCH_SETTINGS_COLLECTION].find_one(
+                {"collection": key[0], "filter_shape": key[1]}
+            )
+            settings = {
+                name: saved[name] if saved else default
+                for name, default in DEFAULT_SEARCH_SETTINGS.items()
+            }
+            self.search_settings.put(key, settings)
+        return search_settings_for(settings, rerank)
+
+    def save_search_settings(
+        self, collection_name: str, filter: Optional[Dict], settings: Dict
+    ) -> None:
+        """
+        Store tuned `$vectorSearch` settings for a collection and filter shape.
+
+        Args:
+            collection_name (str): Collection the settings were tuned on.
+            filter (Optional[Dict]): Example filter of the shape they apply to.
+            settings (Dict): `num_candidates` and `limit`, plus any measurements.
+        """
+        key = {"collection": collection_name, "filter_shape": filter_shape(filter)}
+        self.client[self.db_name][SEARCH_SETTINGS_COLLECTION].update_one(
+            key, {"$set": settings}, upsert=True
+        )
+        self.search_settings.invalidate()
+        self.invalidate_cache(collection_name)
+
+    def deploy_vector_search_index(
+        self,
+        collection_name: str,
+        filter_paths: Sequence[str] = (),
+        timeout: float = 600.0,
+        drop_delay: Optional[float] = None,
+    ) -> str:
+        """
+        Build a vector search index for a definition next to the live one, then
+        switch queries over to it and drop the old index (blue/green).
+
+        Queries keep using the old index until the new one is READY, so changing
+        the definition never makes them fail or lose recall.
+
+        Args:
+            collection_name (str): Collection to index.
+            filter_paths (Sequence[str]): Fields that queries can pre-filter on.
+            timeout (float): Seconds to wait for the new index to be ready.
+            drop_delay (Optional[float]): Seconds between the switch and dropping
+                the old index, so that other processes pick up the switch first.
+                Defaults to how long they cache the live index name.
+
+        Returns:
+            str: Name of the live index.
+        """
+        collection = self.client[self.db_name][collection_name]
+        definition = vector_index_definition(self.vector_encoding, filter_paths)
+        index_name = versioned_index_name(self.vector_index_base_name, definition)
+        self.index_aliases.invalidate(lambda key: key == collection_name)
+        old_index_name = self.get_index_name(collection_name)
+
+        existing = {index["name"] for index in collection.list_search_indexes()}
+        if index_name not in existing:
+            collection.create_search_index(
+                model={
+                    "name": index_name,
+                    "type": "vectorSearch",
+                    "definition": definition,
+                }
+            )
+        wait_for_index(collection, index_name, timeout)
+
+        # Switch every process over to the new index with a single write
+        self.client[self.db_name][INDEX_ALIAS_COLLECTION].update_one(
+            {"_id": collection_name},
+            {"$set": {"index": index_name, "definition": definition}},
+            upsert=True,
+        )
+        self.index_aliases.put(collection_name, index_name)
+        self.vector_search_index_name = index_name
+        self.invalidate_cache(collection_name)
+
+        if old_index_name != index_name and old_index_name in existing:
+            time.sleep(self.index_aliases.ttl if drop_delay is None else drop_delay)
+            collection.drop_search_index(old_index_name)
+        return index_name
+
     def create_vector_search_index(self, collection_name: str, index_name: str) -> None:
         # Create vector index definition specifying:
         # path: Path to the embeddings field
         # numDimensions: Number of embedding dimensions- depends on the embedding model used
         # similarity: Similarity metric. One of cosine, euclidean, dotProduct.
-        model = {
-            "name": index_name,
-            "type": "vectorSearch",
-            "definition": {
-                "fields": [
-                    {
-                        "type": "vector",
-                        "path": "embedding",
-                        "numDimensions": 384,
-                        "similarity": "cosine",
-                    }
-                ]
-            },
-        }
-
-        self.client[self.db_name][collection_name].create_search_index(model=model)
-        self.vector_search_index_name = index_name
+        # The index is named `<index_name>_<hash of the definition>`
+        self.vector_index_base_name = index_name
+        self.deploy_vector_search_index(collection_name)
 
     def update_search_index(self, collection_name: str) -> None:
-        model = {
-            "name": self.vector_search_index_name,
-            "type": "vectorSearch",
-            "definition": {
-                "fields": [
-                    {
-                        "type": "vector",
-                        "path": "embedding",
-                        "numDimensions": 384,
-                        "similarity": "cosine",
-                    },
-                    {"type": "filter", "path": "metadata.contentType"},
-                ]
-            },
-        }
-        self.client[self.db_name][collection_name].update_search_index(
-            name=self.vector_search_index_name, definition=model["definition"]
-        )
+        # Rebuild the index with `metadata.contentType` as a filter field
+        self.deploy_vector_search_index(collection_name, ["metadata.contentType"])
 
     def update_search_index_2(self, collection_name: str) -> None:
-        model = {
-            "name": self.vector_search_index_name,
-            "type": "vectorSearch",
-            "definition": {
-                "fields": [
-                    {
-                        "type": "vector",
-                        "path": "embedding",
-                        "numDimensions": 384,
-                        "similarity": "cosine",
-                    },
-                    {"type": "filter", "path": "metadata.contentType"},
-                    {"type": "filter", "path": "updated"},
-                ]
-            },
-        }
-        self.client[self.db_name][collection_name].update_search_index(
-            name=self.vector_search_index_name, definition=model["definition"]
+        # Rebuild the index with `metadata.contentType` and `updated` as filter fields
+        self.deploy_vector_search_index(
+            collection_name, ["metadata.contentType", "updated"]
         )
-        self.__wait_for_index(collection_name)
-
-    def __wait_for_index(self, collection_name):
-        # Poll for readiness
-        timeout = 60  # seconds
-        start_time = time.time()
-        while not self.__is_index_ready(collection_name, self.vector_search_index_name):
-            if time.time() - start_time > timeout:
-                raise TimeoutError(
-                    f"Index {self.vector_search_index_name} did not become ready within {timeout} seconds."
-                )
-            time.sleep(5)  # Wait for a few seconds before checking again
-
-    # Function to check if the index is ready
-    def __is_index_ready(self, collection_name, index_name):
-        indexes = self.client[self.db_name][collection_name].list_search_indexes()
-        for index in indexes:
-            if index["name"] == index_name and index["status"] == "READY":
-                return True
-        return False
 
-    def vector_search(self, collection_name: str, user_query: str):
+    def vector_search(
+        self,
+        collection_name: str,
+        user_query: str,
+        filter: Optional[Dict] = None,
+        include_parent: bool = False,
+        rerank: bool = False,
+    ):
         """
         Retrieve relevant documents for a user query using vector search.
 
         Args:
         user_query (str): The user's query string.
+        filter (Optional[Dict]): Pre-filter on fields indexed as `filter` fields.
+        include_parent (bool): Join each result's parent article as `parent`.
+        rerank (bool): Return the tuned number of candidates to re-rank rather
+            than the default top-k.
 
         Returns:
         list: A list of matching documents.
         """
+        with tracer.span("vector_search", collection=collection_name) as span:
+            # Repeated questions are answered from the cache without a round trip
+            cache_key = self.vector_search_cache_key(
+                collection_name, user_query, filter, include_parent, rerank
+            )
+            cached = self.result_cache.get(cache_key)
+            span.set(cache_hit=cached is not None)
+            if cached is not None:
+                return [dict(doc) for doc in cached]
+
+            # Generate embedding for the `user_query` using the `get_embedding` function defined in Step 5
+            with tracer.span("embed_query"):
+                query_embedding = self.get_query_embedding(user_query)
+            pipeline = self.vector_search_pipeline(
+                query_embedding,
+                filter,
+                include_parent,
+                index_name=self.get_index_name(collection_name),
+                **self.get_search_settings(collection_name, filter, rerank),
+            )
+
+            # Execute the aggregation `pipeline` and store the results in `results`
+            with tracer.span("aggregate") as aggregate_span:
+                results = list(
+                    self.client[self.db_name][collection_name].aggregate(pipeline)
+                )
+                if aggregate_span.recording:
+                    stage = pipeline[0]["$vectorSearch"]
+                    aggregate_span.set(
+                        num_candidates=stage["numCandidates"],
+                        limit=stage["limit"],
+                        filtered=bool(filter),
+                        results=len(results),
+                    )
+            self.result_cache.put(cache_key, results)
+            return [dict(doc) for doc in results]
+
+    def vector_search_many(
+        self,
+        collection_name: str,
+        user_queries: List[str],
+        filters: Optional[List[Optional[Dict]]] = None,
+        include_parent: bool = False,
+        max_workers: int = 8,
+        rerank: bool = False,
+    ) -> List[List[Dict]]:
+        """
+        Retrieve relevant documents for many user queries at once.
+
+        Queries that miss the caches are embedded in one batched forward pass,
+        and their aggregations run concurrently over the client's connection pool.
+
+        Args:
+            collection_name (str): Collection to search.
+            user_queries (List[str]): The user's query strings.
+            filters (Optional[List[Optional[Dict]]]): Pre-filter of each query.
+            include_parent (bool): Join each result's parent article as `parent`.
+            max_workers (int): Maximum number of aggregations in flight.
+            rerank (bool): Return the tuned number of candidates to re-rank
+                rather than the default top-k.
+
+        Returns:
+            List[List[Dict]]: Matching documents of each query, in input order.
+        """
+        filters = filters or [None] * len(user_queries)
+        if len(filters) != len(user_queries):
+            raise ValueError("Expected one filter per query")
+
+        with tracer.span(
+            "vector_search_many", collection=collection_name, queries=len(user_queries)
+        ) as span:
+            keys = [
+                self.vector_search_cache_key(
+                    collection_name, user_query, filter, include_parent, rerank
+                )
+                for user_query, filter in zip(user_queries, filters)
+            ]
+            results: Dict[tuple, Optional[List[Dict]]] = {
+                key: self.result_cache.get(key) for key in keys
+            }
+            # A query repeated within the call is searched once, at its first position
+            missing: Dict[tuple, int] = {}
+            for i, key in enumerate(keys):
+                if results[key] is None:
+                    missing.setdefault(key, i)
+            span.set(cache_hits=sum(results[key] is not None for key in keys))
 
-        # Generate embedding for the `user_query` using the `get_embedding` function defined in Step 5
-        query_embedding = get_embedding(user_query)
+            # Embed every query that isn't cached in a single call
+            embeddings = {
+                query: self.query_embedding_cache.get(query)
+                for query in dict.fromkeys(user_queries[i] for i in missing.values())
+            }
+            to_embed = [
+                query for query, embedding in embeddings.items() if embedding is None
+            ]
+            if to_embed:
+                with tracer.span("embed_queries", batch_size=len(to_embed)):
+                    for query, embedding in zip(to_embed, embed_many(to_embed)):
+                        embeddings[query] = embedding.tolist()
+                        self.query_embedding_cache.put(query, embeddings[query])
+
+            collection = self.client[self.db_name][collection_name]
+            index_name = self.get_index_name(collection_name)
+            pipelines = [
+                self.vector_search_pipeline(
+                    embeddings[user_queries[i]],
+                    filters[i],
+                    include_parent,
+                    index_name=index_name,
+                    **self.get_search_settings(collection_name, filters[i], rerank),
+                )
+                for i in missing.values()
+            ]
+            if pipelines:
+                with tracer.span("aggregate_many", pipelines=len(pipelines)):
+                    with ThreadPoolExecutor(
+                        max_workers=min(max_workers, len(pipelines))
+                    ) as executor:
+                        fetched = list(
+                            executor.map(
+                                lambda pipeline: list(collection.aggregate(pipeline)),
+                                pipelines,
+                            )
+                        )
+                for key, docs in zip(missing, fetched):
+                    self.result_cache.put(key, docs)
+                    results[key] = docs
+            return [[dict(doc) for doc in results[key] or []] for key in keys]
+
+    def vector_search_cache_key(
+        self,
+        collection_name: str,
+        user_query: str,
+        filter: Optional[Dict] = None,
+        include_parent: bool = False,
+        rerank: bool = False,
+        version: Optional[int] = None,
+    ) -> tuple:
+        if version is None:
+            version = self.get_collection_version(collection_name)
+        return (
+            collection_name,
+            version,
+            user_query,
+            # Filters on `updated` hold datetimes
+            json.dumps(filter, sort_keys=True, default=str),
+            include_parent,
+            rerank,
+        )
+
+    def get_query_embedding(self, user_query: str) -> List[float]:
+        query_embedding = self.query_embedding_cache.get(user_query)
+        if query_embedding is None:
+            query_embedding = self.embed_query(user_query)
+            self.query_embedding_cache.put(user_query, query_embedding)
+        return query_embedding
+
+    def vector_search_pipeline(
+        self,
+        query_embedding: List[float],
+        filter: Optional[Dict] = None,
+        include_parent: bool = False,
+        index_name: Optional[str] = None,
+        num_candidates: int = DEFAULT_SEARCH_SETTINGS["num_candidates"],
+        limit: int = DEFAULT_SEARCH_SETTINGS["limit"],
+    ) -> list:
+        # Queries are encoded the same way as the stored vectors
+        query_vector = encode_vector(query_embedding, self.vector_encoding)
 
         # Define an aggregation pipeline consisting of a $vectorSearch stage, followed by a $project stage
-        # Set the number of candidates to 150 and only return the top 5 documents from the vector search
-        # In the $project stage, exclude the `_id` field and include only the `body` field and `vectorSearchScore`
+        # Use the number of candidates and of returned documents tuned for the collection, 150 and 5 by default
+        # In the $project stage, exclude the `_id` field and include the `body` field, the chunk's position, its token count and `vectorSearchScore`
         # NOTE: Use variables defined previously for the `index`, `queryVector` and `path` fields in the $vectorSearch stage
+        vector_search_stage = {
+            "index": index_name or self.vector_search_index_name,
+            "queryVector": query_vector,
+            "path": "embedding",
+            "numCandidates": num_candidates,
+            "limit": limit,
+        }
+        if filter:
+            vector_search_stage["filter"] = filter
         pipeline = [
-            {
-                "$vectorSearch": {
-                    "index": self.vector_search_index_name,
-                    "queryVector": query_embedding,
-                    "path": "embedding",
-                    "numCandidates": 150,
-                    "limit": 5,
-                }
-            },
+            {"$vectorSearch": vector_search_stage},
             {
                 "$project": {
                     "_id": 0,
                     "body": 1,
                     "score": {"$meta": "vectorSearchScore"},
+                    # Position of the chunk in its article, used to merge neighbours
+                    "parent_id": 1,
+                    "chunk_index": 1,
+                    "start": 1,
+                    "end": 1,
+                    # Spares packing the context from re-tokenizing the chunk
+                    "token_count": 1,
                 }
             },
         ]
-
-        # Execute the aggregation `pipeline` and store the results in `results`
-        results = self.client[self.db_name][collection_name].aggregate(pipeline)
-        return list(results)
+        if include_parent:
+            # Join the parent article's metadata for the final top-k only
+            pipeline += [
+                {
+                    "$lookup": {
+                        "from": self.parent_collection_name,
+                        "localField": "parent_id",
+                        "foreignField": "_id",
+                        "as": "parent",
+                    }
+                },
+                {"$set": {"parent": {"$first": "$parent"}}},
+            ]
+        return pipeline
@@ -0,0 +1,95 @@
+from typing import Any, Dict, List
+
+import mongomock
+import numpy as np
+from mongomock.aggregate import process_pipeline
+
+from utils.vector_encoding import decode_vector
+
+# Field that carries `{"$meta": "vectorSearchScore"}` through the pipeline
+SCORE_FIELD = "_vector_search_score"
+
+
+class VectorSearchMongoClient:
+    """
+    In-memory stand-in for `MongoClient`, for offline runs such as the
+    benchmark and the tests. Needs the dev dependency `mongomock`.
+
+    mongomock answers everything the app sends to MongoDB except
+    `$vectorSearch`, an Atlas-only stage. The collections handed out here
+    answer a leading `$vectorSearch` by exact cosine search over the documents
+    that match its filter, and run the rest of the pipeline with mongomock, so
+    the pipelines built by `MongoDriver` run unchanged.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        # Every client is its own empty server, whatever URI it is given
+        self._client = mongomock.MongoClient()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+    def __getitem__(self, db_name: str) -> "VectorSearchDatabase":
+        return VectorSearchDatabase(self._client[db_name])
+
+
+class VectorSearchDatabase:
+    def __init__(self, database: mongomock.Database) -> None:
+        self._database = database
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._database, name)
+
+    def __getitem__(self, name: str) -> "VectorSearchCollection":
+        return VectorSearchCollection(self._database[name])
+
+
+class VectorSearchCollection:
+    def __init__(self, collection: mongomock.Collection) -> None:
+        self._collection = collection
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._collection, name)
+
+    def aggregate(self, pipeline: List[Dict], **kwargs):
+        if not pipeline or "$vectorSearch" not in pipeline[0]:
+            return self._collection.aggregate(pipeline, **kwargs)
+        docs = vector_search(self._collection, pipeline[0]["$vectorSearch"])
+        return process_pipeline(
+            docs, self._collection.database, _with_score_field(pipeline[1:]), None
+        )
+
+
+def vector_search(collection: mongomock.Collection, spec: Dict) -> List[Dict]:
+    """
+    Answer a `$vectorSearch` stage by exact search, ignoring `numCandidates`.
+
+    Args:
+        collection (mongomock.Collection): Collection to search.
+        spec (Dict): Options of the `$vectorSearch` stage.
+
+    Returns:
+        List[Dict]: The `limit` nearest documents, best first, with their score
+        in `SCORE_FIELD`.
+    """
+    matches = list(collection.find(spec.get("filter") or {}))
+    if not matches:
+        return []
+    query = decode_vector(spec["queryVector"])
+    embeddings = np.stack([decode_vector(doc[spec["path"]]) for doc in matches])
+    norms = np.linalg.norm(embeddings, axis=1) * (np.linalg.norm(query) or 1)
+    scores = embeddings @ query / np.where(norms == 0, 1, norms)
+    top = np.argsort(-scores)[: spec["limit"]]
+    # Atlas reports cosine similarity normalized to [0, 1]
+    return [{**matches[i], SCORE_FIELD: float((1 + scores[i]) / 2)} for i in top]
+
+
+def _with_score_field(value: Any) -> Any:
+    # mongomock has no `vectorSearchScore` metadata, so read the score field instead
+    if value == {"$meta": "vectorSearchScore"}:
+        return f"${SCORE_FIELD}"
+    if isinstance(value, dict):
+        return {k: _with_score_field(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_with_score_field(v) for v in value]
+    return value
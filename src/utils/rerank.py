@@ -0,0 +1,166 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from utils.inference_backend import get_inference_backend, load_cross_encoder
+from utils.tracing import tracer
+
+if TYPE_CHECKING:
+    from sentence_transformers import CrossEncoder
+
+RERANK_MODEL_NAME = "mixedbread-ai/mxbai-rerank-xsmall-v1"
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class Reranker:
+    """
+    Cross-encoder reranking stage that loads its model once and reuses it.
+
+    Pair scores can optionally be cached by query and passage hash so that
+    repeated questions over the same chunks skip the forward pass.
+    """
+
+    model_name: str
+    backend: str
+    batch_size: int
+    cache_size: int
+    last_latency: float
+
+    def __init__(
+        self,
+        model_name: str = RERANK_MODEL_NAME,
+        batch_size: int = 32,
+        cache_size: int = 0,
+        backend: Optional[str] = None,
+    ) -> None:
+        self.model_name = model_name
+        # Defaults to the backend selected by `INFERENCE_BACKEND`
+        self.backend = backend or get_inference_backend()
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        # Seconds spent in the most recent `rank` call
+        self.last_latency = 0.0
+        self._model: Optional["CrossEncoder"] = None
+        self._model_lock = threading.Lock()
+        self._cache: OrderedDict[Tuple[str, str], float] = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    @property
+    def model(self) -> "CrossEncoder":
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = load_cross_encoder(self.model_name, self.backend)
+        return self._model
+
+    def score(self, query: str, documents: List[str]) -> List[float]:
+        """
+        Score each (query, document) pair, reusing cached scores when enabled.
+
+        Args:
+            query (str): The user's query string.
+            documents (List[str]): Passages to score against the query.
+
+        Returns:
+            List[float]: Relevance score of each document, in input order.
+        """
+        return self.score_pairs([(query, doc) for doc in documents])
+
+    def score_pairs(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        """
+        Score (query, document) pairs, possibly for different queries, in batches.
+
+        Args:
+            pairs (List[Tuple[str, str]]): Pairs to score.
+
+        Returns:
+            List[float]: Relevance score of each pair, in input order.
+        """
+        keys = [(query, hash_text(doc)) for query, doc in pairs]
+        scores: Dict[int, float] = {}
+        if self.cache_size > 0:
+            with self._cache_lock:
+                for i, key in enumerate(keys):
+                    if key in self._cache:
+                        self._cache.move_to_end(key)
+                        scores[i] = self._cache[key]
+
+        # Only run the cross-encoder on pairs that were not cached
+        missing = [i for i in range(len(pairs)) if i not in scores]
+        if missing:
+            predictions = self.model.predict(
+                [pairs[i] for i in missing],
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+            )
+            for i, prediction in zip(missing, predictions):
+                scores[i] = float(prediction)
+
+            if self.cache_size > 0:
+                with self._cache_lock:
+                    for i in missing:
+                        self._cache[keys[i]] = scores[i]
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+
+        return [scores[i] for i in range(len(pairs))]
+
+    @staticmethod
+    def _top_k(documents: List[str], scores: List[float], top_k: int) -> List[Dict]:
+        order = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)
+        return [
+            {"corpus_id": i, "score": scores[i], "text": documents[i]}
+            for i in order[:top_k]
+        ]
+
+    def rank(self, query: str, documents: List[str], top_k: int = 5) -> List[Dict]:
+        """
+        Re-rank documents for a query.
+
+        Args:
+            query (str): The user's query string.
+            documents (List[str]): Passages to re-rank.
+            top_k (int): Number of documents to return.
+
+        Returns:
+            List[Dict]: Top documents as `{"corpus_id", "score", "text"}`, best first.
+        """
+        start_time = time.perf_counter()
+        with tracer.span("cross_encoder", requests=1, batch_size=len(documents)):
+            ranked = self._top_k(documents, self.score(query, documents), top_k)
+        self.last_latency = time.perf_counter() - start_time
+        return ranked
+
+    def rank_many(
+        self, requests: List[Tuple[str, List[str]]], top_k: int = 5
+    ) -> List[List[Dict]]:
+        """
+        Re-rank documents for several queries with a single batched forward pass.
+
+        Args:
+            requests (List[Tuple[str, List[str]]]): (query, documents) to re-rank.
+            top_k (int): Number of documents to return per query.
+
+        Returns:
+            List[List[Dict]]: Re-ranked documents of each request, in input order.
+        """
+        start_time = time.perf_counter()
+        pairs = [(query, doc) for query, documents in requests for doc in documents]
+        with tracer.span(
+            "cross_encoder", requests=len(requests), batch_size=len(pairs)
+        ):
+            scores = self.score_pairs(pairs)
+        ranked = []
+        offset = 0
+        for _, documents in requests:
+            ranked.append(
+                self._top_k(documents, scores[offset : offset + len(documents)], top_k)
+            )
+            offset += len(documents)
+        self.last_latency = time.perf_counter() - start_time
+        return ranked
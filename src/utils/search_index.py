@@ -0,0 +1,76 @@
+import hashlib
+import json
+import time
+from typing import Dict, Sequence
+
+from pymongo.collection import Collection
+
+from utils.vector_encoding import vector_index_field
+
+
+def vector_index_definition(encoding: str, filter_paths: Sequence[str] = ()) -> Dict:
+    """
+    Build the definition of a vector search index from what it should contain.
+
+    Args:
+        encoding (str): Storage format of the `embedding` field.
+        filter_paths (Sequence[str]): Fields that queries can pre-filter on.
+
+    Returns:
+        Dict: Definition for `create_search_index`.
+    """
+    # https://www.mongodb.com/docs/atlas/atlas-vector-search/vector-search-type/#about-the-filter-type
+    return {
+        "fields": [
+            vector_index_field(encoding),
+            *({"type": "filter", "path": path} for path in filter_paths),
+        ]
+    }
+
+
+def versioned_index_name(base_name: str, definition: Dict) -> str:
+    """
+    Name an index after its definition, so that a changed definition gets a new
+    index next to the live one and an unchanged one is never rebuilt.
+    """
+    digest = hashlib.sha256(
+        json.dumps(definition, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    return f"{base_name}_{digest[:8]}"
+
+
+def wait_for_index(
+    collection: Collection,
+    index_name: str,
+    timeout: float = 600.0,
+    initial_delay: float = 1.0,
+    max_delay: float = 30.0,
+) -> None:
+    """
+    Wait until a search index is ready to serve queries.
+
+    The index is polled with exponential backoff: quickly at first, since small
+    indexes are ready in seconds, and at most every `max_delay` seconds after.
+
+    Args:
+        collection (Collection): Collection the index belongs to.
+        index_name (str): Name of the index.
+        timeout (float): Seconds to wait before giving up.
+        initial_delay (float): Seconds before the second poll.
+        max_delay (float): Maximum seconds between two polls.
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    while True:
+        index = next(iter(collection.list_search_indexes(index_name)), None)
+        if index is not None:
+            if index.get("status") == "FAILED":
+                raise RuntimeError(f"Index {index_name} failed to build: {index}")
+            if index.get("status") == "READY" and index.get("queryable", True):
+                return
+        if time.monotonic() + delay > deadline:
+            raise TimeoutError(
+                f"Index {index_name} did not become ready within {timeout} seconds."
+            )
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
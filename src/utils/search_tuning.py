@@ -0,0 +1,168 @@
+import json
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from utils.chunk_data import FILTER_FIELDS
+from utils.local_index import matches_filter
+from utils.vector_encoding import decode_vector
+
+# Used until a collection and filter shape have tuned settings
+DEFAULT_SEARCH_SETTINGS = {"num_candidates": 150, "limit": 5}
+
+
+def filter_shape(filter: Optional[Dict]) -> str:
+    """
+    Describe a filter by its fields and operators, without its values.
+
+    `{"metadata.contentType": "Video"}` and `{"metadata.contentType": "Tutorial"}`
+    have the same shape, so they share tuned settings.
+    """
+
+    def shape(value: Any) -> Any:
+        if isinstance(value, dict):
+            return {key: shape(v) for key, v in sorted(value.items())}
+        if isinstance(value, list) and any(isinstance(v, dict) for v in value):
+            return [shape(v) for v in value]
+        return "?"
+
+    return json.dumps(shape(filter or {}), sort_keys=True)
+
+
+def search_settings_for(settings: Dict, rerank: bool) -> Dict:
+    """
+    Pick the `$vectorSearch` settings of one search from the tuned ones.
+
+    The tuned `limit` is the number of candidates worth re-ranking, so a
+    search whose results aren't re-ranked keeps the default top-k.
+
+    Args:
+        settings (Dict): Tuned `num_candidates` and `limit`.
+        rerank (bool): Whether the results will be re-ranked.
+
+    Returns:
+        Dict: `num_candidates` and `limit` to search with.
+    """
+    if rerank:
+        return dict(settings)
+    return {**settings, "limit": DEFAULT_SEARCH_SETTINGS["limit"]}
+
+
+def exact_top_k(
+    embeddings: np.ndarray, query_embeddings: np.ndarray, k: int
+) -> np.ndarray:
+    """
+    Brute-force cosine top-k of every query, the ground truth for recall.
+
+    Args:
+        embeddings (np.ndarray): Stored embeddings, one per row.
+        query_embeddings (np.ndarray): Query embeddings, one per row.
+        k (int): Number of results per query.
+
+    Returns:
+        np.ndarray: Row indices of the top-k stored embeddings of each query, best first.
+    """
+
+    def normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    similarities = normalize(query_embeddings) @ normalize(embeddings).T
+    k = min(k, embeddings.shape[0])
+    top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(similarities, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+
+def tune_vector_search(
+    collection,
+    index_name: str,
+    query_embeddings: np.ndarray,
+    query_vectors: List[Any],
+    filter: Optional[Dict] = None,
+    k: int = 5,
+    limits: Sequence[int] = (5, 10, 20),
+    candidate_factors: Sequence[int] = (2, 5, 10, 20, 50),
+    target_recall: float = 0.95,
+) -> Dict:
+    """
+    Sweep `numCandidates` and `limit` of `$vectorSearch` against exact search.
+
+    Recall@k is the fraction of each query's exact top-k (over the documents
+    matching `filter`) that appears in the `limit` results of `$vectorSearch`,
+    i.e. what a reranker keeping the top `k` of those results could recover.
+
+    Args:
+        collection: Collection holding the embedded documents.
+        index_name (str): Vector search index to query.
+        query_embeddings (np.ndarray): Query embeddings, one per row.
+        query_vectors (List[Any]): The same queries encoded like the stored vectors.
+        filter (Optional[Dict]): Pre-filter applied to every query.
+        k (int): Number of results that must be found.
+        limits (Sequence[int]): `limit` values to try, each at least `k`.
+        candidate_factors (Sequence[int]): `numCandidates` values to try, as
+            multiples of `limit`.
+        target_recall (float): Recall that the chosen settings must reach.
+
+    Returns:
+        Dict: Every measurement under `sweep`, and under `chosen` the settings
+        with the fewest candidates that reach `target_recall`, or the best
+        recall found if none does.
+    """
+    ids, embeddings = [], []
+    projection = {"embedding": 1, **{path: 1 for path in FILTER_FIELDS}}
+    for doc in collection.find({}, projection):
+        if filter is None or matches_filter(doc, filter):
+            ids.append(doc["_id"])
+            embeddings.append(decode_vector(doc["embedding"]))
+    if not ids:
+        raise ValueError("No stored documents match the filter")
+    ids_array = np.asarray(ids, dtype=object)
+    expected = [
+        set(row)
+        for row in ids_array[exact_top_k(np.stack(embeddings), query_embeddings, k)]
+    ]
+
+    sweep = []
+    for limit in sorted({max(limit, k) for limit in limits}):
+        for factor in candidate_factors:
+            # Atlas caps numCandidates at 10000
+            num_candidates = min(limit * factor, 10_000)
+            recalls, latencies = [], []
+            for query_vector, exact in zip(query_vectors, expected):
+                stage = {
+                    "index": index_name,
+                    "path": "embedding",
+                    "queryVector": query_vector,
+                    "numCandidates": num_candidates,
+                    "limit": limit,
+                }
+                if filter:
+                    stage["filter"] = filter
+                start_time = time.perf_counter()
+                found = {
+                    doc["_id"]
+                    for doc in collection.aggregate(
+                        [{"$vectorSearch": stage}, {"$project": {"_id": 1}}]
+                    )
+                }
+                latencies.append(time.perf_counter() - start_time)
+                recalls.append(len(exact & found) / len(exact))
+            sweep.append(
+                {
+                    "num_candidates": num_candidates,
+                    "limit": limit,
+                    "recall": float(np.mean(recalls)),
+                    "latency_p50_ms": float(np.percentile(latencies, 50) * 1000),
+                    "latency_p95_ms": float(np.percentile(latencies, 95) * 1000),
+                }
+            )
+
+    # numCandidates is what costs search-node CPU, so prefer the fewest candidates
+    good = [row for row in sweep if row["recall"] >= target_recall]
+    if good:
+        chosen = min(good, key=lambda row: (row["num_candidates"], row["limit"]))
+    else:
+        chosen = max(sweep, key=lambda row: (row["recall"], -row["latency_p50_ms"]))
+    return {"sweep": sweep, "chosen": chosen}
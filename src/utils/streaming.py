@@ -0,0 +1,163 @@
+import time
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+)
+
+import numpy as np
+
+from utils.chunk_data import count_tokens
+
+
+class StreamStats:
+    """
+    Latency of one streamed answer: time to first token, tokens per second
+    while generating, and total latency, all measured from `start`.
+    """
+
+    start: float
+    first_token_at: Optional[float]
+    end: Optional[float]
+    tokens: int
+
+    def __init__(self, start: Optional[float] = None) -> None:
+        self.start = time.perf_counter() if start is None else start
+        self.first_token_at = None
+        self.end = None
+        self.tokens = 0
+
+    def on_delta(self) -> None:
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def finish(self, answer: str) -> None:
+        self.end = time.perf_counter()
+        self.tokens = count_tokens(answer)
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.start
+
+    @property
+    def total_latency(self) -> Optional[float]:
+        if self.end is None:
+            return None
+        return self.end - self.start
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        if self.end is None or self.first_token_at is None:
+            return None
+        generation_time = self.end - self.first_token_at
+        return self.tokens / generation_time if generation_time > 0 else None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "time_to_first_token": self.time_to_first_token,
+            "tokens_per_second": self.tokens_per_second,
+            "total_latency": self.total_latency,
+            "tokens": self.tokens,
+        }
+
+
+def summarize_stream_stats(stats: Iterable[StreamStats]) -> Dict[str, Dict]:
+    """
+    Summarize finished streams into percentiles, e.g. to check latency SLOs.
+
+    Args:
+        stats (Iterable[StreamStats]): Stats of finished streams.
+
+    Returns:
+        Dict[str, Dict]: p50, p95 and p99 of each latency metric.
+    """
+    rows = [s.as_dict() for s in stats]
+    summary = {}
+    for metric in ("time_to_first_token", "tokens_per_second", "total_latency"):
+        values = [row[metric] for row in rows if row[metric] is not None]
+        summary[metric] = {
+            f"p{q}": float(np.percentile(values, q)) if values else None
+            for q in (50, 95, 99)
+        }
+    return summary
+
+
+class AnswerStream:
+    """
+    Iterate over the text deltas of a streamed chat completion as they arrive.
+
+    Once the stream is exhausted, `stats` is complete and `on_complete` is
+    called with the assembled answer.
+    """
+
+    stats: StreamStats
+    answer: Optional[str]
+
+    def __init__(
+        self,
+        chunks: Iterable[Any],
+        on_complete: Optional[Callable[[str], None]] = None,
+        stats: Optional[StreamStats] = None,
+    ) -> None:
+        self._chunks = chunks
+        self._on_complete = on_complete
+        self.stats = stats or StreamStats()
+        self.answer = None
+
+    def __iter__(self) -> Iterator[str]:
+        deltas: List[str] = []
+        for chunk in self._chunks:
+            delta = _delta_content(chunk)
+            if delta:
+                self.stats.on_delta()
+                deltas.append(delta)
+                yield delta
+        self._finish("".join(deltas))
+
+    def _finish(self, answer: str) -> None:
+        self.answer = answer
+        self.stats.finish(answer)
+        if self._on_complete is not None:
+            self._on_complete(answer)
+
+
+class AsyncAnswerStream(AnswerStream):
+    """
+    `AnswerStream` over an asynchronous stream of chat completion chunks.
+    """
+
+    def __init__(
+        self,
+        chunks: AsyncIterable[Any],
+        on_complete: Optional[Callable[[str], None]] = None,
+        stats: Optional[StreamStats] = None,
+    ) -> None:
+        super().__init__([], on_complete, stats)
+        self._async_chunks = chunks
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        deltas: List[str] = []
+        async for chunk in self._async_chunks:
+            delta = _delta_content(chunk)
+            if delta:
+                self.stats.on_delta()
+                deltas.append(delta)
+                yield delta
+        self._finish("".join(deltas))
+
+
+def _delta_content(chunk: Any) -> Optional[str]:
+    # Chunks are OpenAI-style completion chunks, or plain strings for cached answers
+    if isinstance(chunk, str):
+        return chunk
+    if not chunk.choices:
+        return None
+    return chunk.choices[0].delta.content
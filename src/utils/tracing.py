@@ -0,0 +1,204 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextvars import ContextVar, copy_context
+from functools import partial, wraps
+from typing import Any, Callable, Deque, Dict, List, Optional, Protocol
+
+import numpy as np
+
+
+class SpanSink(Protocol):
+    """
+    Destination of finished spans.
+    """
+
+    def emit(self, span: Dict[str, Any]) -> None: ...
+
+
+class InMemorySink:
+    """
+    Keeps the most recent spans in memory and summarizes them per stage.
+    """
+
+    def __init__(self, max_spans: int = 10_000) -> None:
+        self.spans: Deque[Dict[str, Any]] = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def emit(self, span: Dict[str, Any]) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Return the count and p50/p95/max duration in milliseconds of each stage.
+        """
+        with self._lock:
+            durations: Dict[str, List[float]] = defaultdict(list)
+            for span in self.spans:
+                durations[span["name"]].append(span["duration_ms"])
+        return {
+            name: {
+                "count": len(values),
+                "p50": float(np.percentile(values, 50)),
+                "p95": float(np.percentile(values, 95)),
+                "max": float(max(values)),
+            }
+            for name, values in sorted(durations.items())
+        }
+
+
+class JsonLinesSink:
+    """
+    Appends each span as one JSON object per line to a file.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = open(path, "a", buffering=1)
+        self._lock = threading.Lock()
+
+    def emit(self, span: Dict[str, Any]) -> None:
+        line = json.dumps(span, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class Span:
+    """
+    Times one stage of a request and records attributes such as batch sizes.
+    """
+
+    recording = True
+
+    def __init__(self, sink: SpanSink, name: str, attributes: Dict) -> None:
+        self.sink = sink
+        self.name = name
+        self.attributes = attributes
+        self.span_id = uuid.uuid4().hex[:16]
+        self.trace_id = self.span_id
+        self.parent_id: Optional[str] = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> "Span":
+        parent = _current_span.get()
+        if parent is not None:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+        self._token = _current_span.set(self)
+        self._wall_start = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        duration = time.perf_counter() - self._start
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.sink.emit(
+            {
+                "trace_id": self.trace_id,
+                "span_id": self.span_id,
+                "parent_id": self.parent_id,
+                "name": self.name,
+                "start": self._wall_start,
+                "duration_ms": duration * 1000,
+                "attributes": self.attributes,
+            }
+        )
+
+
+class _NoopSpan:
+    # Shared by every stage while tracing is disabled, so a span costs one call
+    recording = False
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """
+    Creates spans that are sent to `sink`, or no-op spans while `sink` is None.
+
+    Spans opened inside another span, in the same thread or asyncio task,
+    belong to the same trace. Work handed to another thread joins the trace
+    when it is wrapped with `with_current_context`. Check `span.recording` before computing
+    attributes that are expensive, such as token counts.
+    """
+
+    sink: Optional[SpanSink]
+
+    def __init__(self, sink: Optional[SpanSink] = None) -> None:
+        self.sink = sink
+
+    @property
+    def enabled(self) -> bool:
+        return self.sink is not None
+
+    def span(self, name: str, **attributes: Any):
+        if self.sink is None:
+            return _NOOP_SPAN
+        return Span(self.sink, name, attributes)
+
+
+def create_tracer() -> Tracer:
+    """
+    Build a tracer from the environment: `TRACING=memory` keeps spans in memory,
+    `TRACING=jsonl` appends them to `TRACE_FILE`, and tracing is off otherwise.
+    """
+    mode = os.getenv("TRACING", "")
+    if mode == "memory":
+        return Tracer(InMemorySink())
+    if mode == "jsonl":
+        return Tracer(JsonLinesSink(os.getenv("TRACE_FILE", "traces.jsonl")))
+    return Tracer()
+
+
+# The tracer shared by every module in the process
+tracer = create_tracer()
+
+
+def traced(name: str) -> Callable:
+    """
+    Decorate a function so that each call runs in a span named `name`.
+    """
+
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def with_current_context(fn: Callable) -> Callable:
+    """
+    Bind `fn` to a copy of the current context, so that spans it opens on
+    another thread belong to the caller's trace.
+
+    A context can only be entered by one thread at a time, so bind once per
+    task rather than sharing the returned function between threads.
+    """
+    return partial(copy_context().run, fn)
@@ -0,0 +1,122 @@
+from typing import Dict, List, Union
+
+import numpy as np
+from bson.binary import Binary, BinaryVectorDtype
+
+from utils.generate_embeddings import EMBEDDING_DIMENSIONS
+
+# How embeddings are stored in MongoDB:
+# - "float64": BSON array of doubles (8 bytes per dimension)
+# - "float32": packed binary float32 vector (4 bytes per dimension)
+# - "int8": packed binary int8 vector, scalar quantized (1 byte per dimension)
+# - "packed_bit": packed binary 1-bit vector of signs (1 bit per dimension)
+# https://www.mongodb.com/docs/atlas/atlas-vector-search/create-embeddings/#binary-data
+VECTOR_ENCODINGS = ("float64", "float32", "int8", "packed_bit")
+
+
+def quantize_int8(vector: np.ndarray) -> np.ndarray:
+    # Scale each vector to the int8 range; cosine similarity ignores the scale
+    scale = float(np.max(np.abs(vector))) or 1.0
+    return np.round(vector / scale * 127).astype(np.int8)
+
+
+def encode_vector(vector, encoding: str) -> Union[List[float], Binary]:
+    """
+    Encode an embedding for storage or for a `$vectorSearch` query.
+
+    Args:
+        vector: Embedding as a list or numpy array.
+        encoding (str): One of `VECTOR_ENCODINGS`.
+
+    Returns:
+        Union[List[float], Binary]: A list of floats, or a BSON binary vector.
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    if encoding == "float64":
+        return vector.tolist()
+    if encoding == "float32":
+        return Binary.from_vector(vector.tolist(), BinaryVectorDtype.FLOAT32)
+    if encoding == "int8":
+        return Binary.from_vector(
+            quantize_int8(vector).tolist(), BinaryVectorDtype.INT8
+        )
+    if encoding == "packed_bit":
+        bits = np.packbits(vector > 0)
+        # Record how many bits of the last byte are not part of the vector
+        padding = -len(vector) % 8
+        return Binary.from_vector(
+            bits.tolist(), BinaryVectorDtype.PACKED_BIT, padding=padding
+        )
+    raise ValueError(f"Unknown vector encoding: {encoding}")
+
+
+def decode_vector(value) -> np.ndarray:
+    """
+    Decode a stored embedding back into a float32 array.
+
+    Quantized vectors decode to their quantized values: int8 vectors keep their
+    direction, and packed bit vectors become vectors of -1 and 1.
+    """
+    if isinstance(value, Binary):
+        vector = value.as_vector()
+        if vector.dtype == BinaryVectorDtype.PACKED_BIT:
+            bits = np.unpackbits(np.asarray(vector.data, dtype=np.uint8))
+            bits = bits[: len(bits) - vector.padding]
+            return bits.astype(np.float32) * 2 - 1
+        return np.asarray(vector.data, dtype=np.float32)
+    return np.asarray(value, dtype=np.float32)
+
+
+def vector_index_field(encoding: str, path: str = "embedding") -> Dict:
+    """
+    Build the `vector` field of a vector search index definition for an encoding.
+    """
+    return {
+        "type": "vector",
+        "path": path,
+        "numDimensions": EMBEDDING_DIMENSIONS,
+        # Atlas only supports euclidean (Hamming) similarity on 1-bit vectors
+        "similarity": "euclidean" if encoding == "packed_bit" else "cosine",
+    }
+
+
+def measure_recall(
+    embeddings: np.ndarray, queries: np.ndarray, encoding: str, k: int = 5
+) -> float:
+    """
+    Measure how much of the float32 cosine top-k an encoding keeps.
+
+    Args:
+        embeddings (np.ndarray): Stored embeddings, one per row.
+        queries (np.ndarray): Query embeddings, one per row.
+        encoding (str): One of `VECTOR_ENCODINGS`.
+        k (int): Number of results per query.
+
+    Returns:
+        float: Mean recall@k of the encoded search against the float32 search.
+    """
+
+    def normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def encoded(matrix: np.ndarray) -> np.ndarray:
+        return np.stack([decode_vector(encode_vector(row, encoding)) for row in matrix])
+
+    exact = normalize(queries) @ normalize(embeddings).T
+    stored, encoded_queries = encoded(embeddings), encoded(queries)
+    if encoding != "packed_bit":
+        stored, encoded_queries = normalize(stored), normalize(encoded_queries)
+
+    k = min(k, embeddings.shape[0])
+    recalls = []
+    for exact_row, query in zip(exact, encoded_queries):
+        if encoding == "packed_bit":
+            # Negative Hamming distance, which is what euclidean similarity ranks by
+            approximate_row = -np.abs(stored - query).sum(axis=1)
+        else:
+            approximate_row = stored @ query
+        expected = set(np.argsort(-exact_row)[:k])
+        found = set(np.argsort(-approximate_row)[:k])
+        recalls.append(len(expected & found) / k)
+    return float(np.mean(recalls))
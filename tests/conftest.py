@@ -0,0 +1,38 @@
+from typing import List
+
+import numpy as np
+import pytest
+
+import utils.chunk_data as chunk_data
+import utils.mongo_driver as mongo_driver
+from utils.mongomock_search import VectorSearchMongoClient
+
+
+@pytest.fixture
+def client(monkeypatch) -> VectorSearchMongoClient:
+    # Every driver created in a test talks to the same in-memory "server"
+    client = VectorSearchMongoClient()
+    monkeypatch.setattr(mongo_driver, "MongoClient", lambda *args, **kwargs: client)
+    return client
+
+
+@pytest.fixture
+def offline_chunking(monkeypatch) -> None:
+    # Count words as tokens, since tiktoken downloads its encoding on first use
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    class WordEncoder:
+        def encode(self, text: str, **kwargs) -> List[str]:
+            return text.split()
+
+    monkeypatch.setattr(chunk_data, "_encoder", WordEncoder())
+    monkeypatch.setattr(
+        chunk_data,
+        "_text_splitter",
+        RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=30),
+    )
+
+
+def fake_embed(texts: List[str]) -> np.ndarray:
+    # One distinct vector per text length, enough to tell embeddings apart
+    return np.array([[len(text), 1, 0, 0] for text in texts], dtype=np.float32)
@@ -0,0 +1,34 @@
+import mongomock
+import pytest
+
+from utils.answer_cache import AnswerCache
+
+
+@pytest.fixture
+def cache() -> AnswerCache:
+    return AnswerCache(mongomock.MongoClient()["test"]["answers"])
+
+
+def test_similar_queries_over_the_same_chunks_hit(cache):
+    cache.store("chunks", [1.0, 0.0], ["b", "a"], "answer")
+
+    # The chunk order doesn't matter, but the query must be similar enough
+    assert cache.lookup("chunks", [1.0, 0.1], ["a", "b"]) == "answer"
+    assert cache.lookup("chunks", [0.5, 1.0], ["a", "b"]) is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_other_chunks_or_sources_miss(cache):
+    cache.store("chunks", [1.0, 0.0], ["a", "b"], "answer")
+    assert cache.lookup("chunks", [1.0, 0.0], ["a"]) is None
+    assert cache.lookup("other", [1.0, 0.0], ["a", "b"]) is None
+
+
+def test_changed_chunks_invalidate_their_answers(cache):
+    cache.store("chunks", [1.0, 0.0], ["a", "b"], "first")
+    cache.store("chunks", [0.0, 1.0], ["c"], "second")
+
+    assert cache.invalidate("chunks", ["b"]) == 1
+    assert cache.lookup("chunks", [1.0, 0.0], ["a", "b"]) is None
+    assert cache.lookup("chunks", [0.0, 1.0], ["c"]) == "second"
+    assert cache.invalidate("chunks") == 1
@@ -0,0 +1,119 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Dict, List
+
+import pytest
+
+import app
+
+DOCS = [
+    {"parent_id": "doc", "chunk_index": 0, "body": "First passage."},
+    {"parent_id": "other", "chunk_index": 0, "body": "Second passage."},
+]
+
+
+@pytest.fixture
+def llm_calls(monkeypatch, offline_chunking) -> List[List[Dict]]:
+    calls: List[List[Dict]] = []
+
+    async def acreate(model: str, messages: List[Dict], stream: bool = False):
+        calls.append(messages)
+        message = SimpleNamespace(content="An answer.")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    monkeypatch.setattr(
+        app,
+        "_clients",
+        {
+            "async_fw_client": SimpleNamespace(
+                chat=SimpleNamespace(completions=SimpleNamespace(acreate=acreate))
+            )
+        },
+    )
+    return calls
+
+
+def test_generate_answer_async_answers_from_the_reranked_context(
+    llm_calls, monkeypatch
+):
+    async def vector_search_async(user_query: str, rerank: bool = False) -> List:
+        assert rerank
+        return list(DOCS)
+
+    monkeypatch.setattr(app, "vector_search_async", vector_search_async)
+    # The reranker keeps only the second passage
+    monkeypatch.setattr(
+        app,
+        "reranker",
+        SimpleNamespace(
+            rank=lambda query, documents, top_k: [{"corpus_id": 1, "score": 1.0}]
+        ),
+    )
+
+    assert asyncio.run(app.generate_answer_async("question")) == "An answer."
+    prompt = llm_calls[0][0]["content"]
+    assert "Second passage." in prompt and "First passage." not in prompt
+
+
+def test_generate_answer_3_async_looks_up_concurrently_and_stores_afterwards(
+    llm_calls, monkeypatch
+):
+    started: List[str] = []
+    stored: List[List[Dict]] = []
+    release = asyncio.Event()
+
+    async def lookup(name: str, result):
+        # Each lookup waits for the other two, so they only finish if they overlap
+        started.append(name)
+        while len(started) < 3:
+            await asyncio.sleep(0)
+        return result
+
+    monkeypatch.setattr(
+        app, "vector_search_async", lambda query: lookup("search", list(DOCS))
+    )
+    monkeypatch.setattr(
+        app,
+        "retrieve_session_history_async",
+        lambda session_id: lookup(
+            "history", [{"role": "user", "content": "Earlier question"}]
+        ),
+    )
+    monkeypatch.setattr(
+        app,
+        "retrieve_session_summary_async",
+        lambda session_id: lookup("summary", "Earlier summary"),
+    )
+
+    async def store_chat_messages_async(session_id: str, messages: List[Dict]):
+        await release.wait()
+        stored.append(messages)
+
+    monkeypatch.setattr(app, "store_chat_messages_async", store_chat_messages_async)
+
+    async def run() -> tuple:
+        # The answer is returned while the history write is still held up
+        answer = await asyncio.wait_for(app.generate_answer_3_async("s", "q"), 5)
+        stored_before = list(stored)
+        release.set()
+        await app.wait_for_background_writes()
+        return answer, stored_before
+
+    answer, stored_before = asyncio.run(run())
+
+    assert answer == "An answer."
+    assert sorted(started) == ["history", "search", "summary"]
+    messages = llm_calls[0]
+    assert "First passage." in messages[0]["content"]
+    assert "Earlier summary" in messages[0]["content"]
+    assert messages[1:] == [
+        {"role": "user", "content": "Earlier question"},
+        {"role": "user", "content": "q"},
+    ]
+    assert stored_before == []
+    assert stored == [
+        [
+            {"role": "user", "content": "q"},
+            {"role": "assistant", "content": "An answer."},
+        ]
+    ]
@@ -0,0 +1,61 @@
+from utils.context_packing import merge_chunks, pack_context, with_rerank_scores
+
+
+def test_merge_chunks_uses_offsets_to_drop_the_overlap():
+    text = "one two three four five six"
+    first = {"body": text[:13], "start": 0, "end": 13}
+    second = {"body": text[8:], "start": 8, "end": len(text)}
+    assert merge_chunks(first, second) == text
+
+
+def test_merge_chunks_finds_the_overlap_without_offsets():
+    assert merge_chunks({"body": "a b c d"}, {"body": "c d e f"}) == "a b c d e f"
+    assert merge_chunks({"body": "a b"}, {"body": "x y"}) == "a b\nx y"
+
+
+def test_pack_context_merges_adjacent_chunks(offline_chunking):
+    docs = [
+        {"parent_id": "p", "chunk_index": 1, "body": "c d e f", "score": 0.5},
+        {"parent_id": "p", "chunk_index": 0, "body": "a b c d", "score": 0.9},
+        {"parent_id": "p", "chunk_index": 3, "body": "x y", "score": 0.4},
+        {"parent_id": "q", "chunk_index": 0, "body": "other", "score": 0.7},
+    ]
+    # Runs score as well as their best chunk, and gaps start a new passage
+    assert pack_context(docs, 100) == "a b c d e f\n\nother\n\nx y"
+
+
+def test_pack_context_drops_duplicates_and_respects_the_budget(offline_chunking):
+    docs = [
+        {"body": "five words that fit here", "score": 0.9},
+        {"body": "five words that fit here", "score": 0.8},
+        {"body": "this passage is too long to fit", "score": 0.7},
+        {"body": "short one", "score": 0.1},
+    ]
+    # A lower-scored passage that still fits is kept
+    assert pack_context(docs, 8) == "five words that fit here\n\nshort one"
+
+
+def test_pack_context_splits_runs_that_do_not_fit(offline_chunking):
+    docs = [
+        {"parent_id": "p", "chunk_index": 0, "body": "a b c d e", "score": 0.9},
+        {"parent_id": "p", "chunk_index": 1, "body": "f g h i j k l m n o"},
+        {"body": "p q", "score": 0.5},
+    ]
+    # The merged run is 15 tokens, but its best chunk still fits on its own
+    assert pack_context(docs, 6) == "a b c d e"
+    assert pack_context(docs, 8) == "a b c d e\n\np q"
+
+
+def test_pack_context_uses_stored_token_counts(offline_chunking):
+    docs = [
+        {"parent_id": "p", "chunk_index": 0, "body": "a", "token_count": 9},
+        {"body": "b c", "token_count": 2, "score": 0.5},
+    ]
+    # The stored counts are trusted over re-tokenizing the text
+    assert pack_context(docs, 8) == "b c"
+
+
+def test_with_rerank_scores_replaces_the_search_scores():
+    docs = [{"body": "a", "score": 0.9}, {"body": "b", "score": 0.8}]
+    reranked = [{"corpus_id": 1, "score": 3.0, "text": "b"}]
+    assert with_rerank_scores(docs, reranked) == [{"body": "b", "score": 3.0}]
@@ -0,0 +1,72 @@
+import time
+
+import numpy as np
+
+import utils.generate_embeddings as generate_embeddings
+from utils.embedding_cache import EmbeddingCache
+
+
+def rows(*values: float) -> np.ndarray:
+    return np.array([[value] * 4 for value in values], dtype=np.float32)
+
+
+def test_cached_embeddings_are_returned_and_misses_reported(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), dimensions=4)
+    cache.put_many("model", ["a", "b"], rows(1, 2))
+
+    embeddings, missing = cache.get_many("model", ["b", "c", "a"])
+
+    assert missing == [1]
+    np.testing.assert_array_equal(embeddings, rows(2, 0, 1))
+
+
+def test_entries_are_kept_per_model(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), dimensions=4)
+    cache.put_many("model", ["a"], rows(1))
+    assert cache.get_many("model@onnx-int8", ["a"])[1] == [0]
+
+
+def test_the_cache_is_shared_through_its_directory(tmp_path):
+    EmbeddingCache(str(tmp_path), dimensions=4, max_entries=10).put_many(
+        "model", ["a"], rows(1)
+    )
+
+    # The layout of the first opener wins
+    other = EmbeddingCache(str(tmp_path), dimensions=8, max_entries=99)
+    assert (other.dimensions, other.max_entries) == (4, 10)
+    embeddings, missing = other.get_many("model", ["a"])
+    assert missing == []
+    np.testing.assert_array_equal(embeddings, rows(1))
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), dimensions=4, max_entries=2)
+    cache.put_many("model", ["a", "b"], rows(1, 2))
+    time.sleep(0.01)
+    # Reading "a" makes "b" the least recently used entry
+    cache.get_many("model", ["a"])
+    time.sleep(0.01)
+
+    cache.put_many("model", ["c"], rows(3))
+
+    embeddings, missing = cache.get_many("model", ["a", "b", "c"])
+    assert missing == [1]
+    np.testing.assert_array_equal(embeddings[[0, 2]], rows(1, 3))
+
+
+def test_embed_many_only_encodes_texts_that_are_not_cached(tmp_path, monkeypatch):
+    cache = EmbeddingCache(
+        str(tmp_path), dimensions=generate_embeddings.EMBEDDING_DIMENSIONS
+    )
+    monkeypatch.setattr(generate_embeddings, "get_embedding_cache", lambda: cache)
+    encoded = []
+
+    def encode(texts, batch_size):
+        encoded.extend(texts)
+        return np.full((len(texts), cache.dimensions), len(encoded), dtype=np.float32)
+
+    first = generate_embeddings.embed_many(["a", "b"], encode=encode)
+    second = generate_embeddings.embed_many(["b", "c", "a"], encode=encode)
+
+    assert encoded == ["a", "b", "c"]
+    np.testing.assert_array_equal(second[[0, 2]], first[[1, 0]])
@@ -0,0 +1,8 @@
+import pytest
+
+from check_import_time import MODULES, measure_import
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_heavy_dependencies_are_not_loaded_at_import_time(module):
+    assert measure_import(module)["loaded"] == []
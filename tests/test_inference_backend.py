@@ -0,0 +1,97 @@
+import os
+import sys
+import threading
+from types import ModuleType
+from typing import List
+
+import numpy as np
+import pytest
+
+from utils.inference_backend import (
+    embedding_parity,
+    export_quantized_onnx_model,
+    rerank_parity,
+)
+
+
+def test_embedding_parity_of_identical_embeddings_is_zero_drift():
+    embeddings = np.random.default_rng(0).normal(size=(10, 8))
+    parity = embedding_parity(embeddings, embeddings * 3)
+    assert parity["cosine_drift_max"] == pytest.approx(0, abs=1e-9)
+
+
+def test_embedding_parity_measures_cosine_drift():
+    reference = np.array([[1.0, 0.0], [1.0, 0.0]])
+    candidate = np.array([[1.0, 0.0], [0.0, 1.0]])
+    parity = embedding_parity(reference, candidate)
+    assert parity["cosine_drift_mean"] == pytest.approx(0.5)
+    assert parity["cosine_drift_max"] == pytest.approx(1.0)
+
+
+def test_rerank_parity_compares_top_k_orders():
+    reference = [[0.9, 0.5, 0.1], [0.9, 0.5, 0.1]]
+    candidate = [[0.8, 0.6, 0.2], [0.1, 0.6, 0.8]]
+    assert rerank_parity(reference, candidate, top_k=2) == {
+        "top_1_agreement": 0.5,
+        "top_k_order_agreement": 0.5,
+        "top_k_overlap": 0.75,
+    }
+
+
+@pytest.fixture
+def exports(monkeypatch, tmp_path) -> List[str]:
+    # Stands in for sentence-transformers, writing the files an export writes
+    exported: List[str] = []
+    barrier = threading.Barrier(2, timeout=5)
+
+    class SentenceTransformer:
+        def __init__(self, model_name: str, backend: str = "torch") -> None:
+            pass
+
+        def save(self, path: str) -> None:
+            with open(os.path.join(path, "config.json"), "w") as f:
+                f.write("{}")
+
+    def export_dynamic_quantized_onnx_model(model, quantization, path) -> None:
+        exported.append(path)
+        # Both exports are in flight before either is published
+        barrier.wait()
+        os.makedirs(os.path.join(path, "onnx"), exist_ok=True)
+        with open(
+            os.path.join(path, "onnx", f"model_qint8_{quantization}.onnx"), "w"
+        ) as f:
+            f.write("graph")
+
+    module = ModuleType("sentence_transformers")
+    module.SentenceTransformer = SentenceTransformer
+    module.export_dynamic_quantized_onnx_model = export_dynamic_quantized_onnx_model
+    monkeypatch.setitem(sys.modules, "sentence_transformers", module)
+    monkeypatch.setenv("ONNX_MODEL_DIR", str(tmp_path))
+    return exported
+
+
+def test_concurrent_exports_publish_one_complete_model(exports, tmp_path):
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(export_quantized_onnx_model("org/model"))
+        )
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    model_dir, file_name = results[0]
+    assert results == [results[0]] * 2
+    assert model_dir == os.path.join(str(tmp_path), "org/model")
+    with open(os.path.join(model_dir, file_name)) as f:
+        assert f.read() == "graph"
+    assert os.path.exists(os.path.join(model_dir, "config.json"))
+    # The temporary export directories are cleaned up
+    assert os.listdir(tmp_path / "org") == ["model"]
+
+    # Later calls load the published model without exporting again
+    export_quantized_onnx_model("org/model")
+    assert len(exports) == 2
@@ -0,0 +1,89 @@
+from typing import Dict, List
+
+import numpy as np
+import pytest
+
+import utils.ingest_pipeline as ingest_pipeline
+from utils.ingest_pipeline import IngestCheckpoint, iter_batches, run_ingest_pipeline
+
+
+def fake_chunk_documents(docs, text_field, workers=None):
+    # Two chunks per document, without the tokenizer download of the real splitter
+    for doc in docs:
+        yield [
+            {
+                "parent_id": doc["sfid"],
+                "chunk_index": i,
+                text_field: f"{doc['sfid']} {i}",
+            }
+            for i in range(2)
+        ]
+
+
+def fake_embed(texts: List[str]) -> np.ndarray:
+    return np.zeros((len(texts), 4), dtype=np.float32)
+
+
+@pytest.fixture(autouse=True)
+def no_tokenizer(monkeypatch):
+    monkeypatch.setattr(ingest_pipeline, "chunk_documents", fake_chunk_documents)
+
+
+def make_docs(n: int) -> List[Dict]:
+    return [
+        {"sfid": f"doc{i}", "title": f"Title {i}", "body": "text"} for i in range(n)
+    ]
+
+
+def test_iter_batches():
+    assert list(iter_batches(range(5), 2)) == [(0, 1), (2, 3), (4,)]
+
+
+def test_writes_every_chunk_with_a_stable_id():
+    written: Dict[str, Dict] = {}
+    count = run_ingest_pipeline(
+        make_docs(10),
+        lambda batch: written.update({chunk["_id"]: chunk for chunk in batch}),
+        embed_batch_size=4,
+        embed_fn=fake_embed,
+    )
+    assert count == 20
+    assert set(written) == {f"doc{i}:{j}" for i in range(10) for j in range(2)}
+
+
+def test_resume_after_a_crash_does_not_duplicate_chunks(tmp_path):
+    checkpoint = IngestCheckpoint(str(tmp_path / "checkpoint.json"))
+    ids: List[str] = []
+    calls = 0
+
+    def crash_on_third_batch(batch: List[Dict]) -> None:
+        nonlocal calls
+        calls += 1
+        if calls == 3:
+            # Half of the batch reaches the database before the crash
+            ids.extend(chunk["_id"] for chunk in batch[: len(batch) // 2])
+            raise RuntimeError("crash")
+        ids.extend(chunk["_id"] for chunk in batch)
+
+    docs = make_docs(10)
+    with pytest.raises(RuntimeError):
+        run_ingest_pipeline(
+            docs,
+            crash_on_third_batch,
+            checkpoint=checkpoint,
+            embed_batch_size=4,
+            embed_fn=fake_embed,
+        )
+    assert 0 < checkpoint.next_doc < 10
+
+    # The resumed run rewrites the interrupted batch under the same IDs
+    resumed = IngestCheckpoint(checkpoint.path)
+    run_ingest_pipeline(
+        docs,
+        lambda batch: ids.extend(chunk["_id"] for chunk in batch),
+        checkpoint=resumed,
+        embed_batch_size=4,
+        embed_fn=fake_embed,
+    )
+    assert set(ids) == {f"doc{i}:{j}" for i in range(10) for j in range(2)}
+    assert resumed.next_doc == 10
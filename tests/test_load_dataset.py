@@ -0,0 +1,84 @@
+import threading
+import time
+from typing import Dict, Iterator, List
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from utils.load_dataset import load_dataset, read_shards, snapshot_shards
+
+
+def shard(index: int, size: int, delay: float = 0.0):
+    def records() -> Iterator[Dict]:
+        for i in range(size):
+            if delay:
+                time.sleep(delay)
+            yield {"shard": index, "i": i}
+
+    return records
+
+
+def test_read_shards_keeps_shard_order():
+    # Later shards are shorter, so they finish reading first
+    shards = [
+        shard(index, 20 - index * 5, delay=0.001 * (3 - index)) for index in range(4)
+    ]
+    records = list(read_shards(shards, workers=2, prefetch=4))
+    assert [(r["shard"], r["i"]) for r in records] == [
+        (index, i) for index in range(4) for i in range(20 - index * 5)
+    ]
+
+
+def test_read_shards_raises_reader_errors():
+    def broken() -> Iterator[Dict]:
+        yield {"shard": 1, "i": 0}
+        raise OSError("connection reset")
+
+    records = read_shards([shard(0, 3), broken, shard(2, 3)], workers=2)
+    with pytest.raises(OSError, match="connection reset"):
+        list(records)
+
+
+def test_closing_read_shards_stops_the_readers():
+    produced: List[int] = []
+
+    def endless() -> Iterator[Dict]:
+        i = 0
+        while True:
+            produced.append(i)
+            yield {"i": i}
+            i += 1
+
+    before = threading.active_count()
+    records = read_shards([endless, endless], workers=2, prefetch=2)
+    assert next(records) == {"i": 0}
+    records.close()
+
+    # Readers give up once their queue is full and the reader is closed
+    deadline = time.monotonic() + 5
+    while threading.active_count() > before and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert threading.active_count() == before
+    count = len(produced)
+    time.sleep(0.05)
+    assert len(produced) == count
+
+
+def test_load_dataset_reads_a_snapshot_in_file_order(tmp_path):
+    for part in range(3):
+        table = pa.Table.from_pylist(
+            [{"body": f"part {part} row {row}"} for row in range(4)]
+        )
+        pq.write_table(table, tmp_path / f"part-{part:05d}.parquet")
+
+    records = list(load_dataset(limit=0, snapshot=str(tmp_path), workers=2))
+    assert [r["body"] for r in records] == [
+        f"part {part} row {row}" for part in range(3) for row in range(4)
+    ]
+    assert len(list(load_dataset(limit=5, snapshot=str(tmp_path)))) == 5
+
+
+def test_snapshot_shards_requires_matching_files(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        snapshot_shards(str(tmp_path))
@@ -0,0 +1,114 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from utils.generate_embeddings import EMBEDDING_DIMENSIONS
+from utils.local_index import LocalVectorIndex, get_field, matches_filter
+
+DOC = {
+    "body": "text",
+    "metadata": {"contentType": "Video"},
+    "updated": datetime(2024, 6, 1),
+}
+
+
+def test_get_field_resolves_dotted_paths():
+    assert get_field(DOC, "metadata.contentType") == "Video"
+    assert get_field(DOC, "metadata.missing") is None
+    assert get_field(DOC, "body.length") is None
+
+
+@pytest.mark.parametrize(
+    "filter, expected",
+    [
+        ({"metadata.contentType": "Video"}, True),
+        ({"metadata.contentType": {"$ne": "Video"}}, False),
+        ({"metadata.contentType": {"$in": ["Article", "Video"]}}, True),
+        ({"metadata.contentType": {"$nin": ["Video"]}}, False),
+        (
+            {"updated": {"$gte": datetime(2024, 1, 1), "$lt": datetime(2025, 1, 1)}},
+            True,
+        ),
+        ({"updated": {"$gt": "2024"}}, False),
+        ({"missing": {"$lt": 1}}, False),
+        ({"$or": [{"metadata.contentType": "Article"}, {"body": "text"}]}, True),
+        ({"$and": [{"metadata.contentType": "Video"}, {"body": "other"}]}, False),
+        ({"$not": {"body": "text"}}, False),
+    ],
+)
+def test_matches_filter(filter, expected):
+    assert matches_filter(DOC, filter) is expected
+
+
+def test_unsupported_operators_are_rejected():
+    with pytest.raises(ValueError):
+        matches_filter(DOC, {"updated": {"$regex": "2024"}})
+
+
+def vector(*values: float) -> list:
+    padded = np.zeros(EMBEDDING_DIMENSIONS, dtype=np.float32)
+    padded[: len(values)] = values
+    return padded.tolist()
+
+
+DOCS = [
+    {"body": "east", "embedding": vector(1, 0), "metadata": {"contentType": "Video"}},
+    {
+        "body": "north-east",
+        "embedding": vector(1, 1),
+        "metadata": {"contentType": "Article"},
+    },
+    {"body": "north", "embedding": vector(0, 1), "metadata": {"contentType": "Video"}},
+    {
+        "body": "west",
+        "embedding": vector(-1, 0),
+        "metadata": {"contentType": "Article"},
+    },
+]
+
+
+@pytest.fixture(params=["exact", "ivf"])
+def index(request, tmp_path) -> LocalVectorIndex:
+    # Probing every list makes IVF search exact, so both modes agree
+    index = LocalVectorIndex(str(tmp_path), mode=request.param, n_probe=4)
+    assert index.build("chunks", DOCS, n_lists=2) == len(DOCS)
+    return index
+
+
+def test_search_returns_the_nearest_documents_best_first(index):
+    results = index.search_vector("chunks", np.array(vector(1, 0.1)), limit=3)
+    assert [r["body"] for r in results] == ["east", "north-east", "north"]
+    assert results[0]["score"] == pytest.approx(1.0, abs=0.01)
+    assert results[0]["score"] > results[1]["score"] > results[2]["score"]
+
+
+def test_search_applies_the_filter_before_ranking(index):
+    results = index.search_vector(
+        "chunks", np.array(vector(1, 0)), {"metadata.contentType": "Article"}
+    )
+    assert [r["body"] for r in results] == ["north-east", "west"]
+    assert (
+        index.search_vector(
+            "chunks", np.array(vector(1, 0)), {"metadata.contentType": "Podcast"}
+        )
+        == []
+    )
+
+
+def test_vector_search_embeds_the_query(index):
+    index.embed_query = lambda query: vector(0, 1)
+    assert index.vector_search("chunks", "up")[0]["body"] == "north"
+
+
+def test_searches_to_rerank_return_more_candidates(index):
+    index.embed_query = lambda query: vector(1, 0)
+    index.limit, index.rerank_limit = 1, 3
+    assert len(index.vector_search("chunks", "east")) == 1
+    assert len(index.vector_search("chunks", "east", rerank=True)) == 3
+
+
+def test_empty_collections_can_be_built_and_searched(tmp_path):
+    index = LocalVectorIndex(str(tmp_path))
+    assert index.build("empty", []) == 0
+    assert index.search_vector("empty", np.array(vector(1, 0))) == []
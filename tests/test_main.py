@@ -0,0 +1,52 @@
+from typing import List, Sequence
+
+import pytest
+
+import main
+
+
+class FailingPool:
+    # Stands in for `EmbeddingPool`, failing like a crashed worker would
+    instances: List["FailingPool"] = []
+    batch_size = 4
+
+    def __init__(self, workers: int) -> None:
+        self.closed = False
+        FailingPool.instances.append(self)
+
+    def __call__(self, texts: Sequence[str]):
+        raise RuntimeError("embedding worker died")
+
+    def __enter__(self) -> "FailingPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.closed = True
+
+
+@pytest.mark.parametrize("mode", ["full", "incremental"])
+def test_embedding_pool_is_closed_when_ingestion_fails(
+    client, offline_chunking, monkeypatch, tmp_path, capsys, mode
+):
+    FailingPool.instances.clear()
+    monkeypatch.setenv("MONGODB_URI", "mongodb://test")
+    monkeypatch.setenv("EMBED_WORKERS", "2")
+    monkeypatch.setenv("INGEST_MODE", mode)
+    monkeypatch.setattr(main, "CHECKPOINT_PATH", str(tmp_path / "checkpoint.json"))
+    monkeypatch.setattr(main, "EmbeddingPool", FailingPool)
+    monkeypatch.setattr(
+        main, "load_dataset", lambda: iter([{"sfid": "doc", "body": "Some text."}])
+    )
+
+    with pytest.raises(RuntimeError, match="embedding worker died"):
+        main.main()
+
+    assert [pool.closed for pool in FailingPool.instances] == [True]
+
+
+def test_empty_dataset_exits_with_a_message(client, monkeypatch, capsys):
+    monkeypatch.setenv("MONGODB_URI", "mongodb://test")
+    monkeypatch.setattr(main, "load_dataset", lambda: iter([]))
+
+    with pytest.raises(SystemExit, match="empty"):
+        main.main()
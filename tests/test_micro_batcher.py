@@ -0,0 +1,61 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils.micro_batcher import MicroBatcher
+
+
+def test_batches_concurrent_calls_and_keeps_results_in_order():
+    batches = []
+
+    def double(items):
+        batches.append(len(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(double, max_batch_size=8, max_wait_ms=50)
+    with ThreadPoolExecutor(16) as executor:
+        results = list(executor.map(batcher, range(32)))
+    assert results == [item * 2 for item in range(32)]
+    assert max(batches) > 1
+    assert batcher.metrics()["items"] == 32
+
+
+def test_errors_reach_every_caller_of_the_batch():
+    def fail(items):
+        raise ValueError("boom")
+
+    batcher = MicroBatcher(fail, max_wait_ms=1)
+    with pytest.raises(ValueError):
+        batcher(1, timeout=5)
+    # The batcher keeps serving after a failed batch
+    with pytest.raises(ValueError):
+        batcher(2, timeout=5)
+
+
+def test_missing_results_fail_the_batch_instead_of_hanging():
+    batcher = MicroBatcher(lambda items: items[:-1], max_batch_size=2, max_wait_ms=50)
+    futures = [batcher.submit(1), batcher.submit(2)]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_a_stopped_batcher_fails_pending_and_new_items():
+    release = threading.Event()
+
+    def stop(items):
+        release.wait(5)
+        raise SystemExit
+
+    batcher = MicroBatcher(stop, max_batch_size=1, max_wait_ms=0)
+    first, second = batcher.submit(1), batcher.submit(2)
+    release.set()
+    with pytest.raises(SystemExit):
+        first.result(timeout=5)
+    batcher._thread.join(5)
+    with pytest.raises(RuntimeError):
+        second.result(timeout=5)
+    with pytest.raises(RuntimeError):
+        batcher(3, timeout=5)
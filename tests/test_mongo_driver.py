@@ -0,0 +1,169 @@
+from copy import deepcopy
+from datetime import datetime
+from typing import List
+
+import pytest
+
+import utils.mongo_driver as mongo_driver
+from conftest import fake_embed
+from utils.mongo_driver import MongoDriver, filter_fields_update
+from utils.mongomock_search import VectorSearchCollection
+
+DOCS = [
+    {
+        "sfid": f"doc{i}",
+        "title": f"Title {i}",
+        "body": f"Article number {i}. " * 60,
+        "metadata": {"contentType": "Tutorial"},
+        "updated": "2024-01-01",
+    }
+    for i in range(3)
+]
+
+
+def test_writes_in_one_process_invalidate_cached_results_in_another(client):
+    ingest, serve = MongoDriver("mongodb://test"), MongoDriver("mongodb://test")
+    serve.collection_versions.ttl = 0
+    key = serve.vector_search_cache_key("chunks", "query")
+    serve.result_cache.put(key, [{"body": "stale"}])
+
+    ingest.clear_collection("chunks")
+
+    assert serve.vector_search_cache_key("chunks", "query") != key
+    assert serve.vector_search_cache_key("other", "query")[1] == 0
+
+
+def test_cache_key_accepts_datetime_filters(client):
+    driver = MongoDriver("mongodb://test")
+    filter = {"updated": {"$gte": datetime(2024, 1, 1)}}
+    assert driver.vector_search_cache_key("chunks", "query", filter) == (
+        driver.vector_search_cache_key("chunks", "query", dict(filter))
+    )
+
+
+def test_filter_fields_update():
+    assert filter_fields_update(
+        {"metadata": {"contentType": "Video"}, "body": "text"}
+    ) == {"$set": {"metadata.contentType": "Video"}, "$unset": {"updated": ""}}
+
+
+def test_sync_data_only_embeds_changed_chunks(client, offline_chunking):
+    driver = MongoDriver("mongodb://test")
+    first = driver.sync_data("chunks", deepcopy(DOCS), embed_fn=fake_embed)
+    assert first["upserted"] > 0 and first["unchanged"] == 0
+
+    second = driver.sync_data("chunks", deepcopy(DOCS), embed_fn=fake_embed)
+    assert second == {
+        "unchanged": first["upserted"],
+        "upserted": 0,
+        "refiltered": 0,
+        "deleted": 0,
+    }
+
+
+def test_sync_data_updates_filter_fields_without_reembedding(client, offline_chunking):
+    driver = MongoDriver("mongodb://test")
+    driver.sync_data("chunks", deepcopy(DOCS), embed_fn=fake_embed)
+    chunks = client[driver.db_name]["chunks"]
+    embeddings = {d["_id"]: d["embedding"] for d in chunks.find({})}
+
+    docs = deepcopy(DOCS)
+    docs[0]["metadata"]["contentType"] = "Video"
+    embedded: List[str] = []
+    stats = driver.sync_data(
+        "chunks",
+        docs,
+        embed_fn=lambda texts: embedded.extend(texts) or fake_embed(texts),
+    )
+
+    assert embedded == []
+    assert stats["upserted"] == 0 and stats["refiltered"] > 0
+    for chunk in chunks.find({"parent_id": "doc0"}):
+        assert chunk["metadata"]["contentType"] == "Video"
+        assert chunk["embedding"] == embeddings[chunk["_id"]]
+    assert chunks.count_documents({"metadata.contentType": "Tutorial"}) == (
+        len(embeddings) - stats["refiltered"]
+    )
+
+
+def test_sync_data_deletes_documents_that_are_gone(client, offline_chunking):
+    driver = MongoDriver("mongodb://test")
+    driver.sync_data("chunks", deepcopy(DOCS), embed_fn=fake_embed)
+    chunks = client[driver.db_name]["chunks"]
+    parents = client[driver.db_name][driver.parent_collection_name]
+    removed = chunks.count_documents({"parent_id": "doc2"})
+
+    # Small batches, so the surviving documents are written in separate rounds
+    stats = driver.sync_data(
+        "chunks", deepcopy(DOCS[:2]), batch_size=1, embed_fn=fake_embed
+    )
+
+    assert stats["deleted"] == removed > 0
+    assert chunks.count_documents({"parent_id": "doc2"}) == 0
+    assert sorted(p["_id"] for p in parents.find({})) == ["doc0", "doc1"]
+    assert chunks.count_documents({}) > 0
+
+
+@pytest.fixture
+def searches(monkeypatch) -> dict:
+    # Counts the batched query embeddings and the aggregations
+    calls = {"embedded": [], "aggregated": 0}
+
+    def embed_many(texts):
+        calls["embedded"].append(list(texts))
+        return fake_embed(texts)
+
+    aggregate = VectorSearchCollection.aggregate
+
+    def counting_aggregate(self, pipeline, **kwargs):
+        calls["aggregated"] += 1
+        return aggregate(self, pipeline, **kwargs)
+
+    monkeypatch.setattr(mongo_driver, "embed_many", embed_many)
+    monkeypatch.setattr(VectorSearchCollection, "aggregate", counting_aggregate)
+    return calls
+
+
+def test_vector_search_many_searches_each_distinct_query_once(
+    client, offline_chunking, searches
+):
+    driver = MongoDriver("mongodb://test")
+    driver.sync_data("chunks", deepcopy(DOCS), embed_fn=fake_embed)
+    searches["aggregated"] = 0
+    queries = ["first", "second", "first"]
+    filters = [{"parent_id": "doc2"}, {"parent_id": "doc0"}, {"parent_id": "doc2"}]
+
+    results = driver.vector_search_many("chunks", queries, filters)
+
+    # Results follow the input order, each under its own filter
+    assert [{doc["parent_id"] for doc in docs} for docs in results] == [
+        {"doc2"},
+        {"doc0"},
+        {"doc2"},
+    ]
+    assert results[0] == results[2]
+    assert searches["embedded"] == [["first", "second"]]
+    assert searches["aggregated"] == 2
+
+
+def test_vector_search_many_shares_the_caches_of_vector_search(
+    client, offline_chunking, searches
+):
+    driver = MongoDriver("mongodb://test")
+    driver.sync_data("chunks", deepcopy(DOCS), embed_fn=fake_embed)
+    driver.embed_query = lambda query: fake_embed([query])[0].tolist()
+    cached = driver.vector_search("chunks", "cached")
+    searches["aggregated"] = 0
+
+    results = driver.vector_search_many("chunks", ["cached", "new"])
+
+    assert results[0] == cached
+    assert searches["embedded"] == [["new"]]
+    assert searches["aggregated"] == 1
+    assert driver.vector_search("chunks", "new") == results[1]
+    assert searches["aggregated"] == 1
+
+
+def test_vector_search_many_expects_one_filter_per_query(client):
+    with pytest.raises(ValueError):
+        MongoDriver("mongodb://test").vector_search_many("chunks", ["a", "b"], [None])
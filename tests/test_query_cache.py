@@ -0,0 +1,41 @@
+import time
+
+from utils.query_cache import TTLCache
+
+
+def test_get_returns_what_was_put():
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+
+def test_evicts_the_least_recently_used_entry():
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_expires_entries_after_ttl():
+    cache = TTLCache(ttl=0.01)
+    cache.put("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_invalidate_by_predicate():
+    cache = TTLCache()
+    cache.put(("docs", 1), 1)
+    cache.put(("other", 1), 2)
+    cache.invalidate(lambda key: key[0] == "docs")
+    assert cache.get(("docs", 1)) is None
+    assert cache.get(("other", 1)) == 2
+    cache.invalidate()
+    assert cache.get(("other", 1)) is None
@@ -0,0 +1,60 @@
+from typing import List
+
+import pytest
+
+from utils.rerank import Reranker
+
+DOCUMENTS = ["atlas search index", "vector search", "backup snapshot"]
+
+
+class CountingCrossEncoder:
+    # Scores a pair by the share of query words found in the passage
+    def __init__(self) -> None:
+        self.pairs: List[tuple] = []
+
+    def predict(self, pairs: List[tuple], batch_size: int = 32, **kwargs) -> list:
+        self.pairs.extend(pairs)
+        return [
+            len(set(query.split()) & set(passage.split())) / len(query.split())
+            for query, passage in pairs
+        ]
+
+
+def reranker(cache_size: int = 0) -> Reranker:
+    reranker = Reranker(cache_size=cache_size, backend="torch")
+    reranker._model = CountingCrossEncoder()
+    return reranker
+
+
+def test_rank_returns_the_top_k_best_first():
+    ranked = reranker().rank("atlas search", DOCUMENTS, top_k=2)
+    assert [(d["corpus_id"], d["text"]) for d in ranked] == [
+        (0, "atlas search index"),
+        (1, "vector search"),
+    ]
+    assert ranked[0]["score"] == pytest.approx(1.0)
+
+
+def test_rank_many_matches_rank_in_one_forward_pass():
+    model_reranker = reranker()
+    requests = [("atlas search", DOCUMENTS), ("backup", DOCUMENTS[1:])]
+
+    ranked = model_reranker.rank_many(requests, top_k=2)
+
+    assert ranked == [reranker().rank(q, docs, top_k=2) for q, docs in requests]
+    assert len(model_reranker.model.pairs) == 5
+
+
+def test_cached_scores_skip_the_cross_encoder():
+    cached = reranker(cache_size=10)
+    first = cached.rank("atlas search", DOCUMENTS)
+    assert cached.rank("atlas search", DOCUMENTS) == first
+    assert len(cached.model.pairs) == len(DOCUMENTS)
+
+
+def test_the_score_cache_is_bounded():
+    cached = reranker(cache_size=2)
+    cached.score("query", DOCUMENTS)
+    # Only the two most recent pairs are kept
+    cached.score("query", DOCUMENTS[:1])
+    assert len(cached.model.pairs) == len(DOCUMENTS) + 1
@@ -0,0 +1,65 @@
+from typing import Dict, List
+
+import pytest
+
+from utils import search_index
+from utils.search_index import (
+    vector_index_definition,
+    versioned_index_name,
+    wait_for_index,
+)
+
+
+class PolledCollection:
+    def __init__(self, statuses: List[Dict]) -> None:
+        self.statuses = statuses
+        self.polls = 0
+
+    def list_search_indexes(self, name: str) -> List[Dict]:
+        status = self.statuses[min(self.polls, len(self.statuses) - 1)]
+        self.polls += 1
+        return [{"name": name, **status}] if status else []
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(search_index.time, "sleep", lambda seconds: None)
+
+
+def test_index_name_follows_the_definition():
+    definition = vector_index_definition("float32", ["metadata.contentType"])
+    # Key order doesn't change the name
+    reordered = {"fields": [dict(reversed(f.items())) for f in definition["fields"]]}
+
+    assert versioned_index_name("vector_index", definition) == versioned_index_name(
+        "vector_index", reordered
+    )
+    assert versioned_index_name("vector_index", definition) != versioned_index_name(
+        "vector_index", vector_index_definition("float32")
+    )
+    assert versioned_index_name("vector_index", definition).startswith("vector_index_")
+
+
+def test_wait_for_index_returns_once_queryable():
+    collection = PolledCollection(
+        [{}, {"status": "BUILDING"}, {"status": "READY", "queryable": True}]
+    )
+
+    wait_for_index(collection, "vector_index_abc")
+
+    assert collection.polls == 3
+
+
+def test_wait_for_index_raises_on_failed_build():
+    with pytest.raises(RuntimeError):
+        wait_for_index(PolledCollection([{"status": "FAILED"}]), "vector_index_abc")
+
+
+def test_wait_for_index_times_out():
+    with pytest.raises(TimeoutError):
+        wait_for_index(
+            PolledCollection([{"status": "BUILDING"}]),
+            "vector_index_abc",
+            timeout=0.5,
+            initial_delay=1.0,
+        )
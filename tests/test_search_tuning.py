@@ -0,0 +1,70 @@
+from copy import deepcopy
+
+import numpy as np
+
+from conftest import fake_embed
+from test_mongo_driver import DOCS
+from utils.mongo_driver import MongoDriver
+from utils.mongomock_search import VectorSearchMongoClient
+from utils.search_tuning import (
+    DEFAULT_SEARCH_SETTINGS,
+    exact_top_k,
+    filter_shape,
+    search_settings_for,
+    tune_vector_search,
+)
+
+
+def test_exact_top_k_ranks_by_cosine_similarity():
+    embeddings = np.array([[1, 0], [0, 1], [1, 1], [-1, 0]], dtype=np.float32)
+    queries = np.array([[2, 0], [0, 3]], dtype=np.float32)
+
+    assert exact_top_k(embeddings, queries, 2).tolist() == [[0, 2], [1, 2]]
+    # k is capped at the number of stored embeddings
+    assert exact_top_k(embeddings, queries, 10).shape == (2, 4)
+
+
+def test_filter_shape_ignores_values():
+    assert filter_shape({"metadata.contentType": "Video"}) == filter_shape(
+        {"metadata.contentType": "Tutorial"}
+    )
+    assert filter_shape({"updated": {"$gte": 1}}) != filter_shape({"updated": 1})
+    assert filter_shape(None) == filter_shape({})
+
+
+def test_tuned_limit_only_applies_to_reranked_searches():
+    tuned = {"num_candidates": 200, "limit": 20}
+    assert search_settings_for(tuned, rerank=True) == tuned
+    assert search_settings_for(tuned, rerank=False) == {
+        "num_candidates": 200,
+        "limit": DEFAULT_SEARCH_SETTINGS["limit"],
+    }
+
+
+def test_vector_search_keeps_the_default_top_k_without_rerank(client, offline_chunking):
+    driver = MongoDriver("mongodb://test")
+    driver.sync_data("chunks", deepcopy(DOCS), embed_fn=fake_embed)
+    driver.embed_query = lambda query: [1.0, 1.0, 0.0, 0.0]
+    driver.save_search_settings("chunks", None, {"num_candidates": 100, "limit": 8})
+
+    assert len(driver.vector_search("chunks", "query")) == 5
+    assert len(driver.vector_search("chunks", "query", rerank=True)) == 8
+
+
+def test_tune_vector_search_reaches_full_recall_on_exact_search():
+    collection = VectorSearchMongoClient()["test"]["chunks"]
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(50, 8))
+    collection.insert_many(
+        {"_id": i, "embedding": embedding.tolist()}
+        for i, embedding in enumerate(embeddings)
+    )
+    queries = rng.normal(size=(5, 8))
+
+    result = tune_vector_search(
+        collection, "index", queries, [q.tolist() for q in queries], k=5
+    )
+
+    # The stand-in answers `$vectorSearch` exactly, so the smallest sweep wins
+    assert result["chosen"]["recall"] == 1.0
+    assert result["chosen"]["limit"] == 5
@@ -0,0 +1,56 @@
+import http.client
+import json
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import serve
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), serve.RequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(server, body) -> tuple:
+    connection = http.client.HTTPConnection(*server.server_address, timeout=5)
+    connection.request("POST", "/answer", json.dumps(body))
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def test_session_requests_use_batched_history_path(server, monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        serve,
+        "answer_with_history",
+        lambda session_id, query: calls.append((session_id, query)) or "answer",
+    )
+
+    assert post(server, {"query": "q", "session_id": "s"}) == (
+        200,
+        {"answer": "answer"},
+    )
+    assert calls == [("s", "q")]
+
+
+def test_unexpected_errors_return_500(server, monkeypatch):
+    def fail(user_query):
+        raise RuntimeError("LLM is down")
+
+    monkeypatch.setattr(serve, "answer", fail)
+    monkeypatch.setattr(serve.RequestHandler, "log_message", lambda *args: None)
+
+    status, body = post(server, {"query": "q"})
+    assert status == 500
+    assert "error" in body
+
+
+def test_malformed_requests_return_400(server):
+    assert post(server, ["not", "an", "object"])[0] == 400
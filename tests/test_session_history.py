@@ -0,0 +1,110 @@
+import threading
+from types import SimpleNamespace
+from typing import Dict, List
+
+import pytest
+
+import app
+from utils.mongomock_search import VectorSearchMongoClient
+
+
+def echo(model: str, messages: List[Dict], **kwargs) -> SimpleNamespace:
+    # Answers with the prompt, so the summary holds every folded message
+    message = SimpleNamespace(content=messages[-1]["content"])
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+@pytest.fixture
+def session(monkeypatch, offline_chunking) -> None:
+    driver = SimpleNamespace(client=VectorSearchMongoClient(), db_name="test")
+    clients = {
+        "mongodb_driver": driver,
+        "fw_client": SimpleNamespace(
+            chat=SimpleNamespace(completions=SimpleNamespace(create=echo))
+        ),
+        "search_backend": SimpleNamespace(vector_search=lambda *args, **kwargs: []),
+    }
+    monkeypatch.setattr(app, "_clients", clients)
+
+
+def add_turns(session_id: str, turns: int, words: int = 1) -> None:
+    # One insert, since the messages of separate inserts within the same
+    # millisecond could sort out of order
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"question {i} " + "x " * words})
+        messages.append({"role": "assistant", "content": f"answer {i} " + "y " * words})
+    app.store_chat_messages(session_id, messages)
+
+
+def test_nothing_is_summarized_while_every_message_is_sent(session):
+    add_turns("s", app.HISTORY_MAX_MESSAGES // 2)
+
+    app.roll_up_in_background("s").result(timeout=5)
+
+    assert app.retrieve_session_summary("s") is None
+    assert len(app.retrieve_session_history("s")) == app.HISTORY_MAX_MESSAGES
+
+
+def test_messages_outside_the_window_are_summarized(session):
+    add_turns("s", app.HISTORY_MAX_MESSAGES // 2 + 1)
+
+    app.roll_up_in_background("s").result(timeout=5)
+
+    assert "question 0" in app.retrieve_session_summary("s")
+    history = app.retrieve_session_history("s")
+    assert len(history) == app.HISTORY_MAX_MESSAGES - app.SUMMARY_BATCH_MESSAGES
+    assert history[-1]["content"].startswith("answer 10")
+
+
+def test_messages_outside_the_token_budget_are_summarized(session, monkeypatch):
+    monkeypatch.setattr(app, "HISTORY_TOKEN_BUDGET", 100)
+    # Each message is about 40 words, so only two of the four fit the budget
+    add_turns("s", 2, words=40)
+    assert len(app.retrieve_session_history("s", token_budget=100)) == 2
+
+    app.roll_up_in_background("s").result(timeout=5)
+
+    summary = app.retrieve_session_summary("s")
+    assert "question 0" in summary and "answer 0" in summary
+    # Every message is either summarized or still sent
+    history = app.retrieve_session_history("s", token_budget=100)
+    assert [m["content"].split()[:2] for m in history] == [
+        ["question", "1"],
+        ["answer", "1"],
+    ]
+
+
+def test_answering_does_not_wait_for_the_roll_up(session, monkeypatch, capsys):
+    release = threading.Event()
+    released = []
+    monkeypatch.setattr(
+        app,
+        "roll_up_session_history",
+        lambda session_id: released.append(release.wait(5)),
+    )
+
+    assert app.generate_answer_3("s", "question") == "question"
+    assert len(app.retrieve_session_history("s")) == 2
+    release.set()
+    # Roll-ups run one at a time, so this waits for the one scheduled above
+    app._roll_up_executor.submit(lambda: None).result(timeout=5)
+    assert released == [True]
+
+
+def test_answer_with_history_answers_from_the_retrieved_context(session):
+    prompts = []
+    create = app._clients["fw_client"].chat.completions.create
+    app._clients["fw_client"].chat.completions.create = lambda model, messages: (
+        prompts.append(messages) or create(model, messages)
+    )
+    retrieved = [{"parent_id": "doc", "chunk_index": 0, "body": "Passage."}]
+
+    answer = app.answer_with_history("s", "question", lambda query: retrieved)
+
+    assert answer == "question"
+    assert "Passage." in prompts[0][0]["content"]
+    assert [m["content"] for m in app.retrieve_session_history("s")] == [
+        "question",
+        answer,
+    ]
@@ -0,0 +1,73 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Dict, List
+
+import pytest
+
+import app
+
+DOCS = [
+    {"parent_id": "doc", "chunk_index": i, "body": f"Passage {i}."} for i in range(3)
+]
+
+
+class DictAnswerCache:
+    def __init__(self) -> None:
+        self.answers: Dict[tuple, str] = {}
+
+    def lookup(self, source: str, query_embedding: List[float], chunk_ids) -> str:
+        return self.answers.get((source, tuple(chunk_ids)))
+
+    def store(self, source: str, query_embedding, chunk_ids, answer: str) -> None:
+        self.answers[(source, tuple(chunk_ids))] = answer
+
+
+@pytest.fixture
+def llm_calls(monkeypatch, offline_chunking) -> List[List[Dict]]:
+    calls: List[List[Dict]] = []
+
+    async def deltas(words: List[str]):
+        for word in words:
+            yield word
+
+    def acreate(model: str, messages: List[Dict], stream: bool = False, **kwargs):
+        calls.append(messages)
+        return deltas(["An ", "answer."])
+
+    clients = {
+        "mongodb_driver": SimpleNamespace(
+            answer_cache=DictAnswerCache(), get_query_embedding=lambda q: [1.0]
+        ),
+        "async_fw_client": SimpleNamespace(
+            chat=SimpleNamespace(completions=SimpleNamespace(acreate=acreate))
+        ),
+        "search_backend": SimpleNamespace(
+            vector_search=lambda *args, **kwargs: list(DOCS)
+        ),
+    }
+    monkeypatch.setattr(app, "_clients", clients)
+    monkeypatch.setattr(
+        app,
+        "reranker",
+        SimpleNamespace(
+            rank=lambda query, documents, top_k: [
+                {"corpus_id": i, "score": 1.0} for i in range(len(documents))
+            ]
+        ),
+    )
+    return calls
+
+
+async def collect(user_query: str) -> str:
+    stream = await app.stream_answer_async(user_query)
+    answer = "".join([delta async for delta in stream])
+    await app.wait_for_background_writes()
+    return answer
+
+
+def test_async_stream_without_session_uses_the_answer_cache(llm_calls):
+    async def run() -> List[str]:
+        return [await collect("question"), await collect("question")]
+
+    assert asyncio.run(run()) == ["An answer.", "An answer."]
+    assert len(llm_calls) == 1
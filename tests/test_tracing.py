@@ -0,0 +1,67 @@
+import threading
+
+import numpy as np
+import pytest
+
+import utils.generate_embeddings as generate_embeddings
+from utils.micro_batcher import MicroBatcher
+from utils.tracing import InMemorySink, Tracer, tracer, with_current_context
+
+
+@pytest.fixture
+def sink(monkeypatch) -> InMemorySink:
+    sink = InMemorySink()
+    monkeypatch.setattr(tracer, "sink", sink)
+    return sink
+
+
+def spans_by_name(sink: InMemorySink) -> dict:
+    return {span["name"]: span for span in sink.spans}
+
+
+def test_nested_spans_share_a_trace(sink):
+    with tracer.span("request") as request:
+        with tracer.span("stage", batch_size=3):
+            pass
+
+    spans = spans_by_name(sink)
+    assert spans["stage"]["parent_id"] == request.span_id
+    assert spans["stage"]["trace_id"] == request.trace_id
+    assert spans["stage"]["attributes"] == {"batch_size": 3}
+    assert spans["request"]["parent_id"] is None
+
+
+def test_spans_on_other_threads_join_the_callers_trace(sink):
+    def work() -> None:
+        with tracer.span("worker"):
+            pass
+
+    with tracer.span("request") as request:
+        thread = threading.Thread(target=with_current_context(work))
+        thread.start()
+        thread.join()
+
+    assert spans_by_name(sink)["worker"]["parent_id"] == request.span_id
+
+
+def test_micro_batches_join_the_first_submitters_trace(sink, monkeypatch):
+    monkeypatch.setattr(generate_embeddings, "get_embedding_cache", lambda: None)
+    batcher = MicroBatcher(
+        lambda texts: list(
+            generate_embeddings.embed_many(
+                texts, encode=lambda texts, _: np.zeros((len(texts), 4))
+            )
+        ),
+        max_wait_ms=1,
+    )
+    with tracer.span("request") as request:
+        batcher("text")
+
+    span = spans_by_name(sink)["embed_many"]
+    assert span["parent_id"] == request.span_id
+    assert span["attributes"]["batch_size"] == 1
+
+
+def test_disabled_tracer_records_nothing():
+    with Tracer().span("stage") as span:
+        assert not span.recording
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from bson import BSON
+
+from utils.vector_encoding import (
+    VECTOR_ENCODINGS,
+    decode_vector,
+    encode_vector,
+    measure_recall,
+    quantize_int8,
+)
+
+VECTOR = np.random.default_rng(0).normal(size=384).astype(np.float32)
+
+
+def cosine(a: np.ndarray, b: np.ndarray) -> float:
+    return float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+@pytest.mark.parametrize("encoding", ["float64", "float32"])
+def test_float_encodings_round_trip_exactly(encoding):
+    np.testing.assert_array_equal(
+        decode_vector(encode_vector(VECTOR, encoding)), VECTOR
+    )
+
+
+def test_int8_keeps_the_direction():
+    decoded = decode_vector(encode_vector(VECTOR, "int8"))
+    assert decoded.shape == VECTOR.shape
+    assert cosine(decoded, VECTOR) > 0.999
+    assert np.abs(quantize_int8(VECTOR)).max() == 127
+
+
+def test_packed_bit_keeps_the_signs():
+    decoded = decode_vector(encode_vector(VECTOR, "packed_bit"))
+    np.testing.assert_array_equal(decoded, np.where(VECTOR > 0, 1, -1))
+
+
+def test_packed_bit_drops_the_padding_of_partial_bytes():
+    vector = np.array([1, -1, 1], dtype=np.float32)
+    np.testing.assert_array_equal(
+        decode_vector(encode_vector(vector, "packed_bit")), vector
+    )
+
+
+@pytest.mark.parametrize("encoding", VECTOR_ENCODINGS)
+def test_encoded_vectors_survive_bson(encoding):
+    encoded = encode_vector(VECTOR, encoding)
+    stored = BSON.encode({"embedding": encoded}).decode()["embedding"]
+    np.testing.assert_array_equal(decode_vector(stored), decode_vector(encoded))
+
+
+def test_unknown_encoding_is_rejected():
+    with pytest.raises(ValueError):
+        encode_vector(VECTOR, "float16")
+
+
+def test_measure_recall_is_perfect_for_lossless_encodings():
+    rng = np.random.default_rng(1)
+    embeddings, queries = rng.normal(size=(100, 16)), rng.normal(size=(10, 16))
+    assert measure_recall(embeddings, queries, "float32") == 1.0
+    assert 0.0 < measure_recall(embeddings, queries, "packed_bit") <= 1.0